@@ -2,17 +2,16 @@ from django.contrib import admin
 from .models import Commission, Wallet, WalletTransaction
 from django.utils import timezone
 from django.contrib import messages
+from .services import bulk_approve_commissions
 
 @admin.action(description="Approve selected commissions and credit wallets")
 def approve_commissions(modeladmin, request, queryset):
-    count = 0
-    for comm in queryset:
-        if comm.status == Commission.STATUS_PENDING:
-            try:
-                comm.approve(approver=request.user)
-                count += 1
-            except Exception as e:
-                modeladmin.message_user(request, f"Failed to approve commission {comm.id}: {e}", level=messages.ERROR)
+    # set-based: one status UPDATE, bulk wallet transactions and one balance increment per wallet
+    try:
+        count = bulk_approve_commissions(queryset, approver=request.user)
+    except Exception as e:
+        modeladmin.message_user(request, f"Failed to approve commissions: {e}", level=messages.ERROR)
+        return
     modeladmin.message_user(request, f"{count} commissions approved and wallets credited", level=messages.SUCCESS)
 
 @admin.register(Commission)
@@ -0,0 +1,69 @@
+import threading
+import time
+import uuid
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from commissions.models import Wallet, WalletTransaction
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ("Benchmark concurrent wallet credits: fire many credits at a single wallet from several threads, "
+            "then verify no update was lost and report credits/sec.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--credits', type=int, default=5000, help='Number of credits to apply (default 5000).')
+        parser.add_argument('--threads', type=int, default=16, help='Parallel workers (default 16).')
+        parser.add_argument('--amount', default='0.01', help='Amount per credit (default 0.01).')
+        parser.add_argument('--cleanup', action='store_true', help='Delete the benchmark user and wallet afterwards.')
+
+    def handle(self, *args, **options):
+        run = uuid.uuid4().hex[:6]
+        # no MLM node: the benchmark user stays out of the live tree
+        user = User(username=f'bench-wallet-{run}')
+        user._mlm_skip_signup = True
+        user.save()
+        wallet, _ = Wallet.objects.get_or_create(user=user)
+        total, workers = options['credits'], max(1, options['threads'])
+        amount = Decimal(options['amount'])
+        errors = []
+
+        def credit(worker):
+            try:
+                # every worker holds its own stale copy of the wallet, like concurrent approvals would
+                mine = Wallet.objects.get(pk=wallet.pk)
+                for _ in range(worker, total, workers):
+                    mine.credit(amount, note=f"bench {run}")
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=credit, args=(w,)) for w in range(workers)]
+        started = time.monotonic()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.monotonic() - started
+
+        wallet.refresh_from_db()
+        applied = WalletTransaction.objects.filter(wallet=wallet).count()
+        expected = amount * applied
+        self.stdout.write(f"{applied} credits by {workers} threads in {elapsed:.2f}s "
+                          f"({applied / elapsed if elapsed else 0:.1f} credits/sec)")
+        self.stdout.write(f"balance={wallet.balance} expected={expected} worker errors={len(errors)}")
+        for e in errors[:5]:
+            self.stdout.write(self.style.WARNING(f"  {type(e).__name__}: {e}"))
+
+        if options['cleanup']:
+            user.delete()
+
+        if wallet.balance != expected:
+            raise CommandError("Lost wallet updates: balance doesn't match the credit transactions.")
+        if applied != total:
+            raise CommandError(f"Only {applied} of {total} credits were applied.")
+        self.stdout.write(self.style.SUCCESS("No lost updates."))
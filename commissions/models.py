@@ -1,4 +1,5 @@
 from django.db import models, transaction
+from django.db.models import F
 from django.conf import settings
 from django.utils import timezone
 from django.core.validators import MinValueValidator
@@ -17,7 +18,9 @@ class Wallet(models.Model):
     def credit(self, amount, note=None, commission=None):
         """
         Add a credit transaction and increase balance.
+        The balance is incremented in SQL (F expression), so concurrent credits never lose updates.
         """
+        amount = Decimal(str(amount))
         if amount <= 0:
             raise ValueError("credit amount must be positive")
         with transaction.atomic():
@@ -28,26 +31,28 @@ class Wallet(models.Model):
                 note=note or "Commission credit",
                 related_commission=commission
             )
-            self.balance = (self.balance or Decimal('0.00')) + Decimal(amount)
-            self.save(update_fields=['balance'])
+            Wallet.objects.filter(pk=self.pk).update(balance=F('balance') + amount)
+        self.refresh_from_db(fields=['balance'])
 
     def debit(self, amount, note=None):
         """
         Subtract amount from wallet and create debit transaction.
+        The balance check and the decrement are one conditional UPDATE: an overdraft matches no
+        row and raises ValueError, even when other debits race for the same balance.
         """
+        amount = Decimal(str(amount))
         if amount <= 0:
             raise ValueError("debit amount must be positive")
-        if (self.balance or Decimal('0.00')) < Decimal(amount):
-            raise ValueError("insufficient balance")
         with transaction.atomic():
+            if not Wallet.objects.filter(pk=self.pk, balance__gte=amount).update(balance=F('balance') - amount):
+                raise ValueError("insufficient balance")
             WalletTransaction.objects.create(
                 wallet=self,
                 amount=amount,
                 tx_type=WalletTransaction.TX_DEBIT,
                 note=note or "Payout"
             )
-            self.balance = self.balance - Decimal(amount)
-            self.save(update_fields=['balance'])
+        self.refresh_from_db(fields=['balance'])
 
 
 class WalletTransaction(models.Model):
@@ -1,10 +1,12 @@
 # commissions/services.py
 from decimal import Decimal
 from django.db import transaction
+from django.db.models import F
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 
-from .models import Commission
+from .models import Commission, Wallet, WalletTransaction
 try:
     from mlm.models import MLMNode
 except Exception:
@@ -15,13 +17,52 @@ User = get_user_model()
 DIRECT_RATE = getattr(settings, 'COMMISSION_DIRECT_RATE', 0.10)
 BINARY_RATE = getattr(settings, 'COMMISSION_BINARY_RATE', 0.05)
 AUTO_APPROVE = getattr(settings, 'AUTO_APPROVE_COMMISSIONS', False)
+# rate per upline level, nearest ancestor first (default: single-level match at BINARY_RATE)
+UPLINE_RATES = getattr(settings, 'COMMISSION_UPLINE_RATES', None) or [BINARY_RATE]
+
+
+def upline_source(level):
+    # level 1 keeps the historical 'binary_match' source so existing reports still add up
+    return 'binary_match' if level == 1 else f'upline_level_{level}'
+
+
+def distribute_upline_commissions(node, amount, sale_reference=None, rates=None):
+    """
+    Unilevel payout of a sale made by `node`: the ancestor `k` levels up earns rates[k-1] * amount.
+    All ancestors (with their users) are resolved in one query from the lineage path and
+    the commissions are written with one bulk_create. Returns the created Commission objects.
+    """
+    amount = Decimal(str(amount))
+    rates = [Decimal(str(rate)) for rate in (rates if rates is not None else UPLINE_RATES)]
+    commissions = [
+        Commission(
+            telemarketer_id=ancestor.user_id,
+            amount=(rate * amount).quantize(Decimal('0.01')),
+            source=upline_source(level),
+            sale_reference=sale_reference,
+        )
+        for level, (ancestor, rate) in enumerate(zip(node.get_upline(len(rates)), rates), start=1)
+        if ancestor.user_id and rate > 0
+    ]
+    Commission.objects.bulk_create(commissions)
+    if commissions and commissions[0].pk is None:
+        # no RETURNING (MySQL): read the pks back in one query. The created_at stamps bulk_create
+        # set on each object tell this batch apart from earlier rows with the same (or no) reference.
+        stamps = [comm.created_at for comm in commissions]
+        ids = {(user_id, source, created_at): pk for user_id, source, created_at, pk in Commission.objects.filter(
+            sale_reference=sale_reference, telemarketer_id__in=[comm.telemarketer_id for comm in commissions],
+            created_at__range=(min(stamps), max(stamps)),
+        ).order_by().values_list('telemarketer_id', 'source', 'created_at', 'pk')}
+        for comm in commissions:
+            comm.pk = ids.get((comm.telemarketer_id, comm.source, comm.created_at))
+    return commissions
 
 
 def create_commissions_for_sale(amount, telemarketer, sale_reference=None):
     """
     Shared logic to create commissions for a sale.
     - Direct commission to telemarketer
-    - Optional binary match to upline (via MLMNode)
+    - Upline commissions per COMMISSION_UPLINE_RATES (via MLMNode, see distribute_upline_commissions)
     - Optional auto-approve -> credits wallets
     """
     amount = Decimal(str(amount))
@@ -38,26 +79,64 @@ def create_commissions_for_sale(amount, telemarketer, sale_reference=None):
         )
         created.append(direct_comm)
 
-        # binary match
+        # upline commissions
         if MLMNode:
             try:
                 node = MLMNode.objects.get(user=telemarketer)
-                parent = node.parent
-                if parent and parent.user:
-                    match_amount = (Decimal(BINARY_RATE) * amount).quantize(Decimal('0.01'))
-                    match_comm = Commission.objects.create(
-                        telemarketer=parent.user,
-                        amount=match_amount,
-                        source='binary_match',
-                        sale_reference=sale_reference,
-                    )
-                    created.append(match_comm)
+                # feed the sale into the seller's personal volume and the upline leg volumes
+                MLMNode.add_sale_volume(node.pk, amount)
+                created.extend(distribute_upline_commissions(node, amount, sale_reference=sale_reference))
             except MLMNode.DoesNotExist:
                 pass
 
-        # auto-approve
-        if AUTO_APPROVE and sale_reference:
-            for comm in Commission.objects.filter(sale_reference=sale_reference):
-                comm.approve(approver=None)
+        # auto-approve what this sale created (with or without a sale_reference)
+        if AUTO_APPROVE:
+            bulk_approve_commissions(Commission.objects.filter(pk__in=[comm.pk for comm in created]))
 
     return created
+
+
+def bulk_approve_commissions(queryset, approver=None, batch_size=2000):
+    """
+    Approve the pending commissions of `queryset` and credit their wallets, set-based, in one
+    transaction: the pending rows are locked and flipped with one UPDATE, the credit
+    WalletTransactions go in with bulk_create and every wallet gets one aggregated
+    F('balance') increment. Missing wallets are created. Approved/paid commissions are
+    skipped, so it is idempotent like Commission.approve(). Returns the number approved.
+    """
+    with transaction.atomic():
+        # re-selected by pk: the caller's queryset may carry DISTINCT/joins that FOR UPDATE rejects
+        pending = list(Commission.objects.filter(pk__in=queryset.values('pk'), status=Commission.STATUS_PENDING)
+                       .select_for_update().order_by()
+                       .values_list('pk', 'telemarketer_id', 'amount', 'sale_reference'))
+        if not pending:
+            return 0
+        Commission.objects.filter(pk__in=[pk for pk, _, _, _ in pending]).update(
+            status=Commission.STATUS_APPROVED, approved_at=timezone.now(), approved_by=approver)
+
+        user_ids = {user_id for _, user_id, _, _ in pending}
+        wallets = dict(Wallet.objects.filter(user_id__in=user_ids).values_list('user_id', 'pk'))
+        if len(wallets) < len(user_ids):
+            Wallet.objects.bulk_create([Wallet(user_id=user_id) for user_id in user_ids - set(wallets)],
+                                       ignore_conflicts=True)
+            # read the pks back (MySQL doesn't return them, and ignore_conflicts never does)
+            wallets = dict(Wallet.objects.filter(user_id__in=user_ids).values_list('user_id', 'pk'))
+
+        totals = {}
+        transactions = []
+        for pk, user_id, amount, sale_reference in pending:
+            wallet_id = wallets[user_id]
+            totals[wallet_id] = totals.get(wallet_id, Decimal('0.00')) + amount
+            transactions.append(WalletTransaction(
+                wallet_id=wallet_id,
+                amount=amount,
+                tx_type=WalletTransaction.TX_CREDIT,
+                note=f"Approved commission (sale {sale_reference})",
+                related_commission_id=pk,
+            ))
+        WalletTransaction.objects.bulk_create(transactions, batch_size=batch_size)
+        Wallet.objects.bulk_update(
+            [Wallet(pk=wallet_id, balance=F('balance') + total) for wallet_id, total in totals.items()],
+            ['balance'], batch_size=batch_size,
+        )
+    return len(pending)
@@ -33,3 +33,112 @@ class CommissionFlowTests(TestCase):
         # transaction created and balance updated
         self.assertTrue(WalletTransaction.objects.filter(wallet=wallet, related_commission=comm).exists())
         self.assertEqual(wallet.balance, Decimal('10.00'))
+
+
+class UplineCommissionTests(TestCase):
+    def setUp(self):
+        # signups are auto-placed: u0 is the root, u1/u2 its children, u3 below u1, ...
+        self.users = [User.objects.create_user(username=f'up{i}', password='pass') for i in range(8)]
+
+    def test_rate_plan_pays_each_level_in_two_queries(self):
+        from mlm.models import MLMNode
+        from .services import distribute_upline_commissions
+        seller = MLMNode.objects.get(user=self.users[7])
+        upline = seller.get_upline()
+        with self.assertNumQueries(2):
+            created = distribute_upline_commissions(seller, Decimal('200.00'), sale_reference='UL-1',
+                                                    rates=[0.10, 0.05, 0.03, 0.02, 0.01])
+        self.assertEqual(len(created), len(upline))
+        self.assertEqual([(c.telemarketer_id, c.amount, c.source) for c in created], [
+            (upline[0].user_id, Decimal('20.00'), 'binary_match'),
+            (upline[1].user_id, Decimal('10.00'), 'upline_level_2'),
+            (upline[2].user_id, Decimal('6.00'), 'upline_level_3'),
+        ])
+        self.assertEqual(Commission.objects.filter(sale_reference='UL-1').count(), 3)
+
+    def test_record_sale_api_pays_upline(self):
+        resp = self.client.post(reverse('commissions:api_record_sale'),
+                                data={'amount': '100.00', 'telemarketer_id': self.users[3].id, 'sale_reference': 'UL-2'},
+                                content_type='application/json')
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual([c['source'] for c in resp.json()['created']], ['direct_sale', 'binary_match'])
+
+
+    def test_pks_are_set_without_returning(self):
+        from unittest import mock
+        from django.db import connection
+        from mlm.models import MLMNode
+        from .services import distribute_upline_commissions
+        seller = MLMNode.objects.get(user=self.users[7])
+        with mock.patch.object(type(connection.features), 'can_return_rows_from_bulk_insert', False):
+            with self.assertNumQueries(3):  # upline, bulk insert, pk read-back
+                first = distribute_upline_commissions(seller, Decimal('100.00'), rates=[0.10, 0.05])
+            again = distribute_upline_commissions(seller, Decimal('50.00'), rates=[0.10, 0.05])
+        for comm in first + again:
+            self.assertEqual(Commission.objects.get(pk=comm.pk).amount, comm.amount)
+
+    def test_auto_approve_without_sale_reference(self):
+        from unittest import mock
+        with mock.patch('commissions.services.AUTO_APPROVE', True):
+            resp = self.client.post(reverse('commissions:api_record_sale'),
+                                    data={'amount': '100.00', 'telemarketer_id': self.users[3].id},
+                                    content_type='application/json')
+        self.assertEqual(resp.status_code, 201)
+        ids = [c['id'] for c in resp.json()['created']]
+        self.assertEqual(Commission.objects.filter(pk__in=ids, status=Commission.STATUS_APPROVED).count(), 2)
+        self.assertEqual(Wallet.objects.get(user=self.users[3]).balance, Decimal('10.00'))
+
+
+class WalletAtomicUpdateTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='holder', password='pass')
+        self.wallet = Wallet.objects.create(user=self.user)
+
+    def test_stale_copies_do_not_lose_credits(self):
+        other = Wallet.objects.get(pk=self.wallet.pk)
+        self.wallet.credit(Decimal('10.00'))
+        other.credit(Decimal('5.00'))  # other still thinks the balance is 0
+        self.assertEqual(other.balance, Decimal('15.00'))
+        self.assertEqual(Wallet.objects.get(pk=self.wallet.pk).balance, Decimal('15.00'))
+
+    def test_debit_rejects_overdraft_in_sql(self):
+        self.wallet.credit(Decimal('10.00'))
+        other = Wallet.objects.get(pk=self.wallet.pk)
+        self.wallet.debit(Decimal('8.00'))
+        with self.assertRaises(ValueError):
+            other.debit(Decimal('8.00'))  # other's copy still shows 10.00
+        self.assertEqual(Wallet.objects.get(pk=self.wallet.pk).balance, Decimal('2.00'))
+        self.assertEqual(WalletTransaction.objects.filter(wallet=self.wallet, tx_type=WalletTransaction.TX_DEBIT).count(), 1)
+
+
+class BulkApprovalTests(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user(username='boss', password='pass', is_staff=True)
+        self.users = [User.objects.create_user(username=f'seller{i}', password='pass') for i in range(3)]
+        Wallet.objects.create(user=self.users[0], balance=Decimal('1.00'))
+        for user, amount in ((self.users[0], '10.00'), (self.users[0], '5.50'), (self.users[1], '2.25')):
+            Commission.objects.create(telemarketer=user, amount=Decimal(amount), source='direct_sale', sale_reference='M-1')
+        Commission.objects.create(telemarketer=self.users[2], amount=Decimal('7.00'), source='direct_sale',
+                                  status=Commission.STATUS_APPROVED)
+
+    def test_bulk_approve_credits_each_wallet_once(self):
+        from .services import bulk_approve_commissions
+        self.assertEqual(bulk_approve_commissions(Commission.objects.all(), approver=self.staff), 3)
+        self.assertEqual(Wallet.objects.get(user=self.users[0]).balance, Decimal('16.50'))
+        self.assertEqual(Wallet.objects.get(user=self.users[1]).balance, Decimal('2.25'))  # created on the fly
+        self.assertFalse(Wallet.objects.filter(user=self.users[2]).exists())  # was already approved
+        self.assertEqual(WalletTransaction.objects.filter(tx_type=WalletTransaction.TX_CREDIT).count(), 3)
+        self.assertFalse(Commission.objects.filter(status=Commission.STATUS_PENDING).exists())
+        self.assertEqual(Commission.objects.filter(approved_by=self.staff).count(), 3)
+
+        # idempotent
+        self.assertEqual(bulk_approve_commissions(Commission.objects.all()), 0)
+        self.assertEqual(Wallet.objects.get(user=self.users[0]).balance, Decimal('16.50'))
+
+    def test_admin_action_uses_bulk_approval(self):
+        self.client.force_login(User.objects.create_superuser(username='root', password='pass', email='r@example.com'))
+        ids = list(Commission.objects.values_list('pk', flat=True))
+        resp = self.client.post(reverse('admin:commissions_commission_changelist'),
+                                {'action': 'approve_commissions', '_selected_action': ids})
+        self.assertEqual(resp.status_code, 302)
+        self.assertEqual(Wallet.objects.get(user=self.users[0]).balance, Decimal('16.50'))
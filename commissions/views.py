@@ -1,6 +1,4 @@
 from decimal import Decimal
-from django.conf import settings
-from django.db import transaction
 from django.shortcuts import render, get_object_or_404
 from django.contrib.auth import get_user_model
 from django.contrib.admin.views.decorators import staff_member_required
@@ -11,19 +9,9 @@ from rest_framework import status
 from django.core.exceptions import ObjectDoesNotExist
 
 from .models import Commission, Wallet, WalletTransaction
+from .services import create_commissions_for_sale
 User = get_user_model()
 
-# Attempt to import MLMNode for binary placement (if available)
-try:
-    from mlm.models import MLMNode
-except Exception:
-    MLMNode = None
-
-# settings defaults
-DIRECT_RATE = getattr(settings, 'COMMISSION_DIRECT_RATE', 0.10)  # 10% default
-BINARY_RATE = getattr(settings, 'COMMISSION_BINARY_RATE', 0.05)  # 5% up-line matching
-AUTO_APPROVE = getattr(settings, 'AUTO_APPROVE_COMMISSIONS', False)
-
 
 @api_view(['POST'])
 @permission_classes([AllowAny])  # If you want authentication, change accordingly
@@ -61,42 +49,10 @@ def api_record_sale(request):
     except User.DoesNotExist:
         return Response({"detail": "Telemarketer not found"}, status=status.HTTP_404_NOT_FOUND)
 
-    created = []
-    with transaction.atomic():
-        # calculate direct commission
-        direct_amount = (Decimal(DIRECT_RATE) * amount).quantize(Decimal('0.01'))
-        direct_comm = Commission.objects.create(
-            telemarketer=tele,
-            amount=direct_amount,
-            source='direct_sale',
-            sale_reference=sale_reference
-        )
-        created.append({'id': direct_comm.id, 'telemarketer': tele.id, 'amount': str(direct_comm.amount), 'source': direct_comm.source})
-
-        # binary matching: if mlm is present and tele has a node with parent, give matching to parent
-        if MLMNode:
-            try:
-                node = MLMNode.objects.get(user=tele)
-                parent = node.parent
-                if parent and parent.user:
-                    # matching commission to upline telemarketer if they exist
-                    match_amount = (Decimal(BINARY_RATE) * amount).quantize(Decimal('0.01'))
-                    match_comm = Commission.objects.create(
-                        telemarketer=parent.user,
-                        amount=match_amount,
-                        source='binary_match',
-                        sale_reference=sale_reference
-                    )
-                    created.append({'id': match_comm.id, 'telemarketer': parent.user.id, 'amount': str(match_comm.amount), 'source': match_comm.source})
-            except MLMNode.DoesNotExist:
-                pass
-
-        # auto-approve if configured
-        if AUTO_APPROVE:
-            for comm_id in Commission.objects.filter(sale_reference=sale_reference).values_list('id', flat=True):
-                comm = Commission.objects.get(pk=comm_id)
-                comm.approve(approver=None)
-
+    created = [
+        {'id': comm.id, 'telemarketer': comm.telemarketer_id, 'amount': str(comm.amount), 'source': comm.source}
+        for comm in create_commissions_for_sale(amount, tele, sale_reference=sale_reference)
+    ]
     return Response({'created': created}, status=status.HTTP_201_CREATED)
 
 
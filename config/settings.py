@@ -225,6 +225,7 @@ REFERRAL_SHARED_SECRET = 'change-this-to-a-strong-secret'  # replace in producti
 # Commission engine configuration
 COMMISSION_DIRECT_RATE = 0.10       # 10% direct commission
 COMMISSION_BINARY_RATE = 0.05       # 5% binary/upline matching commission
+COMMISSION_UPLINE_RATES = None      # per-level upline rates, e.g. [0.10, 0.05, 0.03, 0.02, 0.01]; None => [COMMISSION_BINARY_RATE]
 AUTO_APPROVE_COMMISSIONS = False    # if True, commissions auto-approved and wallets credited
 
 
@@ -237,8 +238,45 @@ CELERY_BEAT_SCHEDULE = {
     #     'task': 'reports.tasks.run_scheduled_reports',
     #     'schedule': 60.0,
     # },
+    # 'mlm-placement-drain': {  # safety net for MLM_ASYNC_PLACEMENT when a signup couldn't enqueue
+    #     'task': 'mlm.tasks.place_pending_nodes',
+    #     'schedule': 60.0,
+    # },
+    # 'mlm-activation-daily': {
+    #     'task': 'mlm.tasks.refresh_node_activation',
+    #     'schedule': crontab(hour=0, minute=30),  # from celery.schedules import crontab
+    # },
+    # 'mlm-ranks-nightly': {
+    #     'task': 'mlm.tasks.recompute_ranks',
+    #     'schedule': crontab(hour=1, minute=0),  # from celery.schedules import crontab
+    # },
+    # 'binary-pairing-weekly': {
+    #     'task': 'mlm.tasks.run_binary_pairing_cycle',
+    #     'schedule': crontab(day_of_week='mon', hour=2, minute=0),  # from celery.schedules import crontab
+    # },
 }
 
+# Binary pairing (mlm.pairing): optional max paired volume per node per cycle; excess is flushed
+MLM_BINARY_PAIRING_CAP = None
+
+# Activation job (mlm.activation): members are active when their direct-sale commissions plus
+# referral conversion amounts over the last MLM_ACTIVITY_WINDOW_DAYS reach MLM_ACTIVITY_MIN_VOLUME
+MLM_ACTIVITY_WINDOW_DAYS = 30
+MLM_ACTIVITY_MIN_VOLUME = 0
+
+# Rank engine (mlm.ranks): rules from lowest to highest, e.g.
+# [{'name': 'bronze', 'personal_volume': 100}, {'name': 'silver', 'team_volume': 1000, 'active_legs': 2, 'leg_rank': 'bronze'}]
+# None => mlm.ranks.DEFAULT_RANK_RULES
+MLM_RANK_RULES = None
+
+# Signup placement: True => the User post_save only queues a PlacementJob, drained by
+# mlm.tasks.place_pending_nodes in batches of MLM_PLACEMENT_BATCH_SIZE
+MLM_ASYNC_PLACEMENT = False
+MLM_PLACEMENT_BATCH_SIZE = 500
+
+# Genealogy read views (mlm.snapshot): serve from a per-process array snapshot of the tree
+MLM_TREE_SNAPSHOT = True
+
 
 # Twilio (optional)
 TWILIO_ACCOUNT_SID = config('TWILIO_ACCOUNT_SID', default='')
@@ -0,0 +1,78 @@
+# mlm/activation.py
+"""
+Scheduled activation of members from their recent sales activity.
+
+A member qualifies when their activity volume over the last MLM_ACTIVITY_WINDOW_DAYS
+(direct-sale commissions earned plus referral conversion amounts) has at least one
+record and reaches MLM_ACTIVITY_MIN_VOLUME. The job reads those volumes with one
+grouped query, flips `active` with one UPDATE per direction and keeps the derived
+data save() would maintain in step: ancestors' active_members, subtree versions and a
+single MLMTreeVersion bump (which invalidates the process-local tree snapshots).
+"""
+import time
+from datetime import timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from commissions.models import Commission
+from referrals.models import ReferralConversion
+from .arrays import TreeArrays
+from .models import MLMNode, MLMTreeVersion
+
+ACTIVITY_WINDOW_DAYS = getattr(settings, 'MLM_ACTIVITY_WINDOW_DAYS', 30)
+ACTIVITY_MIN_VOLUME = getattr(settings, 'MLM_ACTIVITY_MIN_VOLUME', 0)
+
+
+def activity_volumes(since):
+    """user_id -> activity volume since `since`, in one UNION ALL of two grouped queries."""
+    # .order_by() drops the models' default ordering, which compound statements don't allow
+    commissions = (Commission.objects.filter(source='direct_sale', created_at__gte=since).order_by()
+                   .values('telemarketer_id').annotate(volume=Sum('amount')).values_list('telemarketer_id', 'volume'))
+    conversions = (ReferralConversion.objects.filter(referrer__isnull=False, created_at__gte=since).order_by()
+                   .values('referrer_id').annotate(volume=Sum('amount')).values_list('referrer_id', 'volume'))
+    volumes = {}
+    for user_id, volume in commissions.union(conversions, all=True):
+        volumes[user_id] = volumes.get(user_id, Decimal('0.00')) + Decimal(volume or 0)
+    return volumes
+
+
+def refresh_activation(days=None, min_volume=None, dry_run=False, batch_size=2000):
+    """
+    Activate every qualifying member and deactivate everyone else, in one transaction
+    serialized with placements on the MLMTreeVersion row.
+    Returns {'nodes', 'qualified', 'activated', 'deactivated', 'elapsed'}.
+    """
+    started = time.monotonic()
+    since = timezone.now() - timedelta(days=ACTIVITY_WINDOW_DAYS if days is None else days)
+    min_volume = Decimal(str(ACTIVITY_MIN_VOLUME if min_volume is None else min_volume))
+
+    MLMTreeVersion.current()  # make sure the lock row exists
+    with transaction.atomic():
+        list(MLMTreeVersion.objects.select_for_update().filter(pk=1).values_list('pk', flat=True))
+        qualified = {user_id for user_id, volume in activity_volumes(since).items() if volume >= min_volume}
+        tree = TreeArrays.load('user_id', 'active')
+        delta = [int(user_id in qualified) - int(bool(active))
+                 for user_id, active in zip(tree.columns['user_id'], tree.columns['active'])]
+        activated = [tree.ids[i] for i, d in enumerate(delta) if d > 0]
+        deactivated = [tree.ids[i] for i, d in enumerate(delta) if d < 0]
+
+        if not dry_run and (activated or deactivated):
+            for ids, active in ((activated, True), (deactivated, False)):
+                # chunked: the first run (or a new window) can flip most of the tree
+                for start in range(0, len(ids), batch_size):
+                    MLMNode.objects.filter(pk__in=ids[start:start + batch_size]).update(active=active)
+            shift = tree.subtree_sums(delta)  # self included
+            flips = tree.subtree_sums([abs(d) for d in delta])
+            MLMNode.objects.bulk_update(
+                [MLMNode(pk=tree.ids[i], active_members=F('active_members') + (int(shift[i]) - delta[i]))
+                 for i in range(len(tree)) if int(shift[i]) != delta[i]],
+                ['active_members'], batch_size=batch_size,
+            )
+            MLMNode.touch_subtrees([tree.ids[i] for i in range(len(tree)) if flips[i]])
+            MLMTreeVersion.bump()
+
+    return {'nodes': len(tree), 'qualified': len(qualified), 'activated': len(activated),
+            'deactivated': len(deactivated), 'elapsed': time.monotonic() - started}
@@ -1,11 +1,15 @@
 from django.contrib import admin
-from django.urls import path
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.html import format_html
 from django.template.response import TemplateResponse
 from .models import MLMNode
+from .services import level_report
 
 @admin.register(MLMNode)
 class MLMNodeAdmin(admin.ModelAdmin):
-    list_display = ('id', 'user', 'parent', 'position', 'active', 'created_at')
+    list_display = ('id', 'user', 'parent', 'position', 'active', 'rank', 'created_at', 'levels_link')
+    list_filter = ('rank',)
     search_fields = ('user__username', 'user__email')
     change_list_template = "mlm/admin_change_list.html"
 
@@ -15,6 +19,8 @@ class MLMNodeAdmin(admin.ModelAdmin):
         custom_urls = [
             path('tree-visualization/', self.admin_site.admin_view(self.tree_visualization),
                  name=f'{model_label}_tree_visualization'),
+            path('<int:node_id>/levels/', self.admin_site.admin_view(self.level_report_view),
+                 name=f'{model_label}_levels'),
         ]
         return custom_urls + urls
 
@@ -28,3 +34,18 @@ class MLMNodeAdmin(admin.ModelAdmin):
             root_id=root_id,
         )
         return TemplateResponse(request, "mlm/tree_admin.html", context)
+
+    @admin.display(description='Levels')
+    def levels_link(self, obj):
+        return format_html('<a href="{}">report</a>', reverse('admin:mlm_mlmnode_levels', args=[obj.pk]))
+
+    def level_report_view(self, request, node_id):
+        node = get_object_or_404(MLMNode.objects.select_related('user'), pk=node_id)
+        context = dict(
+            self.admin_site.each_context(request),
+            node=node,
+            levels=level_report(node),
+            opts=self.model._meta,
+            title=f"Members per level below {node.user}",
+        )
+        return TemplateResponse(request, "mlm/level_report.html", context)
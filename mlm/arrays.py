@@ -0,0 +1,106 @@
+# mlm/arrays.py
+"""
+Compact, array-backed view of the whole MLMNode table for batch jobs (pairing, ranks, ...).
+
+Nodes are addressed by index i (ascending node id); `parent`, `left` and `right` hold
+indexes with -1 for "none", so a million-node tree costs a few int64 arrays instead of
+a million model instances. NumPy is used for the vectorized passes when installed.
+"""
+from array import array
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency: pure-python loops are used without it
+    np = None
+
+from .models import MLMNode
+
+NONE = -1
+
+
+class TreeArrays:
+    def __init__(self, ids, parent, left, right, columns=None):
+        self.ids = ids
+        self.parent = parent
+        self.left = left
+        self.right = right
+        self.columns = columns or {}
+        self.index = {pk: i for i, pk in enumerate(ids)}
+        self._order = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def load(cls, *fields, queryset=None, chunk_size=20000):
+        """Stream (id, parent_id, position, *fields) from the DB; extra fields land in `columns`."""
+        qs = queryset if queryset is not None else MLMNode.objects.all()
+        rows = qs.order_by('id').values_list('id', 'parent_id', 'position', *fields)
+        ids, parent_ids, positions = array('q'), [], []
+        columns = {name: [] for name in fields}
+        for row in rows.iterator(chunk_size=chunk_size):
+            ids.append(row[0])
+            parent_ids.append(row[1])
+            positions.append(row[2])
+            for name, value in zip(fields, row[3:]):
+                columns[name].append(value)
+
+        n = len(ids)
+        tree = cls(ids, array('q', [NONE]) * n, array('q', [NONE]) * n, array('q', [NONE]) * n, columns)
+        for i, (parent_id, position) in enumerate(zip(parent_ids, positions)):
+            p = tree.index.get(parent_id, NONE) if parent_id is not None else NONE
+            tree.parent[i] = p
+            if p != NONE:
+                (tree.left if position == 'L' else tree.right)[p] = i
+        return tree
+
+    def bfs_order(self):
+        """(order, level): node indexes with every parent before its children, and each node's level."""
+        if self._order is None:
+            n = len(self)
+            level = array('q', [0]) * n
+            order = array('q', (i for i in range(n) if self.parent[i] == NONE))
+            pos = 0
+            while pos < len(order):
+                i = order[pos]
+                pos += 1
+                for child in (self.left[i], self.right[i]):
+                    if child != NONE:
+                        level[child] = level[i] + 1
+                        order.append(child)
+            self._order = (order, level)
+        return self._order
+
+    def subtree_sums(self, values):
+        """Post-order pass: value of each node plus everything below it (integer values)."""
+        order, level = self.bfs_order()
+        if np is not None and len(self):
+            totals = np.asarray(values, dtype=np.int64).copy()
+            parent = np.frombuffer(self.parent, dtype=np.int64)
+            levels = np.frombuffer(level, dtype=np.int64)
+            by_level = np.frombuffer(order, dtype=np.int64)
+            by_level = by_level[np.argsort(levels[by_level], kind='stable')]
+            bounds = np.searchsorted(levels[by_level], np.arange(levels.max() + 2))
+            # deepest level first: each level's totals are final before they're pushed to the parents
+            for depth in range(int(levels.max()), 0, -1):
+                nodes = by_level[bounds[depth]:bounds[depth + 1]]
+                np.add.at(totals, parent[nodes], totals[nodes])
+            return totals
+        totals = list(values)
+        for i in reversed(order):
+            p = self.parent[i]
+            if p != NONE:
+                totals[p] += totals[i]
+        return totals
+
+    def leg_totals(self, subtree):
+        """Per node (left leg total, right leg total) from subtree sums."""
+        if np is not None and len(self):
+            subtree = np.asarray(subtree)
+            left = np.frombuffer(self.left, dtype=np.int64)
+            right = np.frombuffer(self.right, dtype=np.int64)
+            padded = np.append(subtree, 0)  # index -1 (no child) reads the trailing zero
+            return padded[left], padded[right]
+        left = [subtree[c] if c != NONE else 0 for c in self.left]
+        right = [subtree[c] if c != NONE else 0 for c in self.right]
+        return left, right
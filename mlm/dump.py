@@ -0,0 +1,151 @@
+# mlm/dump.py
+"""
+Compact columnar binary dump of the genealogy (MLMNode id, parent, user, position, active).
+
+Layout: a 16-byte header (magic, node count as little-endian uint64) followed by one
+contiguous little-endian column per field in COLUMNS order, rows in ascending id order.
+The int64 columns come first so every column starts 8-byte aligned and the file can be
+memory-mapped as-is (np.memmap) for offline analysis. Parents are stored as node ids,
+-1 for roots; positions use mlm.integrity's codes (0 none, 1 L, 2 R).
+
+Only the shape is dumped: on load, lineage paths, depths, the closure table and the
+cached downline statistics are rebuilt; volumes and other per-node fields get their defaults.
+"""
+import struct
+import sys
+from array import array
+from django.contrib.auth import get_user_model
+from django.core.management.color import no_style
+from django.db import connection, transaction
+
+from .arrays import np
+from .integrity import POSITIONS, PROBLEMS, verify_rows
+from .models import MLMNode, MLMClosure, MLMTreeVersion, PlacementJob, PATH_SEP
+from .services import rebuild_subtree_stats
+
+MAGIC = b'MLMTREE1'
+HEADER = struct.Struct('<8sQ')
+# (name, array typecode, numpy dtype)
+COLUMNS = (
+    ('id', 'q', '<i8'),
+    ('parent', 'q', '<i8'),
+    ('user_id', 'q', '<i8'),
+    ('position', 'B', 'u1'),
+    ('active', 'B', 'u1'),
+)
+POSITION_NAMES = {code: name for name, code in POSITIONS.items()}
+
+
+class DumpError(Exception):
+    """The dump file is malformed, or can't be loaded into this database."""
+
+
+def dump_tree(path, chunk_size=20000):
+    """Write the whole MLMNode table to `path`. Returns the number of nodes written."""
+    columns = {name: array(typecode) for name, typecode, _ in COLUMNS}
+    rows = MLMNode.objects.order_by('id').values_list('id', 'parent_id', 'user_id', 'position', 'active')
+    for pk, parent_id, user_id, position, active in rows.iterator(chunk_size=chunk_size):
+        columns['id'].append(pk)
+        columns['parent'].append(-1 if parent_id is None else parent_id)
+        columns['user_id'].append(user_id)
+        columns['position'].append(POSITIONS.get(position, 0))
+        columns['active'].append(int(active))
+    n = len(columns['id'])
+    with open(path, 'wb') as fh:
+        fh.write(HEADER.pack(MAGIC, n))
+        for name, _, _ in COLUMNS:
+            if sys.byteorder == 'big':
+                columns[name].byteswap()
+            columns[name].tofile(fh)
+    return n
+
+
+def read_dump(path):
+    """
+    Column name -> sequence for the dump at `path`: read-only np.memmap views when NumPy
+    is installed, arrays read from the file otherwise. Raises DumpError on a bad file.
+    """
+    with open(path, 'rb') as fh:
+        head = fh.read(HEADER.size)
+        if len(head) != HEADER.size or HEADER.unpack(head)[0] != MAGIC:
+            raise DumpError(f"{path} is not an MLM tree dump")
+        n = HEADER.unpack(head)[1]
+        widths = [array(typecode).itemsize for _, typecode, _ in COLUMNS]
+        fh.seek(0, 2)
+        if fh.tell() != HEADER.size + n * sum(widths):
+            raise DumpError(f"{path} is truncated or has trailing data")
+
+        columns, offset = {}, HEADER.size
+        for (name, typecode, dtype), width in zip(COLUMNS, widths):
+            if np is not None:
+                columns[name] = np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(n,)) if n else np.empty(0, dtype)
+            else:
+                fh.seek(offset)
+                columns[name] = array(typecode)
+                columns[name].fromfile(fh, n)
+                if sys.byteorder == 'big':
+                    columns[name].byteswap()
+            offset += n * width
+    return columns
+
+
+def load_tree(path, replace=False, batch_size=5000):
+    """
+    Bulk-insert the nodes of a dump, in one transaction. The MLMNode table must be empty
+    unless `replace` (then every node, closure row and placement job is dropped first).
+    The dump is checked with mlm.integrity and its users must exist; DumpError otherwise.
+    Returns {'nodes', 'closure_rows'}.
+    """
+    columns = read_dump(path)
+    ids = [int(pk) for pk in columns['id']]
+    parents = [None if p < 0 else int(p) for p in columns['parent']]
+    positions = [POSITION_NAMES.get(int(code)) for code in columns['position']]
+    user_ids = [int(pk) for pk in columns['user_id']]
+    active = [bool(flag) for flag in columns['active']]
+
+    report = verify_rows(zip(ids, parents, positions), sample=5)
+    problems = [f"{name} (e.g. {report[name]['ids']})" for name in PROBLEMS if report[name]['count']]
+    if problems:
+        raise DumpError(f"dump is not a valid tree: {', '.join(problems)}")
+    known_users = set(get_user_model().objects.values_list('id', flat=True).iterator())
+    missing = [pk for pk in user_ids if pk not in known_users]
+    if missing:
+        raise DumpError(f"{len(missing)} users of the dump don't exist here (e.g. {missing[:5]})")
+
+    # parents before children (foreign keys are checked row by row on MySQL), with lineage paths
+    index = {pk: i for i, pk in enumerate(ids)}
+    children = {}
+    for i, parent_id in enumerate(parents):
+        if parent_id is not None:
+            children.setdefault(parent_id, []).append(i)
+    order = [i for i, parent_id in enumerate(parents) if parent_id is None]
+    path_of = {}
+    for i in order:  # grows while iterating: breadth-first
+        parent_id = parents[i]
+        path_of[i] = '' if parent_id is None else f"{path_of[index[parent_id]]}{parent_id}{PATH_SEP}"
+        order.extend(children.get(ids[i], ()))
+
+    with transaction.atomic():
+        if MLMNode.objects.exists():
+            if not replace:
+                raise DumpError("the MLMNode table is not empty (load with replace=True to overwrite it)")
+            MLMClosure.objects.all().delete()
+            PlacementJob.objects.all().delete()
+            MLMNode.objects.update(parent=None)
+            # whole-table delete in SQL: the per-node delete signals would only detach nodes
+            # whose derived data is rebuilt right after anyway
+            with connection.cursor() as cursor:
+                cursor.execute(f"DELETE FROM {connection.ops.quote_name(MLMNode._meta.db_table)}")
+        for start in range(0, len(order), batch_size):
+            MLMNode.objects.bulk_create([
+                MLMNode(pk=ids[i], parent_id=parents[i], user_id=user_ids[i], position=positions[i],
+                        active=active[i], path=path_of[i], depth=path_of[i].count(PATH_SEP))
+                for i in order[start:start + batch_size]
+            ])
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), [MLMNode]):
+                cursor.execute(sql)
+        closure_rows = MLMClosure.rebuild(batch_size=batch_size)
+        rebuild_subtree_stats()
+        MLMTreeVersion.bump()
+    return {'nodes': len(ids), 'closure_rows': closure_rows}
@@ -0,0 +1,126 @@
+# mlm/integrity.py
+"""
+Linear-time structural check of the whole binary tree.
+
+Rows are streamed as (id, parent_id, position) into compact arrays; one pass counts
+children per parent slot, and one walk up the parent pointers (every node resolved
+once) classifies each node as reachable from a root, part of a cycle, hanging below a
+cycle, or cut off by a dangling parent id. NumPy does the counting when installed.
+"""
+from array import array
+from bisect import bisect_left
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency: pure-python counting without it
+    np = None
+
+from .models import MLMNode
+
+NONE = -1
+POSITIONS = {'L': 1, 'R': 2}
+# node states of the parent-pointer walk
+UNSEEN, ON_PATH, ROOTED, CYCLE, BELOW_CYCLE, ORPHANED = range(6)
+PROBLEMS = ('cycles', 'below_cycle', 'dangling_parent', 'orphaned', 'over_full', 'duplicate_positions',
+            'missing_position')
+
+
+def verify_tree(chunk_size=20000, sample=20):
+    """Stream the whole MLMNode table through verify_rows()."""
+    rows = MLMNode.objects.order_by('id').values_list('id', 'parent_id', 'position')
+    return verify_rows(rows.iterator(chunk_size=chunk_size), sample=sample)
+
+
+def verify_rows(rows, sample=20):
+    """
+    Check (id, parent_id, position) rows given in ascending id order. Returns a report dict:
+    node/root counts and, per problem, its count plus up to `sample` example ids: cycles,
+    below_cycle, dangling_parent, orphaned (below a dangling parent), over_full parents,
+    duplicate_positions parents, missing_position nodes.
+    """
+    ids, parent_ids, positions = array('q'), array('q'), bytearray()
+    for pk, parent_id, position in rows:
+        ids.append(pk)
+        parent_ids.append(NONE if parent_id is None else parent_id)
+        positions.append(POSITIONS.get(position, 0))
+    n = len(ids)
+
+    # parent id -> parent index (ids are sorted), NONE for roots, -2 for ids that don't exist
+    if np is not None and n:
+        id_arr = np.frombuffer(ids, dtype=np.int64)
+        pid_arr = np.frombuffer(parent_ids, dtype=np.int64)
+        found = np.minimum(np.searchsorted(id_arr, pid_arr), n - 1)
+        parent_arr = np.where(pid_arr == NONE, NONE, np.where(id_arr[found] == pid_arr, found, -2))
+        parent = array('q', parent_arr.astype(np.int64).tobytes())
+        has_parent = parent_arr >= 0
+        pos_arr = np.frombuffer(bytes(positions), dtype=np.uint8)
+        children = np.bincount(parent_arr[has_parent], minlength=n)
+        slots = np.bincount(parent_arr[has_parent] * 3 + pos_arr[has_parent], minlength=3 * n).reshape(n, 3)
+        over_full = np.nonzero(children > 2)[0].tolist()
+        duplicates = np.nonzero((slots[:, 1:] > 1).any(axis=1))[0].tolist()
+        missing_position = np.nonzero(has_parent & (pos_arr == 0))[0].tolist()
+    else:
+        parent = array('q', [NONE]) * n
+        children, slots = [0] * n, {}
+        for i in range(n):
+            pid = parent_ids[i]
+            if pid == NONE:
+                continue
+            j = bisect_left(ids, pid)
+            if j == n or ids[j] != pid:
+                parent[i] = -2
+                continue
+            parent[i] = j
+            children[j] += 1
+            slots[(j, positions[i])] = slots.get((j, positions[i]), 0) + 1
+        over_full = [i for i in range(n) if children[i] > 2]
+        duplicates = sorted({j for (j, pos), count in slots.items() if pos and count > 1})
+        missing_position = [i for i in range(n) if parent[i] >= 0 and not positions[i]]
+
+    state = bytearray(n)
+    path = []
+    for start in range(n):
+        i = start
+        while state[i] == UNSEEN:
+            state[i] = ON_PATH
+            path.append(i)
+            p = parent[i]
+            if p < 0:
+                break
+            i = p
+        if not path:
+            continue
+        # what the walk ended on decides the fate of everything on the path
+        end = parent[path[-1]]
+        if end == NONE:
+            fate = ROOTED
+        elif end == -2:
+            fate = ORPHANED
+        elif state[i] == ON_PATH:
+            # closed a loop: the nodes from i onwards are the cycle
+            cut = path.index(i)
+            for k in path[cut:]:
+                state[k] = CYCLE
+            del path[cut:]
+            fate = BELOW_CYCLE
+        else:
+            fate = BELOW_CYCLE if state[i] in (CYCLE, BELOW_CYCLE) else state[i]
+        for k in path:
+            state[k] = fate
+        path.clear()
+
+    def report(indexes):
+        indexes = list(indexes)
+        return {'count': len(indexes), 'ids': [ids[i] for i in indexes[:sample]]}
+
+    return {
+        'nodes': n,
+        'roots': sum(1 for i in range(n) if parent[i] == NONE),
+        'cycles': report(i for i in range(n) if state[i] == CYCLE),
+        'below_cycle': report(i for i in range(n) if state[i] == BELOW_CYCLE),
+        'dangling_parent': report(i for i in range(n) if parent[i] == -2),
+        'orphaned': report(i for i in range(n) if state[i] == ORPHANED and parent[i] != -2),
+        'over_full': report(over_full),
+        'duplicate_positions': report(duplicates),
+        'missing_position': report(missing_position),
+    }
@@ -0,0 +1,149 @@
+# mlm/layout.py
+"""
+Server-side coordinate layout of a window of the tree, for the admin visualization.
+
+The window is `depth` levels below a root; every node listed in `expand` opens a further
+`depth` levels below itself, so a browser expands a collapsed branch with one more request
+instead of crawling subtrees. Coordinates are in grid units: `y` is the level below the
+root, `x` a horizontal slot (leaves take consecutive slots, parents sit centred over their
+children), so the client only scales them to its card size. Nodes whose children are
+outside the window are flagged `collapsed`.
+
+Layouts are cached under the root's subtree_version, which every change below it bumps.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models import Q
+
+from .arrays import NONE
+from .models import MLMNode, PATH_SEP
+from .snapshot import get_snapshot
+
+LAYOUT_TTL = getattr(settings, 'MLM_LAYOUT_TTL', 24 * 3600)
+
+
+def tree_layout(root_id, version, depth, expand=(), max_nodes=2000):
+    """
+    {'root', 'nodes': [{'id', 'user', 'active', 'position', 'parent', 'x', 'y', 'collapsed'}, ...],
+    'width', 'height', 'truncated'} for the window below root_id (None if it doesn't exist).
+    `version` is the root's current subtree_version (the cache key).
+    """
+    expand = sorted(set(expand))
+    key = f"mlm:layout:{root_id}:{version}:{depth}:{max_nodes}:{','.join(map(str, expand))}"
+    layout = cache.get(key)
+    if layout is None:
+        layout = compute_layout(root_id, depth, expand, max_nodes)
+        cache.set(key, layout, LAYOUT_TTL)
+    return layout
+
+
+def compute_layout(root_id, depth, expand=(), max_nodes=2000):
+    snapshot = get_snapshot()
+    source = _SnapshotSource(snapshot) if snapshot is not None else _QuerySource(root_id, depth, expand)
+    if not source.has(root_id):
+        return None
+    expand = set(expand)
+
+    # breadth-first, so the node cap trims the deepest levels first
+    order, kids, level = [root_id], {}, {root_id: 0}
+    budget = {root_id: depth}
+    collapsed, truncated = set(), False
+    pos = 0
+    while pos < len(order):
+        node_id = order[pos]
+        pos += 1
+        below = source.children(node_id)
+        remaining = depth if node_id in expand and node_id != root_id else budget[node_id]
+        if not below:
+            continue
+        if remaining <= 0 or len(order) + len(below) > max_nodes:
+            collapsed.add(node_id)
+            truncated = truncated or remaining > 0
+            continue
+        kids[node_id] = below
+        for child in below:
+            order.append(child)
+            level[child] = level[node_id] + 1
+            budget[child] = remaining - 1
+
+    # post-order slots: leaves left to right, parents centred over their first and last child
+    x, next_slot = {}, 0
+    for node_id in _post_order(root_id, kids):
+        below = kids.get(node_id)
+        if below:
+            x[node_id] = (x[below[0]] + x[below[-1]]) / 2
+        else:
+            x[node_id] = next_slot
+            next_slot += 1
+
+    entries = source.entries(order)
+    nodes = []
+    for node_id in order:
+        entry = entries[node_id]
+        entry.update(x=x[node_id], y=level[node_id], collapsed=node_id in collapsed)
+        if node_id == root_id:
+            entry['parent'] = None  # the window's root is drawn as a root
+        nodes.append(entry)
+    return {'root': root_id, 'nodes': nodes, 'width': next_slot, 'height': max(level.values()) + 1,
+            'truncated': truncated}
+
+
+def _post_order(root_id, kids):
+    stack, out = [root_id], []
+    while stack:
+        node_id = stack.pop()
+        out.append(node_id)
+        stack.extend(kids.get(node_id, ()))
+    # node-right-left pre-order, reversed, is left-right-node post-order
+    out.reverse()
+    return out
+
+
+class _SnapshotSource:
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+
+    def has(self, node_id):
+        return node_id in self.snapshot.index
+
+    def children(self, node_id):
+        i = self.snapshot.index[node_id]
+        return [self.snapshot.ids[c] for c in (self.snapshot.left[i], self.snapshot.right[i]) if c != NONE]
+
+    def entries(self, node_ids):
+        entries = {node_id: self.snapshot.entry(self.snapshot.index[node_id]) for node_id in node_ids}
+        users = get_user_model().objects.in_bulk({entry['user_id'] for entry in entries.values()})
+        for entry in entries.values():
+            entry['user'] = str(users[entry.pop('user_id')])
+        return entries
+
+
+class _QuerySource:
+    """Window rows read with one query on the lineage paths (plus one for the expanded nodes)."""
+
+    def __init__(self, root_id, depth, expand):
+        tops = {pk: (path, level) for pk, path, level in
+                MLMNode.objects.filter(pk__in={root_id, *expand}).values_list('pk', 'path', 'depth')}
+        self.rows, self.kids = {}, {}
+        if root_id not in tops:
+            return
+        window = Q(pk=root_id)
+        for pk, (path, level) in tops.items():
+            # one level beyond the window tells whether its bottom nodes are collapsed
+            window |= Q(path__startswith=f"{path}{pk}{PATH_SEP}", depth__lte=level + depth + 1)
+        for row in MLMNode.objects.filter(window).select_related('user').order_by('depth', 'path', 'position'):
+            self.rows[row.pk] = row
+            if row.parent_id is not None:
+                self.kids.setdefault(row.parent_id, []).append(row.pk)
+
+    def has(self, node_id):
+        return node_id in self.rows
+
+    def children(self, node_id):
+        return self.kids.get(node_id, [])
+
+    def entries(self, node_ids):
+        return {node_id: {'id': node_id, 'user': str(self.rows[node_id].user), 'active': self.rows[node_id].active,
+                          'position': self.rows[node_id].position, 'parent': self.rows[node_id].parent_id}
+                for node_id in node_ids}
@@ -0,0 +1,78 @@
+import threading
+import time
+import uuid
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from mlm.models import MLMNode
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ("Benchmark concurrent signups: create users from several threads and place them under one "
+            "sponsor, then assert no two nodes share a parent slot and report placements/sec. The sponsor "
+            "is a fresh root of its own, so the benchmark never touches the live tree.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=2000, help='Number of signups to simulate (default 2000).')
+        parser.add_argument('--threads', type=int, default=8, help='Parallel signup workers (default 8).')
+        parser.add_argument('--cleanup', action='store_true', help='Delete the benchmark users afterwards.')
+
+    def handle(self, *args, **options):
+        run = uuid.uuid4().hex[:6]
+        sponsor = User(username=f'bench-{run}-sponsor')
+        sponsor._mlm_skip_signup = True
+        sponsor.save()
+        sponsor_node = MLMNode.objects.create(user=sponsor)
+
+        total, workers = options['users'], max(1, options['threads'])
+        errors = []
+
+        def signup(worker):
+            try:
+                # the signup signal's referral path, minus its fall back to the live tree
+                start_node = MLMNode.objects.get(pk=sponsor_node.pk)
+                for i in range(worker, total, workers):
+                    user = User(username=f'bench-{run}-{i}')
+                    user._mlm_skip_signup = True
+                    user.save()
+                    MLMNode.auto_place(MLMNode.objects.create(user=user), start_node=start_node)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=signup, args=(w,)) for w in range(workers)]
+        started = time.monotonic()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.monotonic() - started
+
+        nodes = MLMNode.objects.filter(user__username__startswith=f'bench-{run}-')
+        collisions = (MLMNode.objects.filter(parent__isnull=False).values('parent_id', 'position')
+                      .annotate(n=Count('id')).filter(n__gt=1).count())
+        overfull = (MLMNode.objects.filter(parent__isnull=False).values('parent_id')
+                    .annotate(n=Count('id')).filter(n__gt=2).count())
+        unplaced = nodes.filter(parent__isnull=True).exclude(user__username=f'bench-{run}-sponsor').count()
+        placed = nodes.filter(parent__isnull=False).count()
+
+        self.stdout.write(f"{placed} placements by {workers} threads in {elapsed:.2f}s "
+                          f"({placed / elapsed if elapsed else 0:.1f} placements/sec)")
+        self.stdout.write(f"slot collisions={collisions} over-full parents={overfull} "
+                          f"unplaced={unplaced} worker errors={len(errors)}")
+        for e in errors[:5]:
+            self.stdout.write(self.style.WARNING(f"  {type(e).__name__}: {e}"))
+
+        if options['cleanup']:
+            # leaves first, one at a time, so every delete goes through the node's pre_delete detach
+            for user_id in nodes.order_by('-depth').values_list('user_id', flat=True):
+                User.objects.filter(pk=user_id).delete()
+            User.objects.filter(username__startswith=f'bench-{run}-').delete()  # users whose node failed
+
+        if collisions or overfull:
+            raise CommandError("Placement collisions detected.")
+        self.stdout.write(self.style.SUCCESS("No slot collisions."))
@@ -0,0 +1,83 @@
+import time
+import uuid
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries, transaction
+from django.test.utils import CaptureQueriesContext
+from mlm.models import MLMNode, MLMClosure, PATH_SEP, RANK_BITS, RANK_MAX
+from mlm.placement import STRATEGIES
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ("Benchmark the placement strategies on a synthetic deep tree (a left spine with a right "
+            "branch per level): slot lookups/sec and queries per lookup. Runs in a rolled-back transaction.")
+
+    def add_arguments(self, parser):
+        # each level adds "<id>/" to the lineage path, so the depth is bounded by MLMNode.path's length
+        parser.add_argument('--depth', type=int, default=60, help='Depth of the synthetic tree (default 60).')
+        parser.add_argument('--lookups', type=int, default=200, help='Slot lookups per strategy (default 200).')
+
+    def handle(self, *args, **options):
+        depth, lookups = options['depth'], options['lookups']
+        with transaction.atomic():
+            root = self._build_tree(depth)
+            self.stdout.write(f"tree: {root.team_size + 1} nodes, depth {root.max_depth}")
+            for name, find_slot in sorted(STRATEGIES.items()):
+                reset_queries()
+                with CaptureQueriesContext(connection) as queries:
+                    parent, position = find_slot(root)
+                started = time.monotonic()
+                for _ in range(lookups):
+                    reset_queries()  # keep DEBUG query logging from growing during the loop
+                    find_slot(root)
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    f"{name:>14}: {lookups / elapsed if elapsed else 0:9.1f} lookups/sec, "
+                    f"{len(queries.captured_queries):4d} queries/lookup -> node {parent.pk} {position}"
+                )
+            transaction.set_rollback(True)
+
+    def _build_tree(self, depth):
+        run = uuid.uuid4().hex[:6]
+        User.objects.bulk_create([User(username=f'stratbench-{run}-{i}') for i in range(2 * depth + 1)])
+        # read the pks back: MySQL's bulk_create doesn't return them
+        user_ids = list(User.objects.filter(username__startswith=f'stratbench-{run}-').values_list('pk', flat=True))
+        MLMNode.objects.bulk_create([MLMNode(user_id=user_id) for user_id in user_ids], batch_size=1000)
+        ids = list(MLMNode.objects.filter(user_id__in=user_ids).order_by('user_id').values_list('pk', flat=True))
+
+        # ids[0] is the root; ids[2k-1] continues the left spine, ids[2k] hangs right of the spine node above.
+        # Lineage, closure rows and cached stats are written directly for just these nodes.
+        spine = [ids[0]] + [ids[2 * level - 1] for level in range(1, depth + 1)]
+        nodes, rows, path = [], [], ''
+        for level, node_id in enumerate(spine):
+            below = depth - level
+            nodes.append(MLMNode(pk=node_id, path=path, depth=level, team_size=2 * below,
+                                 left_count=max(2 * below - 1, 0), right_count=min(below, 1), max_depth=below))
+            if level:
+                nodes[-1].parent_id, nodes[-1].position = spine[level - 1], 'L'
+                leaf = ids[2 * level]
+                nodes.append(MLMNode(pk=leaf, parent_id=spine[level - 1], position='R', path=path, depth=level))
+            path = f"{path}{node_id}{PATH_SEP}"
+        limit = MLMNode._meta.get_field('path').max_length
+        if len(nodes[-1].path) > limit:
+            raise CommandError(f"--depth {depth} needs {len(nodes[-1].path)}-character lineage paths; "
+                               f"MLMNode.path holds {limit}. Use a smaller depth.")
+        MLMNode.objects.bulk_update(nodes, ['parent', 'position', 'path', 'depth', 'team_size', 'left_count',
+                                            'right_count', 'max_depth'], batch_size=1000)
+        for node in nodes:
+            ancestors = MLMNode._ids_in_path(node.path)  # nearest first
+            is_open = node.pk == spine[-1] or node.pk not in spine
+            rows.append(MLMClosure(ancestor_id=node.pk, descendant_id=node.pk, depth=0, open=is_open))
+            for distance, ancestor_id in enumerate(ancestors, start=1):
+                # route from any ancestor: down the spine (L bits), then the node's own side as the last bit
+                rows.append(MLMClosure(ancestor_id=ancestor_id, descendant_id=node.pk, depth=distance,
+                                       leg=node.position if distance == 1 else 'L',
+                                       rank=RANK_MAX if distance > RANK_BITS else int(node.position == 'R'),
+                                       open=is_open))
+            if len(rows) >= 5000:
+                MLMClosure.objects.bulk_create(rows, batch_size=5000)
+                rows = []
+        MLMClosure.objects.bulk_create(rows, batch_size=5000)
+        return MLMNode.objects.get(pk=ids[0])
@@ -0,0 +1,20 @@
+import time
+from django.core.management.base import BaseCommand
+from mlm.models import MLMNode
+from mlm.services import rebuild_subtree_stats
+
+
+class Command(BaseCommand):
+    help = "Recompute the cached per-node downline statistics (team size, active members, leg counts, max depth)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000, help='Rows per bulk update (default 2000).')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        nodes = MLMNode.objects.count()
+        fixed = rebuild_subtree_stats(batch_size=options['batch_size'])
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Checked {nodes} nodes: corrected statistics on {fixed} in {elapsed:.2f}s."
+        ))
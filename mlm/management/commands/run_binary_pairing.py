@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+from mlm.pairing import run_binary_cycle, np
+
+
+class Command(BaseCommand):
+    help = "Run a binary pairing cycle over the whole tree and write its commissions (bulk)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--label', help='Cycle label, e.g. 2025-W47 (default: current ISO week). A label is paid once.')
+        parser.add_argument('--rate', help='Pairing rate (default COMMISSION_BINARY_RATE).')
+        parser.add_argument('--cap', help='Max paired volume per node per cycle (default MLM_BINARY_PAIRING_CAP).')
+        parser.add_argument('--dry-run', action='store_true', help='Compute and report without writing anything.')
+
+    def handle(self, *args, **options):
+        stats = run_binary_cycle(label=options.get('label'), rate=options.get('rate'),
+                                 cap=options.get('cap'), dry_run=options['dry_run'])
+        if stats['already_run']:
+            raise CommandError(f"Cycle {stats['label']} was already paid.")
+        rate = stats['nodes'] / stats['elapsed'] if stats['elapsed'] else 0
+        self.stdout.write(
+            f"Cycle {stats['label']}: {stats['nodes']} nodes in {stats['elapsed']:.2f}s ({rate:.0f} nodes/sec, "
+            f"{'numpy' if np is not None else 'pure python'}); {stats['paired_nodes']} commissions, total {stats['total']}"
+        )
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING("Dry run: nothing written."))
+        else:
+            self.stdout.write(self.style.SUCCESS("Pairing commissions written."))
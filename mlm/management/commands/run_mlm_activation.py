@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from mlm.activation import refresh_activation
+
+
+class Command(BaseCommand):
+    help = "Set MLMNode.active from recent sales activity (commissions and referral conversions), set-based."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='Activity window in days (default MLM_ACTIVITY_WINDOW_DAYS).')
+        parser.add_argument('--min-volume', help='Volume needed to qualify (default MLM_ACTIVITY_MIN_VOLUME).')
+        parser.add_argument('--dry-run', action='store_true', help='Compute and report without writing anything.')
+
+    def handle(self, *args, **options):
+        stats = refresh_activation(days=options.get('days'), min_volume=options.get('min_volume'),
+                                   dry_run=options['dry_run'])
+        self.stdout.write(
+            f"{stats['qualified']} qualifying users over {stats['nodes']} nodes in {stats['elapsed']:.2f}s: "
+            f"{stats['activated']} activated, {stats['deactivated']} deactivated"
+        )
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING("Dry run: nothing written."))
+        else:
+            self.stdout.write(self.style.SUCCESS("Activation updated."))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+from mlm.ranks import run_rank_engine, np
+
+
+class Command(BaseCommand):
+    help = "Recompute every member's rank from MLM_RANK_RULES in one bottom-up pass and write the changes (bulk)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Compute and report without writing anything.')
+
+    def handle(self, *args, **options):
+        try:
+            stats = run_rank_engine(dry_run=options['dry_run'])
+        except ValueError as exc:
+            raise CommandError(f"MLM_RANK_RULES: {exc}")
+        rate = stats['nodes'] / stats['elapsed'] if stats['elapsed'] else 0
+        self.stdout.write(
+            f"Ranked {stats['nodes']} nodes in {stats['elapsed']:.2f}s ({rate:.0f} nodes/sec, "
+            f"{'numpy' if np is not None else 'pure python'}); {stats['changed']} changed"
+        )
+        self.stdout.write(", ".join(f"{name}: {count}" for name, count in stats['ranks'].items()))
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING("Dry run: nothing written."))
+        else:
+            self.stdout.write(self.style.SUCCESS("Ranks written."))
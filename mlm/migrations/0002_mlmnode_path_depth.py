@@ -0,0 +1,49 @@
+# Generated by Django 5.2.7 on 2026-10-18 15:41
+
+from django.db import migrations, models
+
+
+def backfill_paths(apps, schema_editor):
+    MLMNode = apps.get_model('mlm', 'MLMNode')
+    children = {}
+    roots = []
+    for pk, parent_id in MLMNode.objects.values_list('id', 'parent_id').iterator():
+        if parent_id is None:
+            roots.append(pk)
+        else:
+            children.setdefault(parent_id, []).append(pk)
+
+    # walk each tree top-down so every parent's path is known before its children
+    batch = []
+    stack = [(pk, '', 0) for pk in roots]
+    while stack:
+        pk, path, depth = stack.pop()
+        batch.append(MLMNode(pk=pk, path=path, depth=depth))
+        for child in children.get(pk, ()):
+            stack.append((child, f"{path}{pk}/", depth + 1))
+        if len(batch) >= 2000:
+            MLMNode.objects.bulk_update(batch, ['path', 'depth'])
+            batch = []
+    if batch:
+        MLMNode.objects.bulk_update(batch, ['path', 'depth'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mlm', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mlmnode',
+            name='depth',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='mlmnode',
+            name='path',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=512),
+        ),
+        migrations.RunPython(backfill_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-18 15:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mlm', '0002_mlmnode_path_depth'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MLMClosure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveIntegerField()),
+                ('leg', models.CharField(blank=True, choices=[('L', 'Left'), ('R', 'Right')], max_length=1, null=True)),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descendant_links', to='mlm.mlmnode')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_links', to='mlm.mlmnode')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['ancestor', 'depth'], name='mlm_mlmclos_ancesto_9e8210_idx'), models.Index(fields=['descendant', 'depth'], name='mlm_mlmclos_descend_04ef5c_idx')],
+                'constraints': [models.UniqueConstraint(fields=('ancestor', 'descendant'), name='mlm_closure_unique_pair')],
+            },
+        ),
+    ]
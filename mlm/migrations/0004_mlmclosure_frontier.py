@@ -0,0 +1,66 @@
+# Generated by Django 5.2.7 on 2026-10-18 15:45
+
+from django.db import migrations, models
+
+# frozen copies of mlm.models.RANK_BITS / RANK_MAX
+RANK_BITS = 62
+RANK_MAX = (1 << 63) - 1
+
+
+def backfill_closure(apps, schema_editor):
+    MLMNode = apps.get_model('mlm', 'MLMNode')
+    MLMClosure = apps.get_model('mlm', 'MLMClosure')
+    children = {}
+    roots = []
+    for pk, parent_id, position in MLMNode.objects.values_list('id', 'parent_id', 'position').iterator():
+        if parent_id is None:
+            roots.append(pk)
+        else:
+            children.setdefault(parent_id, []).append((pk, position))
+
+    # walk each tree carrying the upline as ((ancestor_id, leg taken from it), ...), root first
+    MLMClosure.objects.all().delete()
+    batch = []
+    stack = [(pk, ()) for pk in roots]
+    while stack:
+        pk, upline = stack.pop()
+        is_open = len(children.get(pk, ())) < 2
+        batch.append(MLMClosure(ancestor_id=pk, descendant_id=pk, depth=0, open=is_open))
+        rank = 0
+        for distance, (ancestor_id, leg) in enumerate(reversed(upline), start=1):
+            rank = rank | ((leg == 'R') << (distance - 1)) if distance <= RANK_BITS else RANK_MAX
+            batch.append(MLMClosure(ancestor_id=ancestor_id, descendant_id=pk, depth=distance, leg=leg,
+                                    rank=rank, open=is_open))
+        for child, position in children.get(pk, ()):
+            stack.append((child, upline + ((pk, position),)))
+        if len(batch) >= 2000:
+            MLMClosure.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        MLMClosure.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mlm', '0003_mlmclosure'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mlmclosure',
+            name='open',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name='mlmclosure',
+            name='rank',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='mlmclosure',
+            index=models.Index(fields=['ancestor', 'open', 'depth', 'rank'], name='mlm_closure_frontier_idx'),
+        ),
+        # trees that predate the closure table get their rows (frontier included) here
+        migrations.RunPython(backfill_closure, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-18 15:46
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mlm', '0004_mlmclosure_frontier'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='mlmnode',
+            constraint=models.UniqueConstraint(fields=('parent', 'position'), name='mlm_unique_parent_position'),
+        ),
+    ]
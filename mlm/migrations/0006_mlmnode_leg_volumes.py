@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-18 15:50
+
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mlm', '0005_mlmnode_unique_parent_position'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mlmnode',
+            name='left_volume',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='mlmnode',
+            name='personal_volume',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='mlmnode',
+            name='right_volume',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-18 15:51
+
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mlm', '0006_mlmnode_leg_volumes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mlmnode',
+            name='paired_volume',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.7 on 2026-10-18 15:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mlm', '0007_mlmnode_paired_volume'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MLMTreeVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.BigIntegerField(default=0)),
+                ('stamp', models.CharField(default='', max_length=32)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
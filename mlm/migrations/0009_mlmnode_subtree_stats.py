@@ -0,0 +1,83 @@
+# Generated by Django 5.2.7 on 2026-10-18 15:55
+
+from django.db import migrations, models
+
+STAT_FIELDS = ['team_size', 'active_members', 'left_count', 'right_count', 'max_depth']
+
+
+def backfill_stats(apps, schema_editor):
+    MLMNode = apps.get_model('mlm', 'MLMNode')
+    children = {}
+    active = {}
+    order = []
+    for pk, parent_id, position, is_active in MLMNode.objects.values_list(
+            'id', 'parent_id', 'position', 'active').iterator():
+        active[pk] = int(bool(is_active))
+        if parent_id is None:
+            order.append(pk)
+        else:
+            children.setdefault(parent_id, []).append((pk, position))
+
+    # top-down order, then fold every node's totals into its parent bottom-up
+    pos = 0
+    while pos < len(order):
+        order.extend(child for child, _ in children.get(order[pos], ()))
+        pos += 1
+    stats = {}
+    for pk in reversed(order):
+        team_size = active_members = max_depth = 0
+        legs = {'L': 0, 'R': 0}
+        for child, position in children.get(pk, ()):
+            size, members, _, _, depth = stats[child]
+            team_size += size + 1
+            active_members += members + active[child]
+            max_depth = max(max_depth, depth + 1)
+            if position in legs:
+                legs[position] += size + 1
+        stats[pk] = (team_size, active_members, legs['L'], legs['R'], max_depth)
+
+    batch = []
+    for pk, values in stats.items():
+        if any(values):
+            batch.append(MLMNode(pk=pk, **dict(zip(STAT_FIELDS, values))))
+        if len(batch) >= 2000:
+            MLMNode.objects.bulk_update(batch, STAT_FIELDS)
+            batch = []
+    if batch:
+        MLMNode.objects.bulk_update(batch, STAT_FIELDS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mlm', '0008_mlmtreeversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mlmnode',
+            name='active_members',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='mlmnode',
+            name='left_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='mlmnode',
+            name='max_depth',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='mlmnode',
+            name='right_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='mlmnode',
+            name='team_size',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_stats, migrations.RunPython.noop),
+    ]
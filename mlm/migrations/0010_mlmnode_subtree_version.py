@@ -0,0 +1,24 @@
+# Generated by Django 5.2.7 on 2026-10-18 15:57
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mlm', '0009_mlmnode_subtree_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mlmnode',
+            name='subtree_changed_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.AddField(
+            model_name='mlmnode',
+            name='subtree_version',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+    ]
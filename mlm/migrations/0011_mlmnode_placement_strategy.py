@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 16:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mlm', '0010_mlmnode_subtree_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mlmnode',
+            name='placement_strategy',
+            field=models.CharField(choices=[('bfs', 'First open slot (breadth-first)'), ('extreme_left', 'Extreme left'), ('extreme_right', 'Extreme right'), ('weaker_leg', 'Weaker leg'), ('balanced', 'Balanced')], default='bfs', max_length=20),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.7 on 2026-10-18 16:05
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mlm', '0011_mlmnode_placement_strategy'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlacementJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sponsor_code', models.CharField(blank=True, max_length=12, null=True)),
+                ('token', models.UUIDField(default=uuid.uuid4, editable=False, unique=True)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('placed', 'Placed'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('error', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('node', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='placement_job', to='mlm.mlmnode')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'id'], name='mlm_placeme_status_49d501_idx')],
+            },
+        ),
+    ]
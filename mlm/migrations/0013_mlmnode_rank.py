@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 16:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mlm', '0012_placementjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mlmnode',
+            name='rank',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=20),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.7 on 2026-10-18 16:37
+
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mlm', '0013_mlmnode_rank'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='mlmnode',
+            name='left_volume',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), editable=False, max_digits=14),
+        ),
+        migrations.AlterField(
+            model_name='mlmnode',
+            name='paired_volume',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), editable=False, max_digits=14),
+        ),
+        migrations.AlterField(
+            model_name='mlmnode',
+            name='personal_volume',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), editable=False, max_digits=14),
+        ),
+        migrations.AlterField(
+            model_name='mlmnode',
+            name='right_volume',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), editable=False, max_digits=14),
+        ),
+    ]
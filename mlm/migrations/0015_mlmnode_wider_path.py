@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 17:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mlm', '0014_mlmnode_volumes_not_editable'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='mlmnode',
+            name='path',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=768),
+        ),
+    ]
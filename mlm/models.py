@@ -1,135 +1,655 @@
+import random
+import time
+import uuid
+from collections import deque
+from decimal import Decimal
 from django.conf import settings
-from django.db import models
+from django.db import models, transaction, IntegrityError, OperationalError
+from django.db.models import Case, F, Max, Q, Value, When
+from django.db.models.functions import Concat, Greatest, Length, Substr
 from django.core.exceptions import ValidationError
 from django.utils import timezone
 
 User = settings.AUTH_USER_MODEL
 
+PATH_SEP = '/'
+# MLMClosure.rank holds the left/right route from ancestor to descendant as bits; deeper routes saturate.
+RANK_BITS = 62
+RANK_MAX = (1 << 63) - 1
+
+# concurrent placements under the same parent are retried this many times (with jittered backoff)
+PLACEMENT_RETRIES = getattr(settings, 'MLM_PLACEMENT_RETRIES', 8)
+PLACEMENT_BACKOFF = getattr(settings, 'MLM_PLACEMENT_BACKOFF', 0.01)
+
+
+class PlacementConflict(Exception):
+    """The slot picked for a placement was claimed by a concurrent placement."""
+
+
+class LineageTooLong(ValidationError):
+    """A node's lineage path (or one of its moved downline's) would not fit MLMNode.path."""
+
+
 class MLMNode(models.Model):
     POSITION_CHOICES = (('L', 'Left'), ('R', 'Right'))
+    # see mlm.placement; the sponsor's choice applies to everyone auto-placed below them
+    STRATEGY_CHOICES = (
+        ('bfs', 'First open slot (breadth-first)'),
+        ('extreme_left', 'Extreme left'),
+        ('extreme_right', 'Extreme right'),
+        ('weaker_leg', 'Weaker leg'),
+        ('balanced', 'Balanced'),
+    )
 
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='mlmnode')
     parent = models.ForeignKey('self', null=True, blank=True, on_delete=models.SET_NULL, related_name='children')
     position = models.CharField(max_length=1, choices=POSITION_CHOICES, null=True, blank=True)
     active = models.BooleanField(default=False)
     created_at = models.DateTimeField(default=timezone.now)
+    placement_strategy = models.CharField(max_length=20, choices=STRATEGY_CHOICES, default='bfs')
+    # Materialized lineage: ids of all ancestors from the root down to the parent,
+    # each followed by PATH_SEP (root => ''). Maintained by save(); 768 characters (~100 levels of
+    # 6-digit ids) is as wide as a utf8mb4 column can be and still be indexed on MySQL.
+    path = models.CharField(max_length=768, blank=True, default='', db_index=True, editable=False)
+    depth = models.PositiveIntegerField(default=0, editable=False)
+    # sales volume: the member's own, and the running totals of everything sold in each leg below them
+    personal_volume = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'), editable=False)
+    left_volume = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'), editable=False)
+    right_volume = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'), editable=False)
+    # leg volume already matched by binary pairing cycles (see mlm.pairing)
+    paired_volume = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'), editable=False)
+    # cached downline statistics (self excluded), kept in step by save() and bulk_place;
+    # `manage.py rebuild_mlm_stats` recomputes them from scratch
+    team_size = models.PositiveIntegerField(default=0, editable=False)
+    active_members = models.PositiveIntegerField(default=0, editable=False)
+    left_count = models.PositiveIntegerField(default=0, editable=False)
+    right_count = models.PositiveIntegerField(default=0, editable=False)
+    max_depth = models.PositiveIntegerField(default=0, editable=False)  # levels below this node
+    # bumped whenever this node or anything below it is placed, moved or (de)activated: conditional GETs
+    subtree_version = models.PositiveBigIntegerField(default=0, editable=False)
+    subtree_changed_at = models.DateTimeField(default=timezone.now, editable=False)
+    # qualification rank from the nightly rank engine (mlm.ranks); '' until first ranked
+    rank = models.CharField(max_length=20, blank=True, default='', db_index=True, editable=False)
+
+    # maintained with set-based UPDATEs only: save() never writes these back from a (possibly stale) instance
+    COUNTER_FIELDS = ('personal_volume', 'left_volume', 'right_volume', 'paired_volume',
+                      'team_size', 'active_members', 'left_count', 'right_count', 'max_depth',
+                      'subtree_version', 'subtree_changed_at', 'rank')
 
     class Meta:
         indexes = [
             models.Index(fields=['parent']),
             models.Index(fields=['active']),
         ]
+        constraints = [
+            # the database, not just clean(), guarantees one node per parent slot
+            models.UniqueConstraint(fields=['parent', 'position'], name='mlm_unique_parent_position'),
+        ]
         ordering = ['-created_at']
 
     def __str__(self):
         return f"MLMNode(user={self.user}, pos={self.position}, parent={self.parent_id})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._remember_lineage()
+        return instance
+
+    def _remember_lineage(self):
+        # snapshot of the lineage as stored in the DB, used by save() to detect re-parenting
+        self._loaded_lineage = (
+            self.__dict__.get('parent_id'),
+            self.__dict__.get('position'),
+            self.__dict__.get('path'),
+            self.__dict__.get('depth'),
+        )
+        self._loaded_active = self.__dict__.get('active')
+
+    def lineage_prefix(self):
+        """Path prefix shared by every node in this node's downline."""
+        return f"{self.path}{self.pk}{PATH_SEP}"
+
+    def ancestor_ids(self):
+        """Ancestor ids nearest first (parent, grandparent, ... root)."""
+        return self._ids_in_path(self.path)
+
+    @staticmethod
+    def _ids_in_path(path):
+        if path is None:
+            return None
+        return [int(part) for part in reversed(path.split(PATH_SEP)) if part]
+
     def clean(self):
         # Ensure position is consistent with parent: parent can't have more than two children
         if self.parent:
-            siblings = self.parent.children.exclude(pk=self.pk)
-            if siblings.count() >= 2:
+            # A node can't be placed under itself or anywhere in its own downline
+            if self.pk and (self.parent_id == self.pk or str(self.pk) in self.parent.path.split(PATH_SEP)):
+                raise ValidationError("Node cannot be placed under its own downline.")
+
+            taken_positions = list(
+                MLMNode.objects.filter(parent_id=self.parent_id).exclude(pk=self.pk).values_list('position', flat=True)
+            )
+            if len(taken_positions) >= 2:
                 raise ValidationError("Parent already has two children.")
 
             # Ensure position is not duplicate
-            if siblings.filter(position=self.position).exists():
+            if self.position in taken_positions:
                 raise ValidationError(f"Position {self.position} is already taken under this parent.")
 
     def save(self, *args, **kwargs):
         self.full_clean()
-        super().save(*args, **kwargs)
+        adding = self._state.adding
+        loaded_parent_id, loaded_position, old_path, old_depth = getattr(
+            self, '_loaded_lineage', (None, None, None, None))
+        loaded_active = getattr(self, '_loaded_active', None)
+        if not adding and (old_path is None or loaded_active is None):
+            # lineage wasn't loaded with this instance (deferred / built by hand): read it back
+            loaded_parent_id, loaded_position, old_path, old_depth, loaded_active = (
+                MLMNode.objects.filter(pk=self.pk)
+                .values_list('parent_id', 'position', 'path', 'depth', 'active').first()
+                or (None, None, None, None, None)
+            )
+        # a side swap under the same parent changes every closure leg/rank and the parent's leg stats too
+        relinked = (adding or old_path is None or self.parent_id != loaded_parent_id
+                    or (self.parent_id is not None and self.position != loaded_position))
+        toggled = self.active != loaded_active
+        if relinked:
+            self._set_lineage()
+            self._check_lineage_length(None if adding else old_path)
+        if not adding and 'update_fields' not in kwargs and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [f.name for f in self._meta.concrete_fields
+                                       if not f.primary_key and f.name not in self.COUNTER_FIELDS]
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if relinked:
+                if adding:
+                    team_size, active_members, max_depth, volume = 0, 0, 0, Decimal('0.00')
+                else:
+                    team_size, active_members, max_depth, volume = MLMNode.objects.filter(pk=self.pk).annotate(
+                        subtree_volume=F('personal_volume') + F('left_volume') + F('right_volume'),
+                    ).values_list('team_size', 'active_members', 'max_depth', 'subtree_volume').get()
+                old_links = list(MLMClosure.ancestors_of(self.pk).values_list('ancestor_id', 'leg')) if old_path else []
+                if old_path is not None and (old_path, old_depth) != (self.path, self.depth):
+                    self._rewrite_downline_paths(f"{old_path}{self.pk}{PATH_SEP}", self.depth - old_depth)
+                MLMClosure.link(self, old_ancestor_ids=None if adding else self._ids_in_path(old_path or ''),
+                                old_parent_id=loaded_parent_id)
+                if old_links:
+                    self._shift_upline_stats(old_links, -1 - team_size, -bool(loaded_active) - active_members,
+                                             volume=-volume)
+                    self._refresh_max_depth([ancestor_id for ancestor_id, _ in old_links])
+                if self.parent_id is not None:
+                    self._shift_upline_stats(list(MLMClosure.ancestors_of(self.pk).values_list('ancestor_id', 'leg')),
+                                             1 + team_size, bool(self.active) + active_members,
+                                             reach=self.depth + max_depth, volume=volume)
+            elif toggled and self.path:
+                MLMNode.objects.filter(pk__in=self.ancestor_ids()).update(
+                    active_members=F('active_members') + (1 if self.active else -1))
+            if relinked or toggled:
+                MLMNode.touch_subtrees([self.pk, *self.ancestor_ids(), *self._ids_in_path(old_path or '')])
+                MLMTreeVersion.bump()
+        self._remember_lineage()
+
+    def move_to(self, new_parent, position=None):
+        """
+        Move this node and its whole downline under `new_parent` at `position` ('L'/'R', or None for
+        the first free side). The slot is validated under a row lock and everything derived from the
+        lineage (paths, closure rows, cached stats, leg volumes, version stamps) is rewritten by
+        save() with set-based statements proportional to the subtree, all in one transaction.
+        Raises ValidationError if the slot is taken or new_parent lies in this node's downline.
+        """
+        if position not in (None, 'L', 'R'):
+            raise ValidationError(f"Invalid position {position!r}.")
+        with transaction.atomic():
+            node = MLMNode.objects.select_for_update().get(pk=self.pk)
+            new_parent = MLMNode.objects.get(pk=new_parent.pk)
+            if new_parent.pk == node.pk or str(node.pk) in new_parent.path.split(PATH_SEP):
+                raise ValidationError("Node cannot be placed under its own downline.")
+            try:
+                position = MLMNode._claim_slot(new_parent, position or 'L', strict=position is not None,
+                                               exclude_pk=node.pk)
+            except PlacementConflict as e:
+                raise ValidationError(str(e))
+            node.parent, node.position = new_parent, position
+            node.save()
+        self.refresh_from_db()
+        self._remember_lineage()
+        return self
+
+    def _set_lineage(self):
+        if self.parent_id is None:
+            self.path, self.depth = '', 0
+            return
+        # read the parent's lineage from the DB so a stale in-memory parent can't corrupt it
+        parent_path, parent_depth = MLMNode.objects.filter(pk=self.parent_id).values_list('path', 'depth').get()
+        self.path = f"{parent_path}{self.parent_id}{PATH_SEP}"
+        self.depth = parent_depth + 1
+
+    def _check_lineage_length(self, old_path):
+        """Raise LineageTooLong if the new path, or a re-rooted downline path, would overflow the column."""
+        limit = self._meta.get_field('path').max_length
+        longest = len(self.path)
+        if old_path is not None:
+            old_prefix = f"{old_path}{self.pk}{PATH_SEP}"
+            deepest = MLMNode.objects.filter(path__startswith=old_prefix).aggregate(n=Max(Length('path')))['n']
+            if deepest:
+                longest = max(longest, deepest - len(old_prefix) + len(self.lineage_prefix()))
+        if longest > limit:
+            raise LineageTooLong(f"Lineage path of {longest} characters exceeds the {limit} allowed; "
+                                 f"the tree is too deep below node {self.parent_id}.")
+
+    def _rewrite_downline_paths(self, old_prefix, depth_delta):
+        """Re-root every descendant path after this node moved (single UPDATE)."""
+        MLMNode.objects.filter(path__startswith=old_prefix).update(
+            path=Concat(Value(self.lineage_prefix()), Substr('path', len(old_prefix) + 1),
+                        output_field=models.CharField()),
+            depth=F('depth') + depth_delta,
+        )
 
     def get_children(self):
         return self.children.all()
 
+    def descendants(self, levels=None):
+        """Queryset of the downline (excluding self), optionally limited to `levels` below this node."""
+        qs = MLMNode.objects.filter(path__startswith=self.lineage_prefix())
+        if levels is not None:
+            qs = qs.filter(depth__lte=self.depth + levels)
+        return qs
+
     def get_upline(self, levels=None):
-        """Return upline nodes up to `levels` (None => all)"""
-        upline = []
-        node = self.parent
-        while node and (levels is None or len(upline) < levels):
-            upline.append(node)
-            node = node.parent
-        return upline
+        """Return upline nodes up to `levels` (None => all), nearest first, in one query"""
+        ids = self.ancestor_ids()
+        if levels is not None:
+            ids = ids[:levels]
+        if not ids:
+            return []
+        nodes = MLMNode.objects.select_related('user').in_bulk(ids)
+        return [nodes[pk] for pk in ids if pk in nodes]
 
     def get_downline(self, levels=1):
-        """BFS downline up to `levels`"""
-        nodes = []
-        queue = [(self, 0)]
-        while queue:
-            node, depth = queue.pop(0)
-            if depth == 0:
-                pass
-            else:
-                nodes.append((node, depth))
-            if depth < levels:
-                for c in node.get_children():
-                    queue.append((c, depth + 1))
-        return nodes
+        """Downline up to `levels` (None => all) in BFS order, as (node, relative_depth) pairs"""
+        qs = self.descendants(levels).select_related('user').order_by('depth', 'path', 'position')
+        return [(node, node.depth - self.depth) for node in qs]
 
     @classmethod
-    def auto_place(cls, new_user_node, start_node=None):
+    def auto_place(cls, new_user_node, start_node=None, strategy=None):
         """
-        Auto placement algorithm (fixed):
-        - Breadth-first traverse from start_node (or root candidates) to find first node with available child slot.
-        - Place in left first then right.
+        Auto placement algorithm:
+        - The slot below start_node (or the oldest root) is chosen by `strategy`, defaulting to
+          start_node.placement_strategy (see mlm.placement).
+        - Default 'bfs': first free slot in breadth-first order, left before right, from the persisted
+          open-slot frontier in MLMClosure (one indexed lookup); the legacy tree walk is only used if
+          the frontier has no entry for start_node.
         - Never consider `new_user_node` itself as a candidate parent (prevents self-parenting).
+        - Concurrency: the chosen parent row is locked (SELECT ... FOR UPDATE) and its free slots re-read
+          before writing; if a parallel signup claimed the slot the lookup is retried.
         - Returns (parent_node_or_None, position_or_None).
         """
         # If the node is not saved yet, it has no pk; that's fine.
         new_pk = getattr(new_user_node, 'pk', None)
 
         if start_node is None:
-            # find root candidates (nodes with no parent) ordered by created_at,
-            # but exclude the node being placed (if it already exists in DB).
+            # oldest root, excluding the node being placed (if it already exists in DB).
             qs = cls.objects.filter(parent__isnull=True).order_by('created_at')
             if new_pk is not None:
                 qs = qs.exclude(pk=new_pk)
-            candidates = qs
-            if not candidates.exists():
+            start_node = qs.first()
+            if start_node is None:
                 # If no other nodes exist, place as root (no parent, position null)
                 new_user_node.parent = None
                 new_user_node.position = None
                 new_user_node.save()
                 return None, None
-            start_node = candidates.first()
 
-        # BFS over tree, but never treat node equal to new_user_node as parent
-        queue = [start_node]
+        from .placement import get_strategy
+        strategy = strategy or start_node.placement_strategy
+        find_slot = get_strategy(strategy)
+        adding = new_user_node._state.adding
+        last_error = None
+        for attempt in range(PLACEMENT_RETRIES):
+            parent, position = find_slot(start_node, exclude_pk=new_pk)
+            try:
+                with transaction.atomic():
+                    if parent is not None:
+                        # only BFS may fall back to the sibling slot; the other strategies mean their side
+                        position = cls._claim_slot(parent, position, strict=strategy != 'bfs')
+                    # if no slot was found parent/position are None and the node becomes a root
+                    new_user_node.parent = parent
+                    new_user_node.position = position
+                    new_user_node.save()
+                return parent, position
+            except LineageTooLong:
+                raise  # retrying can't make the tree shallower
+            except (PlacementConflict, IntegrityError, OperationalError, ValidationError) as e:
+                # rolled back: restore the in-memory state and retry against the refreshed frontier
+                last_error = e
+                new_user_node.pk = new_pk
+                new_user_node._state.adding = adding
+                start_node.refresh_from_db(fields=['left_count', 'right_count'])
+                time.sleep(random.uniform(0, PLACEMENT_BACKOFF * (attempt + 1)))
+        raise ValidationError(f"Could not place node after {PLACEMENT_RETRIES} attempts: {last_error}")
+
+    @classmethod
+    def _claim_slot(cls, parent, position, strict=False, exclude_pk=None):
+        """
+        Lock `parent` and return `position` (or, unless `strict`, the other side) if still free;
+        must run in a transaction. The slot held by `exclude_pk` (a node moving sides) counts as free.
+        """
+        list(cls.objects.select_for_update().filter(pk=parent.pk).values_list('pk', flat=True))
+        taken_positions = set(cls.objects.select_for_update().filter(parent_id=parent.pk).exclude(pk=exclude_pk)
+                              .values_list('position', flat=True))
+        for candidate in ((position,) if strict else (position, 'L', 'R')):
+            if candidate not in taken_positions:
+                return candidate
+        raise PlacementConflict(f"Node {parent.pk} has no free slot left.")
+
+    @classmethod
+    def find_open_slot(cls, start_node, exclude_pk=None):
+        """
+        First (parent, position) with a free slot in BFS left-first order below start_node, via the frontier.
+        Neither `exclude_pk` nor anything in its downline is a candidate (a placed node being re-placed).
+        """
+        frontier = MLMClosure.objects.filter(ancestor_id=start_node.pk, open=True)
+        if exclude_pk is not None:
+            # the self row (depth 0) covers exclude_pk itself
+            frontier = frontier.exclude(
+                descendant_id__in=MLMClosure.objects.filter(ancestor_id=exclude_pk).values('descendant_id'))
+        parent_id = frontier.order_by('depth', 'rank').values_list('descendant_id', flat=True).first()
+        if parent_id is None:
+            return None, None
+        parent = start_node if parent_id == start_node.pk else cls.objects.get(pk=parent_id)
+        taken_positions = set(cls.objects.filter(parent_id=parent_id).values_list('position', flat=True))
+        if 'L' not in taken_positions:
+            return parent, 'L'
+        if 'R' not in taken_positions:
+            return parent, 'R'
+        return None, None
+
+    @classmethod
+    def _bfs_open_slot(cls, start_node, exclude_pk=None):
+        """Reference tree walk (one children query per visited node) with the same semantics as find_open_slot."""
+        queue = deque([start_node])
         visited = set()
         while queue:
-            node = queue.pop(0)
-            if node.pk == new_pk:
-                # skip the node if it's the same as the node we're placing
-                continue
-            # guard against accidental cycles
-            if node.pk in visited:
+            node = queue.popleft()
+            # never treat the node being placed as a parent, and guard against accidental cycles
+            if node.pk == exclude_pk or node.pk in visited:
                 continue
             visited.add(node.pk)
 
-            children = list(node.get_children())
+            children = sorted(node.get_children(), key=lambda c: c.position or '')
             taken_positions = {c.position for c in children if c.position}
             if 'L' not in taken_positions:
-                new_user_node.parent = node
-                new_user_node.position = 'L'
-                new_user_node.save()
                 return node, 'L'
             if 'R' not in taken_positions:
-                new_user_node.parent = node
-                new_user_node.position = 'R'
-                new_user_node.save()
                 return node, 'R'
-            # enqueue children for BFS
+            # enqueue children for BFS, left leg first
             queue.extend(children)
-
-        # fallback: make it a root (if no slot found)
-        new_user_node.parent = None
-        new_user_node.position = None
-        new_user_node.save()
         return None, None
 
+    @classmethod
+    def add_sale_volume(cls, node_id, amount):
+        """
+        Record a sale of `amount` made by node_id: its personal volume grows, and so does the
+        left/right leg volume of every ancestor on the side the sale came from. The ancestry is
+        read once from the closure table and all counters move in a single UPDATE.
+        """
+        amount = Decimal(str(amount))
+        links = list(MLMClosure.objects.filter(descendant_id=node_id).values_list('ancestor_id', 'leg'))
+        left = [ancestor_id for ancestor_id, leg in links if leg == 'L']
+        right = [ancestor_id for ancestor_id, leg in links if leg == 'R']
+        volume = models.DecimalField(max_digits=14, decimal_places=2)
+        return cls.objects.filter(pk__in=[node_id, *left, *right]).update(
+            personal_volume=Case(When(pk=node_id, then=F('personal_volume') + amount),
+                                 default=F('personal_volume'), output_field=volume),
+            left_volume=Case(When(pk__in=left, then=F('left_volume') + amount),
+                             default=F('left_volume'), output_field=volume),
+            right_volume=Case(When(pk__in=right, then=F('right_volume') + amount),
+                              default=F('right_volume'), output_field=volume),
+        )
+
+    @classmethod
+    def _shift_upline_stats(cls, links, size, active, reach=None, volume=None):
+        """
+        Add a subtree of `size` nodes (`active` of them active; negative to remove it) to every
+        ancestor in `links` [(ancestor_id, leg), ...] in one UPDATE. `reach` is the absolute
+        depth of the subtree's deepest node, used to raise the ancestors' max_depth; a non-zero
+        `volume` (the subtree's total sales) moves the matching leg volumes too.
+        """
+        left = [ancestor_id for ancestor_id, leg in links if leg == 'L']
+        right = [ancestor_id for ancestor_id, leg in links if leg == 'R']
+        counter = models.PositiveIntegerField()
+        changes = {
+            'team_size': F('team_size') + size,
+            'active_members': F('active_members') + active,
+            'left_count': Case(When(pk__in=left, then=F('left_count') + size),
+                               default=F('left_count'), output_field=counter),
+            'right_count': Case(When(pk__in=right, then=F('right_count') + size),
+                                default=F('right_count'), output_field=counter),
+        }
+        if reach is not None:
+            changes['max_depth'] = Greatest(F('max_depth'), Value(reach) - F('depth'), output_field=counter)
+        if volume:
+            amount = models.DecimalField(max_digits=14, decimal_places=2)
+            changes['left_volume'] = Case(When(pk__in=left, then=F('left_volume') + volume),
+                                          default=F('left_volume'), output_field=amount)
+            changes['right_volume'] = Case(When(pk__in=right, then=F('right_volume') + volume),
+                                           default=F('right_volume'), output_field=amount)
+        return cls.objects.filter(pk__in=[*left, *right]).update(**changes)
+
+    @classmethod
+    def touch_subtrees(cls, node_ids):
+        """Bump subtree_version / subtree_changed_at of the given nodes (one UPDATE per 1000 ids)."""
+        node_ids = list(set(node_ids))
+        now = timezone.now()
+        for i in range(0, len(node_ids), 1000):
+            cls.objects.filter(pk__in=node_ids[i:i + 1000]).update(
+                subtree_version=F('subtree_version') + 1, subtree_changed_at=now)
+
+    @classmethod
+    def _refresh_max_depth(cls, node_ids):
+        """Recompute max_depth of the given nodes from the closure table (after part of their downline left)."""
+        heights = dict(MLMClosure.objects.filter(ancestor_id__in=node_ids).values('ancestor_id')
+                       .annotate(height=Max('depth')).values_list('ancestor_id', 'height'))
+        cls.objects.filter(pk__in=node_ids).update(max_depth=Case(
+            *[When(pk=pk, then=Value(heights.get(pk, 0))) for pk in node_ids],
+            default=F('max_depth'), output_field=models.PositiveIntegerField(),
+        ))
+
+    @property
+    def carry_left(self):
+        return self.left_volume - self.paired_volume
+
+    @property
+    def carry_right(self):
+        return self.right_volume - self.paired_volume
 
     def left_child(self):
         return self.children.filter(position='L').first()
 
     def right_child(self):
         return self.children.filter(position='R').first()
+
+
+class MLMClosure(models.Model):
+    """
+    Ancestor/descendant closure of the binary tree: one row per (ancestor, descendant)
+    pair, including a depth-0 self row per node. `leg` is the side of `ancestor` the
+    descendant hangs from (null on self rows). Maintained by MLMNode.save(); use
+    `manage.py rebuild_mlm_closure` to (re)build it, frontier included, for existing trees.
+
+    The rows flagged `open` (descendant still has a free L/R slot) form the placement
+    frontier of every ancestor: ordered by (depth, rank) they are exactly the BFS
+    left-first order below that ancestor, so auto_place is a single index lookup.
+    """
+    ancestor = models.ForeignKey(MLMNode, on_delete=models.CASCADE, related_name='descendant_links')
+    descendant = models.ForeignKey(MLMNode, on_delete=models.CASCADE, related_name='ancestor_links')
+    depth = models.PositiveIntegerField()
+    leg = models.CharField(max_length=1, choices=MLMNode.POSITION_CHOICES, null=True, blank=True)
+    # left-to-right order of descendant among the ancestor's descendants at this depth (L=0, R=1 bits)
+    rank = models.BigIntegerField(default=0)
+    open = models.BooleanField(default=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['ancestor', 'descendant'], name='mlm_closure_unique_pair'),
+        ]
+        indexes = [
+            models.Index(fields=['ancestor', 'depth']),
+            models.Index(fields=['descendant', 'depth']),
+            models.Index(fields=['ancestor', 'open', 'depth', 'rank'], name='mlm_closure_frontier_idx'),
+        ]
+
+    def __str__(self):
+        return f"MLMClosure({self.ancestor_id} -> {self.descendant_id}, depth={self.depth}, leg={self.leg})"
+
+    @classmethod
+    def is_in_downline(cls, node_id, ancestor_id):
+        return cls.objects.filter(ancestor_id=ancestor_id, descendant_id=node_id, depth__gt=0).exists()
+
+    @classmethod
+    def ancestors_of(cls, node_id, levels=None):
+        """Closure rows for the ancestors of `node_id`, nearest first."""
+        qs = cls.objects.filter(descendant_id=node_id, depth__gt=0)
+        if levels is not None:
+            qs = qs.filter(depth__lte=levels)
+        return qs.order_by('depth')
+
+    @staticmethod
+    def route_rank(up_rank, position, down_depth, down_rank, depth):
+        """Rank of a descendant reached via `position` then a `down_depth`-deep route ranked `down_rank`."""
+        if depth > RANK_BITS:
+            return RANK_MAX
+        return (((up_rank << 1) | (position == 'R')) << down_depth) | down_rank
+
+    @classmethod
+    def link(cls, node, old_ancestor_ids=None, old_parent_id=None):
+        """
+        Attach `node` (and its whole downline) under its current parent.
+        `old_ancestor_ids` is the upline the node was detached from, or None for a new node.
+        """
+        if old_ancestor_ids is None:
+            cls.objects.create(ancestor=node, descendant=node, depth=0)
+        elif old_ancestor_ids:
+            cls.objects.filter(
+                Q(descendant=node) | Q(descendant__path__startswith=node.lineage_prefix()),
+                ancestor_id__in=old_ancestor_ids,
+            ).delete()
+
+        if node.parent_id is not None:
+            upline = list(cls.objects.filter(descendant_id=node.parent_id)
+                          .values_list('ancestor_id', 'depth', 'leg', 'rank'))
+            subtree = list(cls.objects.filter(ancestor=node).values_list('descendant_id', 'depth', 'rank', 'open'))
+            rows = []
+            for ancestor_id, up_depth, leg, up_rank in upline:
+                for descendant_id, down_depth, down_rank, is_open in subtree:
+                    depth = up_depth + 1 + down_depth
+                    rows.append(cls(
+                        ancestor_id=ancestor_id, descendant_id=descendant_id, depth=depth,
+                        leg=leg if up_depth else node.position,
+                        rank=cls.route_rank(up_rank, node.position, down_depth, down_rank, depth),
+                        open=is_open,
+                    ))
+            cls.objects.bulk_create(rows, batch_size=1000)
+
+        cls.refresh_open(node.parent_id, old_parent_id)
+
+    @classmethod
+    def refresh_open(cls, *node_ids):
+        """Recompute the frontier flag of the given nodes from their current child count."""
+        for node_id in {pk for pk in node_ids if pk is not None}:
+            is_open = MLMNode.objects.filter(parent_id=node_id).count() < 2
+            cls.objects.filter(descendant_id=node_id).exclude(open=is_open).update(open=is_open)
+
+    @classmethod
+    def rebuild(cls, batch_size=5000):
+        """Rebuild the whole closure from MLMNode parent links. Returns the number of rows written."""
+        children = {}
+        roots = []
+        for pk, parent_id, position in MLMNode.objects.values_list('id', 'parent_id', 'position').iterator():
+            if parent_id is None:
+                roots.append(pk)
+            else:
+                children.setdefault(parent_id, []).append((pk, position))
+
+        written = 0
+        batch = []
+        with transaction.atomic():
+            cls.objects.all().delete()
+            # iterative DFS carrying the current upline as [(ancestor_id, leg taken from it), ...]
+            stack = [(pk, ()) for pk in roots]
+            while stack:
+                pk, upline = stack.pop()
+                is_open = len(children.get(pk, ())) < 2
+                batch.append(cls(ancestor_id=pk, descendant_id=pk, depth=0, open=is_open))
+                rank = 0
+                for distance, (ancestor_id, leg) in enumerate(reversed(upline), start=1):
+                    rank = rank | ((leg == 'R') << (distance - 1)) if distance <= RANK_BITS else RANK_MAX
+                    batch.append(cls(ancestor_id=ancestor_id, descendant_id=pk, depth=distance, leg=leg,
+                                     rank=rank, open=is_open))
+                for child, position in children.get(pk, ()):
+                    stack.append((child, upline + ((pk, position),)))
+                if len(batch) >= batch_size:
+                    cls.objects.bulk_create(batch, batch_size=batch_size)
+                    written += len(batch)
+                    batch = []
+            if batch:
+                cls.objects.bulk_create(batch, batch_size=batch_size)
+                written += len(batch)
+        return written
+
+
+class MLMTreeVersion(models.Model):
+    """
+    Single-row placement counter. Bumped whenever the tree shape or a node's active flag
+    changes; `stamp` is a fresh random token per bump so process-local caches keyed on it
+    (see mlm.snapshot) can never mistake a rolled-back change for the current tree.
+    """
+    version = models.BigIntegerField(default=0)
+    stamp = models.CharField(max_length=32, default='')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"MLMTreeVersion({self.version}, {self.stamp[:8]})"
+
+    @classmethod
+    def current(cls):
+        stamp = cls.objects.filter(pk=1).values_list('stamp', flat=True).first()
+        if stamp is None:
+            stamp = cls.objects.get_or_create(pk=1, defaults={'stamp': uuid.uuid4().hex})[0].stamp
+        return stamp
+
+    @classmethod
+    def bump(cls):
+        if not cls.objects.filter(pk=1).update(version=F('version') + 1, stamp=uuid.uuid4().hex,
+                                               updated_at=timezone.now()):
+            cls.objects.get_or_create(pk=1, defaults={'version': 1, 'stamp': uuid.uuid4().hex})
+
+
+class PlacementJob(models.Model):
+    """
+    A signup waiting for asynchronous placement (MLM_ASYNC_PLACEMENT). Jobs are drained in
+    arrival (id) order by mlm.tasks.place_pending_nodes; `token` lets the signup page poll.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_PLACED = 'placed'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_PLACED, 'Placed'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    node = models.OneToOneField(MLMNode, on_delete=models.CASCADE, related_name='placement_job')
+    sponsor_code = models.CharField(max_length=12, blank=True, null=True)
+    token = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'id'])]
+
+    def __str__(self):
+        return f"PlacementJob(node={self.node_id}, {self.status})"
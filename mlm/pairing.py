@@ -0,0 +1,93 @@
+# mlm/pairing.py
+"""
+Batch binary pairing for a payout cycle.
+
+Leg volumes are cumulative (personal sales summed over each leg); every node remembers
+how much of it was already matched in `paired_volume`. A cycle pays
+
+    pair = min(left leg, right leg) - paired_volume
+
+at COMMISSION_BINARY_RATE (optionally capped per cycle by MLM_BINARY_PAIRING_CAP),
+then advances paired_volume by the full pair. Whatever is left on the stronger leg
+(left/right volume - paired_volume) is the carry-forward into the next cycle; volume
+above the cap is flushed.
+"""
+import time
+from decimal import Decimal, ROUND_DOWN
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from commissions.models import Commission
+from .arrays import TreeArrays, np
+from .models import MLMNode, MLMTreeVersion
+
+BINARY_RATE = getattr(settings, 'COMMISSION_BINARY_RATE', 0.05)
+PAIRING_CAP = getattr(settings, 'MLM_BINARY_PAIRING_CAP', None)
+PAIRING_SOURCE = 'binary_pairing'
+
+
+def cycle_reference(label):
+    return f"binary-cycle:{label}"
+
+
+def to_cents(value):
+    return int((Decimal(value or 0) * 100).to_integral_value(rounding=ROUND_DOWN))
+
+
+def run_binary_cycle(label=None, rate=None, cap=None, dry_run=False, batch_size=2000):
+    """
+    Compute pairing for every node and write the cycle's commissions with bulk_create.
+    Returns a stats dict; a label that was already paid is reported and left untouched.
+    """
+    started = time.monotonic()
+    label = label or timezone.now().strftime('%G-W%V')
+    reference = cycle_reference(label)
+    rate = Decimal(str(BINARY_RATE if rate is None else rate))
+    cap = PAIRING_CAP if cap is None else cap
+    cap_cents = to_cents(cap) if cap not in (None, '') else None
+
+    stats = {'label': label, 'nodes': 0, 'paired_nodes': 0, 'total': Decimal('0.00'), 'already_run': False}
+    MLMTreeVersion.current()  # make sure the lock row exists
+    with transaction.atomic():
+        # serialise cycles on the version row (like the drain and activation jobs), then re-check the label
+        list(MLMTreeVersion.objects.select_for_update().filter(pk=1).values_list('pk', flat=True))
+        if Commission.objects.filter(sale_reference=reference, source=PAIRING_SOURCE).exists():
+            stats['already_run'] = True
+            return stats
+
+        tree = TreeArrays.load('user_id', 'personal_volume', 'paired_volume')
+        personal = [to_cents(v) for v in tree.columns['personal_volume']]
+        paired = [to_cents(v) for v in tree.columns['paired_volume']]
+        left, right = tree.leg_totals(tree.subtree_sums(personal))
+
+        if np is not None and len(tree):
+            pairs = np.minimum(left, right) - np.asarray(paired, dtype=np.int64)
+            matched = np.nonzero(pairs > 0)[0].tolist()
+            pairs = pairs.tolist()
+        else:
+            pairs = [min(l, r) - p for l, r, p in zip(left, right, paired)]
+            matched = [i for i, pair in enumerate(pairs) if pair > 0]
+
+        commissions, updates = [], []
+        for i in matched:
+            paid_cents = pairs[i] if cap_cents is None else min(pairs[i], cap_cents)
+            amount = (Decimal(paid_cents) / 100 * rate).quantize(Decimal('0.01'), rounding=ROUND_DOWN)
+            updates.append(MLMNode(pk=tree.ids[i], paired_volume=Decimal(paired[i] + pairs[i]) / 100))
+            if amount > 0:
+                stats['total'] += amount
+                commissions.append(Commission(
+                    telemarketer_id=tree.columns['user_id'][i],
+                    amount=amount,
+                    source=PAIRING_SOURCE,
+                    sale_reference=reference,
+                ))
+
+        stats['nodes'] = len(tree)
+        stats['paired_nodes'] = len(commissions)
+        if not dry_run:
+            Commission.objects.bulk_create(commissions, batch_size=batch_size)
+            MLMNode.objects.bulk_update(updates, ['paired_volume'], batch_size=batch_size)
+
+    stats['elapsed'] = time.monotonic() - started
+    return stats
@@ -0,0 +1,91 @@
+# mlm/placement.py
+"""
+Pluggable spillover strategies for MLMNode.auto_place.
+
+A strategy is a callable (start_node, exclude_pk=None) -> (parent, position) returning a free
+slot below start_node, or (None, None) when it finds none. Register new ones with
+@register_strategy('name'); a sponsor picks one via MLMNode.placement_strategy.
+
+Apart from 'bfs' (the persisted frontier), the strategies walk down from the sponsor one
+level at a time, steering with the cached left_count/right_count of each node: O(depth)
+indexed child lookups, never a scan of the subtree.
+"""
+from .models import MLMNode
+
+STRATEGIES = {}
+
+
+def register_strategy(name):
+    def decorator(func):
+        STRATEGIES[name] = func
+        return func
+    return decorator
+
+
+def get_strategy(name):
+    try:
+        return STRATEGIES[name]
+    except KeyError:
+        raise ValueError(f"Unknown placement strategy {name!r} (known: {', '.join(sorted(STRATEGIES))})")
+
+
+def _children(node_id):
+    """{position: (pk, left_count, right_count)} for node_id's children (one indexed query)."""
+    return {
+        position: (pk, left_count, right_count)
+        for pk, position, left_count, right_count in MLMNode.objects.filter(parent_id=node_id)
+        .values_list('pk', 'position', 'left_count', 'right_count')
+    }
+
+
+def _walk(start_node, choose, exclude_pk=None):
+    """
+    Descend from start_node: at each node `choose(left_count, right_count)` picks the side to
+    go; the first node whose chosen side is free receives the new member there. The walk never
+    enters `exclude_pk` (a placed node being re-placed, whose downline can't take it) and goes
+    to the other side instead.
+    """
+    node_id, counts = start_node.pk, (start_node.left_count, start_node.right_count)
+    while True:
+        position = choose(*counts)
+        children = _children(node_id)
+        if exclude_pk is not None and children.get(position, (None,))[0] == exclude_pk:
+            position = 'R' if position == 'L' else 'L'
+        if position not in children:
+            return (start_node if node_id == start_node.pk else MLMNode.objects.get(pk=node_id)), position
+        node_id, left_count, right_count = children[position]
+        counts = (left_count, right_count)
+
+
+@register_strategy('bfs')
+def first_open_slot(start_node, exclude_pk=None):
+    """First free slot in breadth-first, left-first order (the historical behaviour)."""
+    parent, position = MLMNode.find_open_slot(start_node, exclude_pk=exclude_pk)
+    if parent is None:
+        parent, position = MLMNode._bfs_open_slot(start_node, exclude_pk=exclude_pk)
+    return parent, position
+
+
+@register_strategy('extreme_left')
+def extreme_left(start_node, exclude_pk=None):
+    """Bottom of the sponsor's outer left line."""
+    return _walk(start_node, lambda left, right: 'L', exclude_pk)
+
+
+@register_strategy('extreme_right')
+def extreme_right(start_node, exclude_pk=None):
+    """Bottom of the sponsor's outer right line."""
+    return _walk(start_node, lambda left, right: 'R', exclude_pk)
+
+
+@register_strategy('weaker_leg')
+def weaker_leg(start_node, exclude_pk=None):
+    """Into the sponsor's leg with fewer members (left on ties), then down that leg's outer line."""
+    side = 'L' if start_node.left_count <= start_node.right_count else 'R'
+    return _walk(start_node, lambda left, right: side, exclude_pk)
+
+
+@register_strategy('balanced')
+def balanced(start_node, exclude_pk=None):
+    """At every level go to the side with fewer members (left on ties), keeping both legs even."""
+    return _walk(start_node, lambda left, right: 'L' if left <= right else 'R', exclude_pk)
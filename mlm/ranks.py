@@ -0,0 +1,97 @@
+# mlm/ranks.py
+"""
+Bulk rank qualification over the whole tree.
+
+MLM_RANK_RULES lists the ranks from lowest to highest; a member holds the highest rank
+whose thresholds they all meet:
+
+    personal_volume  own sales volume
+    team_volume      sales volume of the whole downline (both legs, self excluded)
+    active_legs      legs (0-2) with at least one active member
+    leg_rank         name of a lower rank held by someone in *each* leg
+
+`leg_rank` depends on the ranks below a member, so ranks are settled in one bottom-up
+pass (deepest members first) over TreeArrays, carrying the best rank found in each subtree.
+"""
+import time
+from django.conf import settings
+from django.db import transaction
+
+from .arrays import TreeArrays, NONE, np
+from .models import MLMNode
+from .pairing import to_cents
+
+DEFAULT_RANK_RULES = [
+    {'name': 'member'},
+    {'name': 'bronze', 'personal_volume': 100},
+    {'name': 'silver', 'personal_volume': 100, 'team_volume': 1000, 'active_legs': 2},
+    {'name': 'gold', 'personal_volume': 100, 'team_volume': 10000, 'active_legs': 2, 'leg_rank': 'silver'},
+]
+RANK_RULES = getattr(settings, 'MLM_RANK_RULES', None) or DEFAULT_RANK_RULES
+RULE_KEYS = {'name', 'personal_volume', 'team_volume', 'active_legs', 'leg_rank'}
+
+
+def compile_rules(rules):
+    """Rank names and (personal cents, team cents, active legs, leg rank index or -1) per rule; ValueError if malformed."""
+    names, compiled = [], []
+    for rule in rules:
+        unknown = set(rule) - RULE_KEYS
+        if unknown or not rule.get('name'):
+            raise ValueError(f"bad rank rule {rule!r}: needs a name, unknown keys {sorted(unknown)}")
+        if rule['name'] in names:
+            raise ValueError(f"duplicate rank {rule['name']!r}")
+        leg_rank = rule.get('leg_rank')
+        if leg_rank is not None and leg_rank not in names:
+            raise ValueError(f"rank {rule['name']!r}: leg_rank {leg_rank!r} must name a lower rank")
+        names.append(rule['name'])
+        compiled.append((to_cents(rule.get('personal_volume')), to_cents(rule.get('team_volume')),
+                         int(rule.get('active_legs') or 0), names.index(leg_rank) if leg_rank is not None else -1))
+    return names, compiled
+
+
+def run_rank_engine(rules=None, dry_run=False, batch_size=2000):
+    """
+    Evaluate the rank rules for every node and write the ranks that changed with bulk_update.
+    Returns {'nodes', 'changed', 'ranks': {name: count}, 'elapsed'}.
+    """
+    started = time.monotonic()
+    names, compiled = compile_rules(rules if rules is not None else RANK_RULES)
+
+    with transaction.atomic():
+        tree = TreeArrays.load('personal_volume', 'active', 'rank')
+        personal = [to_cents(v) for v in tree.columns['personal_volume']]
+        left_volume, right_volume = tree.leg_totals(tree.subtree_sums(personal))
+        left_active, right_active = tree.leg_totals(tree.subtree_sums([int(a) for a in tree.columns['active']]))
+        if np is not None and len(tree):
+            team = (left_volume + right_volume).tolist()
+            legs = ((left_active > 0).astype(np.int64) + (right_active > 0)).tolist()
+        else:
+            team = [l + r for l, r in zip(left_volume, right_volume)]
+            legs = [(l > 0) + (r > 0) for l, r in zip(left_active, right_active)]
+
+        order, _ = tree.bfs_order()
+        rank = [-1] * len(tree)
+        best = [-1] * len(tree)  # best rank anywhere in the subtree, self included
+        for i in reversed(order):
+            left, right = tree.left[i], tree.right[i]
+            best_left = best[left] if left != NONE else -1
+            best_right = best[right] if right != NONE else -1
+            for k in range(len(compiled) - 1, -1, -1):
+                min_personal, min_team, min_legs, leg_rank = compiled[k]
+                if (personal[i] >= min_personal and team[i] >= min_team and legs[i] >= min_legs
+                        and min(best_left, best_right) >= leg_rank):
+                    rank[i] = k
+                    break
+            best[i] = max(rank[i], best_left, best_right)
+
+        current = tree.columns['rank']
+        updates = [MLMNode(pk=tree.ids[i], rank=names[r] if r >= 0 else '')
+                   for i, r in enumerate(rank) if (names[r] if r >= 0 else '') != current[i]]
+        if not dry_run:
+            MLMNode.objects.bulk_update(updates, ['rank'], batch_size=batch_size)
+
+    counts = dict.fromkeys(names, 0)
+    for r in rank:
+        if r >= 0:
+            counts[names[r]] += 1
+    return {'nodes': len(tree), 'changed': len(updates), 'ranks': counts, 'elapsed': time.monotonic() - started}
@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from django.conf import settings
+from django.db.models import Prefetch
 from .models import MLMNode
 
 User = settings.AUTH_USER_MODEL
@@ -11,16 +12,34 @@ class MLMNodeSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = MLMNode
-        fields = ['id', 'user', 'user_display', 'parent', 'position', 'active', 'created_at', 'left', 'right']
+        fields = ['id', 'user', 'user_display', 'parent', 'position', 'active', 'created_at', 'left', 'right',
+                  'team_size', 'active_members', 'left_count', 'right_count', 'max_depth']
+
+    @staticmethod
+    def prefetch(queryset):
+        """Eager-load what the serializer reads: users and children (with their users) in two extra queries total."""
+        return queryset.select_related('user').prefetch_related(
+            Prefetch('children', queryset=MLMNode.objects.select_related('user'))
+        )
 
     def get_left(self, obj):
-        left = obj.left_child()
-        if not left:
-            return None
-        return {'id': left.id, 'user': str(left.user), 'active': left.active}
+        return self._child(obj, 'L')
 
     def get_right(self, obj):
-        right = obj.right_child()
-        if not right:
+        return self._child(obj, 'R')
+
+    def _child(self, obj, position):
+        # views pass the process-local tree snapshot (mlm.snapshot) plus the usernames they need
+        snapshot = self.context.get('snapshot')
+        if snapshot is not None:
+            child = snapshot.child(obj.pk, position)
+            if not child:
+                return None
+            return {'id': child['id'], 'user': self.context['users'][child['user_id']], 'active': child['active']}
+        if 'children' in getattr(obj, '_prefetched_objects_cache', {}):
+            child = next((c for c in obj.children.all() if c.position == position), None)
+        else:
+            child = obj.left_child() if position == 'L' else obj.right_child()
+        if not child:
             return None
-        return {'id': right.id, 'user': str(right.user), 'active': right.active}
+        return {'id': child.id, 'user': str(child.user), 'active': child.active}
@@ -0,0 +1,294 @@
+# mlm/services.py
+from collections import deque
+from django.conf import settings
+from django.core.cache import cache
+from django.contrib.auth import get_user_model
+from django.db import transaction, DatabaseError
+from django.core.exceptions import ValidationError
+from django.utils import timezone
+from django.db.models import Count, F, Value
+from django.db.models.functions import Greatest
+
+from .arrays import TreeArrays, NONE
+from .models import (MLMNode, MLMClosure, MLMTreeVersion, PlacementJob, LineageTooLong, PATH_SEP, RANK_BITS,
+                     RANK_MAX)
+
+STAT_FIELDS = ('team_size', 'active_members', 'left_count', 'right_count', 'max_depth')
+# pending signups placed per transaction by drain_placement_queue
+PLACEMENT_BATCH_SIZE = getattr(settings, 'MLM_PLACEMENT_BATCH_SIZE', 500)
+# seconds a per-level report stays cached (entries are keyed on subtree_version, so never stale)
+LEVEL_REPORT_TTL = getattr(settings, 'MLM_LEVEL_REPORT_TTL', 24 * 3600)
+
+User = get_user_model()
+
+
+def bulk_place(members, batch_size=1000):
+    """
+    Place many users in one transaction (mass enrollment / roster imports).
+
+    `members` is an iterable of (user_id, sponsor_code_or_None) in arrival order. Every
+    placement is computed in memory against a single snapshot of the tree as the first
+    free slot in BFS left-first order below the sponsor (or below the oldest root when
+    there is no valid sponsor), which is what MLMNode.auto_place does for 'bfs' sponsors.
+    Nodes, lineage paths and closure/frontier rows are then written with bulk_create/bulk_update.
+
+    Users whose node is already placed (has a parent or a downline) are skipped. Raises
+    ValidationError (and writes nothing) if a member would land below a sponsor with another
+    placement_strategy: those go through auto_place one at a time, as drain_placement_queue does.
+    Returns {'placed': [(user_id, node_id, parent_id, position), ...], 'created': n, 'skipped': [user_id, ...]}.
+    """
+    members = [(int(user_id), code or None) for user_id, code in members]
+    user_ids = list(dict.fromkeys(user_id for user_id, _ in members))
+
+    with transaction.atomic():
+        # 1. make sure every member has a node (bulk, no signals), with its closure self row
+        existing = set(MLMNode.objects.filter(user_id__in=user_ids).values_list('user_id', flat=True))
+        missing = [MLMNode(user_id=user_id) for user_id in user_ids if user_id not in existing]
+        MLMNode.objects.bulk_create(missing, batch_size=batch_size)
+        created_ids = list(MLMNode.objects.filter(user_id__in=[n.user_id for n in missing]).values_list('id', flat=True))
+        MLMClosure.objects.bulk_create(
+            [MLMClosure(ancestor_id=pk, descendant_id=pk, depth=0) for pk in created_ids], batch_size=batch_size
+        )
+
+        # 2. one snapshot of the whole tree
+        node_of_user, parent, position, path, depth, created = {}, {}, {}, {}, {}, {}
+        children, active, strategy = {}, {}, {}
+        for pk, user_id, parent_id, pos, node_path, node_depth, created_at, is_active, node_strategy in (
+                MLMNode.objects.values_list('id', 'user_id', 'parent_id', 'position', 'path', 'depth', 'created_at',
+                                            'active', 'placement_strategy').iterator()):
+            node_of_user[user_id] = pk
+            active[pk], strategy[pk] = is_active, node_strategy
+            parent[pk], position[pk], path[pk], depth[pk], created[pk] = parent_id, pos, node_path, node_depth, created_at
+            if parent_id is not None:
+                children.setdefault(parent_id, {})[pos] = pk
+        codes = {code for _, code in members if code}
+        sponsor_user = dict(User.objects.filter(referral_code__in=codes).values_list('referral_code', 'id'))
+
+        def is_unplaced(pk):
+            return parent[pk] is None and not children.get(pk)
+
+        # members without a valid sponsor go below the oldest root, like auto_place without start_node
+        member_nodes = {node_of_user[user_id] for user_id in user_ids}
+        roots = [pk for pk in parent if parent[pk] is None and not (pk in member_nodes and is_unplaced(pk))]
+        default_root = min(roots, key=lambda pk: (created[pk], pk), default=None)
+        cursors = {}
+
+        def free_slots(start):
+            # BFS left-first over the live in-memory tree; re-checks the head after every placement
+            queue = deque([start])
+            while queue:
+                node = queue[0]
+                taken = children.get(node, {})
+                if 'L' not in taken:
+                    yield node, 'L'
+                elif 'R' not in taken:
+                    yield node, 'R'
+                else:
+                    queue.popleft()
+                    queue.extend((taken['L'], taken['R']))
+
+        # 3. compute placements in arrival order
+        path_limit = MLMNode._meta.get_field('path').max_length
+        placed, skipped, seen = [], [], set()
+        for user_id, code in members:
+            pk = node_of_user[user_id]
+            if pk in seen or not is_unplaced(pk):
+                skipped.append(user_id)
+                continue
+            seen.add(pk)
+            start = node_of_user.get(sponsor_user.get(code))
+            if start is None or start == pk:
+                start = default_root
+            if start is None:
+                # very first member of an empty tree stays a root
+                default_root = pk
+                continue
+            if start not in cursors:
+                if strategy[start] != 'bfs':
+                    raise ValidationError(f"User {user_id} would be placed below node {start}, which uses the "
+                                          f"'{strategy[start]}' placement strategy; bulk_place is breadth-first only.")
+                cursors[start] = free_slots(start)
+            parent_id, pos = next(cursors[start])
+            parent[pk], position[pk] = parent_id, pos
+            path[pk], depth[pk] = f"{path[parent_id]}{parent_id}{PATH_SEP}", depth[parent_id] + 1
+            if len(path[pk]) > path_limit:
+                raise LineageTooLong(f"Lineage path of user {user_id} would exceed {path_limit} characters.")
+            children.setdefault(parent_id, {})[pos] = pk
+            placed.append((user_id, pk, parent_id, pos))
+
+        # 4. write nodes, closure rows, frontier flags and the uplines' subtree statistics
+        MLMNode.objects.bulk_update(
+            [MLMNode(pk=pk, parent_id=parent_id, position=pos, path=path[pk], depth=depth[pk])
+             for _, pk, parent_id, pos in placed],
+            ['parent', 'position', 'path', 'depth'], batch_size=batch_size,
+        )
+        rows = []
+        stats = {}  # ancestor_id -> [team, active, left, right, deepest absolute depth]
+        for _, pk, _, _ in placed:
+            chain = MLMNode._ids_in_path(path[pk])  # ancestors, nearest first
+            is_open = len(children.get(pk, ())) < 2
+            rank, below = 0, pk
+            for distance, ancestor_id in enumerate(chain, start=1):
+                leg = position[below]
+                rank = rank | ((leg == 'R') << (distance - 1)) if distance <= RANK_BITS else RANK_MAX
+                rows.append(MLMClosure(ancestor_id=ancestor_id, descendant_id=pk, depth=distance,
+                                       leg=leg, rank=rank, open=is_open))
+                gained = stats.setdefault(ancestor_id, [0, 0, 0, 0, 0])
+                gained[0] += 1
+                gained[1] += active[pk]
+                gained[2 if leg == 'L' else 3] += 1
+                gained[4] = max(gained[4], depth[pk])
+                below = ancestor_id
+            if len(rows) >= batch_size:
+                MLMClosure.objects.bulk_create(rows, batch_size=batch_size)
+                rows = []
+        MLMClosure.objects.bulk_create(rows, batch_size=batch_size)
+
+        filled = list({parent_id for _, _, parent_id, _ in placed if len(children[parent_id]) >= 2})
+        for i in range(0, len(filled), batch_size):
+            MLMClosure.objects.filter(descendant_id__in=filled[i:i + batch_size]).update(open=False)
+        MLMNode.objects.bulk_update(
+            [MLMNode(pk=pk, team_size=F('team_size') + team, active_members=F('active_members') + active_count,
+                     left_count=F('left_count') + left, right_count=F('right_count') + right,
+                     max_depth=Greatest(F('max_depth'), Value(deepest - depth[pk])))
+             for pk, (team, active_count, left, right, deepest) in stats.items()],
+            STAT_FIELDS, batch_size=batch_size,
+        )
+        MLMNode.touch_subtrees([*stats, *(pk for _, pk, _, _ in placed)])
+        MLMTreeVersion.bump()
+
+    return {'placed': placed, 'created': len(missing), 'skipped': skipped}
+
+
+def rebuild_subtree_stats(batch_size=2000):
+    """
+    Recompute every node's cached downline statistics (team_size, active_members,
+    left_count, right_count, max_depth) from the parent links in one pass over a
+    TreeArrays snapshot, and write back only the rows that drifted. Returns that count.
+    """
+    tree = TreeArrays.load('active', *STAT_FIELDS)
+    n = len(tree)
+    is_active = [int(bool(a)) for a in tree.columns['active']]
+    size = tree.subtree_sums([1] * n)  # self included
+    active_total = tree.subtree_sums(is_active)
+    left, right = tree.leg_totals(size)
+    order, _ = tree.bfs_order()
+    height = [0] * n
+    for i in reversed(order):
+        p = tree.parent[i]
+        if p != NONE and height[i] + 1 > height[p]:
+            height[p] = height[i] + 1
+
+    updates = []
+    for i in range(n):
+        fresh = (int(size[i]) - 1, int(active_total[i]) - is_active[i], int(left[i]), int(right[i]), height[i])
+        if fresh != tuple(tree.columns[name][i] for name in STAT_FIELDS):
+            updates.append(MLMNode(pk=tree.ids[i], **dict(zip(STAT_FIELDS, fresh))))
+    with transaction.atomic():
+        MLMNode.objects.bulk_update(updates, STAT_FIELDS, batch_size=batch_size)
+        MLMNode.touch_subtrees([node.pk for node in updates])
+    return len(updates)
+
+
+def drain_placement_queue(batch_size=None, max_batches=None):
+    """
+    Place pending PlacementJobs in arrival order, `batch_size` jobs per transaction.
+
+    Consecutive jobs whose sponsor (or, without one, the oldest root) uses the default BFS
+    strategy are placed together by bulk_place against one tree snapshot; other strategies
+    go through MLMNode.auto_place one by one, so arrival order is kept either way. Drains
+    are serialized on the MLMTreeVersion row. Returns {'placed': n, 'failed': n, 'batches': n}.
+    """
+    batch_size = batch_size or PLACEMENT_BATCH_SIZE
+    totals = {'placed': 0, 'failed': 0, 'batches': 0}
+    MLMTreeVersion.current()  # make sure the lock row exists
+    while max_batches is None or totals['batches'] < max_batches:
+        with transaction.atomic():
+            list(MLMTreeVersion.objects.select_for_update().filter(pk=1).values_list('pk', flat=True))
+            jobs = list(PlacementJob.objects.filter(status=PlacementJob.STATUS_PENDING)
+                        .select_related('node').order_by('id')[:batch_size])
+            if not jobs:
+                break
+            placed, failed = _place_jobs(jobs)
+        totals['placed'] += placed
+        totals['failed'] += failed
+        totals['batches'] += 1
+    return totals
+
+
+def _place_jobs(jobs):
+    codes = {job.sponsor_code for job in jobs if job.sponsor_code}
+    sponsors = {code: (pk, strategy) for code, pk, strategy in MLMNode.objects.filter(user__referral_code__in=codes)
+                .values_list('user__referral_code', 'pk', 'placement_strategy')}
+    default_strategy = (MLMNode.objects.filter(parent__isnull=True).order_by('created_at')
+                        .values_list('placement_strategy', flat=True).first()) or 'bfs'
+    done, errors, run = [], {}, []
+
+    def place_one(job):
+        sponsor = sponsors.get(job.sponsor_code)
+        try:
+            with transaction.atomic():
+                start = MLMNode.objects.get(pk=sponsor[0]) if sponsor and sponsor[0] != job.node_id else None
+                MLMNode.auto_place(MLMNode.objects.get(pk=job.node_id), start_node=start)
+            done.append(job.pk)
+        except (DatabaseError, ValidationError, ValueError) as e:
+            errors[job.pk] = str(e)
+
+    def flush():
+        if not run:
+            return
+        try:
+            with transaction.atomic():
+                bulk_place([(job.node.user_id, job.sponsor_code) for job in run])
+            done.extend(job.pk for job in run)
+        except (DatabaseError, ValidationError):
+            # the snapshot went stale under us (e.g. a concurrent synchronous placement): one by one
+            for job in run:
+                place_one(job)
+        run.clear()
+
+    for job in jobs:
+        sponsor = sponsors.get(job.sponsor_code)
+        if (sponsor[1] if sponsor else default_strategy) == 'bfs':
+            run.append(job)
+        else:
+            flush()
+            place_one(job)
+    flush()
+
+    now = timezone.now()
+    PlacementJob.objects.filter(pk__in=done).update(status=PlacementJob.STATUS_PLACED, processed_at=now, error='')
+    for pk, error in errors.items():
+        PlacementJob.objects.filter(pk=pk).update(status=PlacementJob.STATUS_FAILED, processed_at=now, error=error)
+    return len(done), len(errors)
+
+
+def level_report(node, max_depth=None):
+    """
+    Members per level below `node` (self excluded), as
+    [{'level', 'total', 'active', 'inactive', 'left', 'right'}, ...] ordered by level;
+    `max_depth` limits the levels (None => whole downline, 0 => none); negative raises ValueError.
+
+    One grouped query over the closure table, cached under the node's subtree_version,
+    which every change in the downline bumps, so a cached report is never stale.
+    `node.subtree_version` must therefore be fresh (load the node right before calling).
+    """
+    if max_depth is not None and max_depth < 0:
+        raise ValueError("max_depth must not be negative")
+    key = f"mlm:levels:{node.pk}:{node.subtree_version}:{'' if max_depth is None else max_depth}"
+    report = cache.get(key)
+    if report is not None:
+        return report
+    links = MLMClosure.objects.filter(ancestor=node, depth__gt=0)
+    if max_depth is not None:
+        links = links.filter(depth__lte=max_depth)
+    levels = {}
+    for row in links.values('depth', 'leg', 'descendant__active').annotate(n=Count('pk')).order_by():
+        level = levels.setdefault(row['depth'], {
+            'level': row['depth'], 'total': 0, 'active': 0, 'inactive': 0, 'left': 0, 'right': 0})
+        level['total'] += row['n']
+        level['active' if row['descendant__active'] else 'inactive'] += row['n']
+        level['left' if row['leg'] == 'L' else 'right'] += row['n']
+    report = [levels[depth] for depth in sorted(levels)]
+    cache.set(key, report, LEVEL_REPORT_TTL)
+    return report
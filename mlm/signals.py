@@ -3,30 +3,47 @@ from django.db.models.signals import post_save
 from .models import MLMNode
 
 def calculate_binary_bonus(node, amount):
-    # placeholder: implement rules for matching
-    # e.g., find left & right volumes up to n levels and compute match
-    pass
+    # record the sale on the node and on every upline leg it feeds; matching of the
+    # accumulated left/right leg volumes is settled per payout cycle, not per sale
+    MLMNode.add_sale_volume(node.pk, amount)
 
 
 
 
 # mlm/signals.py
 from django.conf import settings
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete, pre_delete
 from django.dispatch import receiver
 from django.contrib.auth import get_user_model
-from .models import MLMNode
+from django.db import transaction
+from .models import MLMNode, MLMClosure, MLMTreeVersion, PlacementJob
 
 User = get_user_model()
 
+# opt-in: only queue a PlacementJob on signup and let mlm.tasks.place_pending_nodes place it
+ASYNC_PLACEMENT = getattr(settings, 'MLM_ASYNC_PLACEMENT', False)
+
+
+def _kick_placement_worker():
+    from .tasks import place_pending_nodes
+    try:
+        place_pending_nodes.apply_async(retry=False)
+    except Exception as e:
+        # broker down: the job stays queued for the next drain (see the beat schedule)
+        import logging
+        logging.getLogger('mlm').warning("Could not enqueue placement drain: %s", e)
+
+
 @receiver(post_save, sender=User)
 def create_and_place_mlm_node(sender, instance, created, **kwargs):
     """
     When a new User is created, create an MLMNode for them and auto-place them
     if the signup flow supplied a referral code. The signup view should attach
     instance._mlm_referral_code = '<REF>' before saving the user instance.
+    Tools that build users outside the live tree (the benchmarks) set
+    instance._mlm_skip_signup = True to get no node at all.
     """
-    if not created:
+    if not created or getattr(instance, '_mlm_skip_signup', False):
         return
 
     try:
@@ -41,6 +58,15 @@ def create_and_place_mlm_node(sender, instance, created, **kwargs):
     # If the signup view attached a referral code to the user instance, use it.
     ref_code = getattr(instance, '_mlm_referral_code', None)
 
+    if ASYNC_PLACEMENT:
+        # the signup view can hand instance._mlm_placement_job.token to the page for polling;
+        # a code longer than the referral_code column can't belong to anyone
+        sponsor_code = ref_code if ref_code and len(ref_code) <= 12 else None
+        instance._mlm_placement_job, _ = PlacementJob.objects.get_or_create(
+            node=node, defaults={'sponsor_code': sponsor_code})
+        transaction.on_commit(_kick_placement_worker)
+        return
+
     if ref_code:
         try:
             # find the referrer user by referral_code on User
@@ -59,8 +85,40 @@ def create_and_place_mlm_node(sender, instance, created, **kwargs):
             try:
                 MLMNode.auto_place(node)
             except Exception:
-                pass
+                logging.getLogger('mlm').exception("Fallback placement failed; MLMNode of user %s left unplaced",
+                                                   instance.pk)
     else:
         # No referral provided — default placement (optional: keep users unplaced for admin)
         # If you prefer to let admin place manually, comment the next line out.
-        MLMNode.auto_place(node)
+        try:
+            MLMNode.auto_place(node)
+        except Exception as e:
+            # e.g. LineageTooLong: the node stays unplaced for an admin, the signup still succeeds
+            import logging
+            logging.getLogger('mlm').exception("Failed to auto-place MLMNode for user %s: %s", instance.pk, e)
+
+
+@receiver(pre_delete, sender=MLMNode)
+def detach_deleted_node(sender, instance, **kwargs):
+    """
+    Take a node out of the tree before it goes: its children become roots of their own subtrees
+    (paths and closure rows re-rooted) and the upline stats and leg volumes lose the whole subtree.
+    Fresh rows are saved, so a stale `instance` can't corrupt the derived data.
+    """
+    with transaction.atomic():
+        for child in MLMNode.objects.filter(parent_id=instance.pk):
+            child.parent, child.position = None, None
+            child.save()
+        node = MLMNode.objects.filter(pk=instance.pk).first()
+        if node is not None and node.parent_id is not None:
+            node.parent, node.position = None, None
+            node.save()
+
+
+@receiver(post_delete, sender=MLMNode)
+def reopen_parent_slot(sender, instance, **kwargs):
+    """A deleted node frees a slot under its parent: put the parent back on the placement frontier."""
+    if instance.parent_id:
+        MLMClosure.refresh_open(instance.parent_id)
+        MLMNode.touch_subtrees(instance.ancestor_ids())
+    MLMTreeVersion.bump()
@@ -0,0 +1,123 @@
+# mlm/snapshot.py
+"""
+Process-local, array-backed snapshot of the genealogy for read-heavy views.
+
+Each worker keeps one TreeSnapshot (parent/left/right/active/user_id arrays, see
+mlm.arrays) tagged with the MLMTreeVersion stamp it was built from. Readers pay one
+tiny query to compare stamps; the arrays are reloaded only after a placement,
+re-parenting or activation change bumped the version.
+
+The reload is a full O(n) pass, so it runs on a background thread of the worker: until
+it lands, get_snapshot() returns None and the views take their database-backed path.
+Only a reader inside a transaction builds inline, as another thread can't see its writes.
+"""
+import logging
+import threading
+from array import array
+from collections import deque
+from django.conf import settings
+from django.db import connection
+
+from .arrays import TreeArrays, NONE
+from .models import MLMTreeVersion
+
+SNAPSHOT_ENABLED = getattr(settings, 'MLM_TREE_SNAPSHOT', True)
+
+_lock = threading.Lock()
+_snapshot = None
+_rebuilding = False
+
+
+class TreeSnapshot(TreeArrays):
+    version = None
+
+    @classmethod
+    def build(cls, version):
+        tree = cls.load('user_id', 'active')
+        tree.user_id = array('q', tree.columns.pop('user_id'))
+        tree.active = bytearray(tree.columns.pop('active'))
+        tree.version = version
+        return tree
+
+    def position(self, i):
+        p = self.parent[i]
+        if p == NONE:
+            return None
+        return 'L' if self.left[p] == i else 'R'
+
+    def entry(self, i):
+        """Plain dict for node index i: id, user_id, active, position, parent."""
+        p = self.parent[i]
+        return {
+            'id': self.ids[i],
+            'user_id': self.user_id[i],
+            'active': bool(self.active[i]),
+            'position': self.position(i),
+            'parent': self.ids[p] if p != NONE else None,
+        }
+
+    def child(self, node_id, position):
+        i = self.index.get(node_id)
+        if i is None:
+            return None
+        c = (self.left if position == 'L' else self.right)[i]
+        return self.entry(c) if c != NONE else None
+
+    def subtree(self, node_id, max_depth, max_nodes=None):
+        """BFS (left first) entries below and including node_id, up to max_depth levels / max_nodes entries."""
+        i = self.index.get(node_id)
+        if i is None:
+            return []
+        result = []
+        queue = deque([(i, 0)])
+        while queue and (max_nodes is None or len(result) < max_nodes):
+            i, depth = queue.popleft()
+            result.append(self.entry(i))
+            if depth < max_depth:
+                queue.extend((c, depth + 1) for c in (self.left[i], self.right[i]) if c != NONE)
+        return result
+
+
+def get_snapshot():
+    """
+    The current process-local snapshot, or None when disabled via MLM_TREE_SNAPSHOT or while
+    a stale one is being rebuilt in the background.
+    """
+    global _snapshot
+    if not SNAPSHOT_ENABLED:
+        return None
+    version = MLMTreeVersion.current()
+    snapshot = _snapshot
+    if snapshot is not None and snapshot.version == version:
+        return snapshot
+    if connection.in_atomic_block:
+        with _lock:
+            if _snapshot is None or _snapshot.version != version:
+                _snapshot = TreeSnapshot.build(version)
+            return _snapshot
+    _rebuild_in_background(version)
+    return None
+
+
+def _rebuild_in_background(version):
+    global _rebuilding
+    with _lock:
+        if _rebuilding:
+            return
+        _rebuilding = True
+    threading.Thread(target=_rebuild, args=(version,), name='mlm-tree-snapshot', daemon=True).start()
+
+
+def _rebuild(version):
+    # rows are read after `version` was, so the arrays are at least as new as the stamp they carry;
+    # a bump landing mid-build just makes the next reader schedule another rebuild
+    global _snapshot, _rebuilding
+    try:
+        snapshot = TreeSnapshot.build(version)
+        with _lock:
+            _snapshot = snapshot
+    except Exception:
+        logging.getLogger('mlm').exception("Could not rebuild the tree snapshot")
+    finally:
+        _rebuilding = False
+        connection.close()
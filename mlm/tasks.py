@@ -0,0 +1,51 @@
+# mlm/tasks.py
+from celery import shared_task
+import logging
+
+from .activation import refresh_activation
+from .pairing import run_binary_cycle
+from .ranks import run_rank_engine
+from .services import drain_placement_queue
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def run_binary_pairing_cycle(label=None):
+    """Weekly binary payout: pair every node and write the cycle's commissions (see mlm.pairing)."""
+    stats = run_binary_cycle(label=label)
+    if stats['already_run']:
+        logger.warning("binary pairing cycle %s already ran; skipped", stats['label'])
+    else:
+        logger.info("binary pairing cycle %s: %s nodes, %s paired, total %s in %.2fs",
+                    stats['label'], stats['nodes'], stats['paired_nodes'], stats['total'], stats['elapsed'])
+    return {k: str(v) for k, v in stats.items()}
+
+
+@shared_task
+def place_pending_nodes(batch_size=None):
+    """Drain the asynchronous placement queue (MLM_ASYNC_PLACEMENT), batch by batch in arrival order."""
+    stats = drain_placement_queue(batch_size=batch_size)
+    if stats['batches']:
+        logger.info("placed %s pending nodes in %s batches (%s failed)",
+                    stats['placed'], stats['batches'], stats['failed'])
+    return stats
+
+
+@shared_task
+def recompute_ranks():
+    """Nightly rank qualification over the whole network (see mlm.ranks)."""
+    stats = run_rank_engine()
+    logger.info("ranked %s nodes in %.2fs (%.0f nodes/sec), %s changed",
+                stats['nodes'], stats['elapsed'], stats['nodes'] / stats['elapsed'] if stats['elapsed'] else 0,
+                stats['changed'])
+    return stats
+
+
+@shared_task
+def refresh_node_activation():
+    """Daily: (de)activate members from their recent sales activity (see mlm.activation)."""
+    stats = refresh_activation()
+    logger.info("activation: %s qualifying, %s activated, %s deactivated over %s nodes in %.2fs",
+                stats['qualified'], stats['activated'], stats['deactivated'], stats['nodes'], stats['elapsed'])
+    return stats
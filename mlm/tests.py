@@ -1,9 +1,10 @@
+import json
 from django.test import TestCase
 
 # Create your tests here.
 from django.test import TestCase
 from django.contrib.auth import get_user_model
-from .models import MLMNode
+from .models import MLMNode, MLMClosure
 
 User = get_user_model()
 
@@ -28,3 +29,1060 @@ class MLMNodeTests(TestCase):
 
 
 
+
+
+class MLMLineageTests(TestCase):
+    def setUp(self):
+        # the post_save signal places each new user breadth-first under the first root
+        self.users = [User.objects.create_user(username=f'n{i}', password='pass') for i in range(7)]
+        self.nodes = [MLMNode.objects.get(user=u) for u in self.users]
+
+    def test_paths_follow_placement(self):
+        root = self.nodes[0]
+        for node in self.nodes[1:]:
+            self.assertEqual(node.path, node.parent.path + f"{node.parent_id}/")
+            self.assertEqual(node.depth, node.parent.depth + 1)
+            self.assertEqual(node.ancestor_ids()[-1], root.id)
+
+    def test_upline_single_query(self):
+        leaf = MLMNode.objects.get(pk=self.nodes[-1].pk)
+        with self.assertNumQueries(1):
+            upline = leaf.get_upline()
+        self.assertEqual([n.pk for n in upline], [leaf.parent_id, self.nodes[0].pk])
+        self.assertEqual(len(leaf.get_upline(levels=1)), 1)
+
+    def test_downline_single_query(self):
+        root = self.nodes[0]
+        with self.assertNumQueries(1):
+            downline = root.get_downline(levels=2)
+        self.assertEqual(len(downline), 6)
+        self.assertEqual(sorted(d for _, d in downline), [1, 1, 2, 2, 2, 2])
+        self.assertEqual(len(root.get_downline(levels=1)), 2)
+
+    def test_reparent_rewrites_downline_paths(self):
+        root = self.nodes[0]
+        left = root.left_child()
+        right = root.right_child()
+        grandchild = left.left_child()
+        # detach the left leg and hang it under the right leg's open slot
+        right_leaf = right.left_child()
+        left.parent = right_leaf
+        left.position = 'L'
+        left.save()
+        grandchild.refresh_from_db()
+        self.assertEqual(grandchild.depth, 4)
+        self.assertEqual(grandchild.ancestor_ids(), [left.pk, right_leaf.pk, right.pk, root.pk])
+
+    def test_overlong_lineage_is_rejected(self):
+        from unittest import mock
+        from .models import LineageTooLong
+        root = self.nodes[0]
+        left, right_leaf = root.left_child(), root.right_child().left_child()
+        path_field = MLMNode._meta.get_field('path')
+        # room for left itself below right_leaf, but not for its children
+        with mock.patch.object(path_field, 'max_length', len(right_leaf.lineage_prefix())):
+            with self.assertRaises(LineageTooLong):
+                left.move_to(right_leaf, 'L')
+        left.refresh_from_db()
+        self.assertEqual(left.parent_id, root.pk)
+        with mock.patch.object(path_field, 'max_length', len(self.nodes[-1].path)):
+            late = User.objects.create_user(username='n-late', password='pass')  # signup still succeeds
+        self.assertIsNone(MLMNode.objects.get(user=late).parent_id)
+
+    def test_skip_signup_flag_creates_no_node(self):
+        user = User(username='outside')
+        user._mlm_skip_signup = True
+        user.save()
+        self.assertFalse(MLMNode.objects.filter(user=user).exists())
+        self.assertEqual(MLMNode.objects.get(pk=self.nodes[0].pk).team_size, 6)
+
+    def test_deleting_a_node_detaches_its_downline(self):
+        from .services import rebuild_subtree_stats
+        root = self.nodes[0]
+        left = root.left_child()
+        orphans = list(left.children.all())
+        left.user.delete()
+        root.refresh_from_db()
+        self.assertEqual((root.team_size, root.left_count, root.right_count), (3, 0, 3))
+        for orphan in orphans:
+            orphan.refresh_from_db()
+            self.assertEqual((orphan.parent_id, orphan.path, orphan.depth), (None, '', 0))
+            self.assertEqual(orphan.get_upline(), [])
+            self.assertFalse(MLMClosure.objects.filter(descendant=orphan, depth__gt=0).exists())
+        self.assertEqual(rebuild_subtree_stats(), 0)
+
+    def test_cannot_place_under_own_downline(self):
+        from django.core.exceptions import ValidationError
+        root = self.nodes[0]
+        root.parent = self.nodes[-1]
+        root.position = 'L'
+        with self.assertRaises(ValidationError):
+            root.save()
+
+
+class MLMClosureTests(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create_user(username=f'c{i}', password='pass') for i in range(7)]
+        self.nodes = [MLMNode.objects.get(user=u) for u in self.users]
+
+    def _rows(self):
+        return set(MLMClosure.objects.values_list('ancestor_id', 'descendant_id', 'depth', 'leg'))
+
+    def test_placement_populates_closure(self):
+        root = self.nodes[0]
+        left = root.left_child()
+        self.assertEqual(MLMClosure.objects.filter(ancestor=root).count(), 7)
+        for node, _ in left.get_downline(levels=1):
+            self.assertTrue(MLMClosure.is_in_downline(node.pk, root.pk))
+            link = MLMClosure.objects.get(ancestor=root, descendant=node)
+            self.assertEqual((link.depth, link.leg), (2, 'L'))
+        self.assertFalse(MLMClosure.is_in_downline(root.pk, left.pk))
+        self.assertEqual(list(MLMClosure.ancestors_of(self.nodes[-1].pk).values_list('depth', flat=True)), [1, 2])
+
+    def test_rebuild_matches_incremental(self):
+        incremental = self._rows()
+        written = MLMClosure.rebuild()
+        self.assertEqual(written, len(incremental))
+        self.assertEqual(self._rows(), incremental)
+
+    def test_reparent_relinks_downline(self):
+        root = self.nodes[0]
+        left, right = root.left_child(), root.right_child()
+        target = right.left_child()
+        left.parent = target
+        left.position = 'L'
+        left.save()
+        incremental = self._rows()
+        MLMClosure.rebuild()
+        self.assertEqual(self._rows(), incremental)
+
+
+class MLMFrontierTests(TestCase):
+    def _random_tree(self, rng, size):
+        # users created without signals, nodes attached to random free slots
+        users = User.objects.bulk_create([User(username=f'f{i}', referral_code=f'F{i:07d}') for i in range(size)])
+        nodes = [MLMNode.objects.create(user=users[0])]
+        free = [(nodes[0], 'L'), (nodes[0], 'R')]
+        for user in users[1:]:
+            parent, position = free.pop(rng.randrange(len(free)))
+            node = MLMNode.objects.create(user=user, parent=parent, position=position)
+            nodes.append(node)
+            free += [(node, 'L'), (node, 'R')]
+        return nodes
+
+    def test_frontier_matches_bfs_on_random_trees(self):
+        import random
+        rng = random.Random(1234)
+        for trial in range(4):
+            MLMNode.objects.all().delete()
+            User.objects.all().delete()
+            nodes = self._random_tree(rng, 40)
+            for start in rng.sample(nodes, 10):
+                expected = MLMNode._bfs_open_slot(start)
+                actual = MLMNode.find_open_slot(start)
+                self.assertEqual((actual[0].pk, actual[1]), (expected[0].pk, expected[1]))
+
+    def test_auto_place_fills_frontier_in_bfs_order(self):
+        users = User.objects.bulk_create([User(username=f'g{i}', referral_code=f'G{i:07d}') for i in range(8)])
+        root = MLMNode.objects.create(user=users[0])
+        for user in users[1:]:
+            node = MLMNode.objects.create(user=user)
+            expected = MLMNode._bfs_open_slot(root, exclude_pk=node.pk)
+            parent, position = MLMNode.auto_place(node, start_node=root)
+            self.assertEqual((parent.pk, position), (expected[0].pk, expected[1]))
+        self.assertEqual(MLMNode.objects.get(pk=root.pk).get_downline(levels=3)[-1][1], 3)
+        self.assertFalse(MLMClosure.objects.filter(descendant=root, open=True).exists())
+
+
+class MLMConcurrentPlacementTests(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create_user(username=f'p{i}', password='pass') for i in range(4)]
+        self.root = MLMNode.objects.get(user=self.users[0])
+
+    def test_db_rejects_duplicate_slot(self):
+        from django.db import IntegrityError, transaction
+        left = self.root.left_child()
+        extra = User.objects.bulk_create([User(username='dup', referral_code='DUP00001')])[0]
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            MLMNode.objects.bulk_create([MLMNode(user=extra, parent=self.root, position=left.position)])
+
+    def test_auto_place_retries_when_slot_was_claimed(self):
+        from unittest import mock
+        # the first lookup returns a stale slot on the (already full) root, as a racing worker would see it
+        stale = [(self.root, 'L')]
+        real_find = MLMNode.find_open_slot
+
+        def racing_find(start_node, exclude_pk=None):
+            return stale.pop() if stale else real_find(start_node, exclude_pk=exclude_pk)
+
+        user = User.objects.bulk_create([User(username='late', referral_code='LATE0001')])[0]
+        node = MLMNode.objects.create(user=user)
+        with mock.patch.object(MLMNode, 'find_open_slot', side_effect=racing_find):
+            parent, position = MLMNode.auto_place(node, start_node=self.root)
+        self.assertNotEqual(parent.pk, self.root.pk)
+        self.assertEqual(MLMNode.objects.filter(parent=self.root).count(), 2)
+        self.assertEqual(MLMNode.objects.filter(parent=parent, position=position).count(), 1)
+
+
+class MLMBulkPlacementTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(username='boss', password='pass', is_staff=True)
+        self.sponsor = User.objects.create_user(username='sponsor', password='pass')
+        # roster members imported without signals, so they have no node yet
+        self.members = User.objects.bulk_create(
+            [User(username=f'm{i}', referral_code=f'M{i:07d}') for i in range(12)]
+        )
+
+    def _shape(self):
+        return set(MLMNode.objects.values_list('user__username', 'parent__user__username', 'position', 'depth'))
+
+    def test_bulk_place_matches_sequential_auto_place(self):
+        from django.db import transaction
+        roster = [(u.pk, self.sponsor.referral_code if i % 3 else None) for i, u in enumerate(self.members)]
+
+        sid = transaction.savepoint()
+        for user_id, code in roster:
+            node = MLMNode.objects.create(user_id=user_id)
+            start = MLMNode.objects.get(user__referral_code=code) if code else None
+            MLMNode.auto_place(node, start_node=start)
+        expected = self._shape()
+        transaction.savepoint_rollback(sid)
+
+        from .services import bulk_place
+        with self.assertNumQueries(14):
+            result = bulk_place(roster)
+        self.assertEqual(result['created'], 12)
+        self.assertEqual(len(result['placed']), 12)
+        self.assertEqual(self._shape(), expected)
+
+        incremental = set(MLMClosure.objects.values_list('ancestor_id', 'descendant_id', 'depth', 'leg', 'rank', 'open'))
+        MLMClosure.rebuild()
+        self.assertEqual(set(MLMClosure.objects.values_list('ancestor_id', 'descendant_id', 'depth', 'leg', 'rank', 'open')),
+                         incremental)
+
+    def test_admin_bulk_place_api(self):
+        from django.urls import reverse
+        self.client.force_login(self.admin)
+        payload = {'members': [{'user_id': u.pk, 'sponsor_code': self.sponsor.referral_code} for u in self.members[:3]]
+                   + [{'user_id': self.sponsor.pk}]}
+        resp = self.client.post(reverse('mlm:api_bulk_place'), data=payload, content_type='application/json')
+        self.assertEqual(resp.status_code, 201, resp.content)
+        self.assertEqual(resp.json()['placed'], 3)
+        self.assertEqual(resp.json()['skipped'], [self.sponsor.pk])
+        sponsor_node = MLMNode.objects.get(user=self.sponsor)
+        self.assertEqual(sponsor_node.descendants().count(), 3)
+
+    def test_non_bfs_sponsor_is_rejected(self):
+        from django.urls import reverse
+        MLMNode.objects.filter(user=self.sponsor).update(placement_strategy='weaker_leg')
+        self.client.force_login(self.admin)
+        payload = {'members': [{'user_id': u.pk, 'sponsor_code': self.sponsor.referral_code} for u in self.members[:2]]}
+        resp = self.client.post(reverse('mlm:api_bulk_place'), data=payload, content_type='application/json')
+        self.assertEqual(resp.status_code, 400)
+        self.assertFalse(MLMNode.objects.filter(user__in=self.members[:2]).exists())
+
+
+class MLMSubtreeApiTests(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create_user(username=f's{i}', password='pass') for i in range(15)]
+        self.root = MLMNode.objects.get(user=self.users[0])
+        self.client.force_login(self.users[0])
+
+    def _get(self, depth):
+        from django.urls import reverse
+        resp = self.client.get(reverse('mlm:api_subtree', args=[self.root.pk]), {'depth': depth})
+        self.assertEqual(resp.status_code, 200)
+        return json.loads(b''.join(resp.streaming_content))
+
+    def test_subtree_constant_queries(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        self._get(0)  # warm the process-local tree snapshot
+        with CaptureQueriesContext(connection) as shallow:
+            data = self._get(1)
+        self.assertEqual(len(data['nodes']), 3)
+        with CaptureQueriesContext(connection) as deep:
+            data = self._get(3)
+        self.assertEqual(len(data['nodes']), 15)
+        self.assertFalse(data['truncated'])
+        self.assertEqual(len(shallow.captured_queries), len(deep.captured_queries))
+
+    def test_subtree_caps_node_count(self):
+        from unittest import mock
+        with mock.patch('mlm.views.SUBTREE_MAX_NODES', 5):
+            data = self._get(3)
+        self.assertEqual(len(data['nodes']), 5)
+        self.assertTrue(data['truncated'])
+        self.assertEqual(data['nodes'][0]['id'], self.root.pk)
+
+
+class MLMTreeSnapshotTests(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create_user(username=f't{i}', password='pass') for i in range(4)]
+        self.root = MLMNode.objects.get(user=self.users[0])
+
+    def test_snapshot_refreshes_after_placement_and_activation(self):
+        from mlm.snapshot import get_snapshot
+        first = get_snapshot()
+        self.assertIs(get_snapshot(), first)
+        self.assertEqual(len(first.subtree(self.root.pk, 5)), 4)
+
+        User.objects.create_user(username='t-late', password='pass')
+        second = get_snapshot()
+        self.assertIsNot(second, first)
+        self.assertEqual(len(second.subtree(self.root.pk, 5)), 5)
+
+        left = self.root.left_child()
+        left.active = True
+        left.save()
+        self.assertTrue(get_snapshot().child(self.root.pk, 'L')['active'])
+
+    def test_stale_snapshot_rebuilds_off_the_request_path(self):
+        from unittest import mock
+        from django.db import connection
+        from mlm import snapshot
+        from mlm.models import MLMTreeVersion
+        snapshot.get_snapshot()
+        User.objects.create_user(username='t-late', password='pass')
+        with mock.patch.object(connection, 'in_atomic_block', False), \
+                mock.patch('mlm.snapshot.threading.Thread') as thread:
+            self.assertIsNone(snapshot.get_snapshot())
+            self.assertIsNone(snapshot.get_snapshot())
+        self.assertEqual(thread.call_count, 1)  # one rebuild at a time per process
+        self.assertEqual(thread.call_args.kwargs['args'], (MLMTreeVersion.current(),))
+        snapshot._rebuilding = False
+
+    def test_node_detail_children_from_snapshot(self):
+        from django.urls import reverse
+        self.client.force_login(self.users[0])
+        resp = self.client.get(reverse('mlm:api_node_detail', args=[self.root.pk]))
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()['left']['id'], self.root.left_child().pk)
+        self.assertEqual(resp.json()['right']['user'], str(self.root.right_child().user))
+
+
+class MLMSubtreeStatsTests(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create_user(username=f'st{i}', password='pass') for i in range(10)]
+        self.root = MLMNode.objects.get(user=self.users[0])
+
+    def assertStatsConsistent(self):
+        from mlm.services import rebuild_subtree_stats
+        self.assertEqual(rebuild_subtree_stats(), 0)
+
+    def test_placement_maintains_stats(self):
+        self.root.refresh_from_db()
+        self.assertEqual((self.root.team_size, self.root.left_count, self.root.right_count, self.root.max_depth),
+                         (9, 6, 3, 3))
+        self.assertStatsConsistent()
+
+    def test_activation_updates_upline(self):
+        node = self.root.left_child().left_child()
+        node.active = True
+        node.save()
+        self.root.refresh_from_db()
+        self.assertEqual(self.root.active_members, 1)
+        self.assertEqual(self.root.left_child().active_members, 1)
+        self.assertStatsConsistent()
+
+    def test_stale_instance_does_not_overwrite_counters(self):
+        stale = MLMNode.objects.get(pk=self.root.pk)
+        User.objects.create_user(username='st-late', password='pass')
+        stale.active = True
+        stale.save()
+        self.assertStatsConsistent()
+
+    def test_move_and_bulk_place_keep_stats_consistent(self):
+        from mlm.services import bulk_place
+        leaf = MLMNode.objects.filter(team_size=0).order_by('-depth').first()
+        subtree = self.root.right_child()
+        subtree.parent, subtree.position = leaf, 'L'
+        subtree.save()
+        self.assertStatsConsistent()
+
+        newcomers = User.objects.bulk_create([User(username=f'st-bulk{i}', referral_code=f'STB{i:05d}')
+                                              for i in range(6)])
+        bulk_place([(u.pk, None) for u in newcomers])
+        self.assertStatsConsistent()
+
+    def test_rebuild_corrects_drift_and_serializer_exposes_stats(self):
+        from mlm.serializers import MLMNodeSerializer
+        MLMNode.objects.filter(pk=self.root.pk).update(team_size=0, max_depth=0)
+        from mlm.services import rebuild_subtree_stats
+        self.assertEqual(rebuild_subtree_stats(), 1)
+        data = MLMNodeSerializer(MLMNode.objects.get(pk=self.root.pk)).data
+        self.assertEqual((data['team_size'], data['max_depth']), (9, 3))
+
+
+class MLMNodeBatchApiTests(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create_user(username=f'nb{i}', password='pass') for i in range(15)]
+        self.client.force_login(self.users[0])
+
+    def _get(self, ids):
+        from django.urls import reverse
+        return self.client.get(reverse('mlm:api_node_batch'), {'ids': ','.join(str(pk) for pk in ids)})
+
+    def test_batch_is_constant_queries(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        ids = list(MLMNode.objects.order_by('pk').values_list('pk', flat=True))
+        with CaptureQueriesContext(connection) as small:
+            resp = self._get(ids[:2])
+        with CaptureQueriesContext(connection) as large:
+            resp = self._get(ids + [999999])
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+        data = resp.json()
+        self.assertEqual([n['id'] for n in data['nodes']], ids)
+        self.assertEqual(data['missing'], [999999])
+        root = MLMNode.objects.get(pk=ids[0])
+        self.assertEqual(data['nodes'][0]['left']['id'], root.left_child().pk)
+        self.assertEqual(data['nodes'][0]['right']['user'], str(root.right_child().user))
+        self.assertIsNone(data['nodes'][-1]['left'])
+
+    def test_batch_rejects_bad_ids(self):
+        self.assertEqual(self._get([]).status_code, 400)
+        from django.urls import reverse
+        self.assertEqual(self.client.get(reverse('mlm:api_node_batch'), {'ids': '1,x'}).status_code, 400)
+
+
+class MLMConditionalGetTests(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create_user(username=f'cg{i}', password='pass') for i in range(5)]
+        self.root = MLMNode.objects.get(user=self.users[0])
+        self.client.force_login(self.users[0])
+
+    def _etag(self, name, node):
+        from django.urls import reverse
+        return self.client.get(reverse(f'mlm:{name}', args=[node.pk]))['ETag']
+
+    def test_unchanged_subtree_returns_304_with_one_query(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from django.urls import reverse
+        url = reverse('mlm:api_subtree', args=[self.root.pk])
+        etag = self.client.get(url, {'depth': 3})['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.get(url, {'depth': 3}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(len([q for q in queries.captured_queries if 'mlm_' in q['sql']]), 1)
+        self.assertEqual(self.client.get(url, {'depth': 2}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_etag_changes_only_above_placement_and_activation(self):
+        left, right = self.root.left_child(), self.root.right_child()
+        before = {n.pk: self._etag('api_node_detail', n) for n in (self.root, left, right)}
+        User.objects.create_user(username='cg-late', password='pass')  # lands below the right child
+        after = {n.pk: self._etag('api_node_detail', n) for n in (self.root, left, right)}
+        self.assertNotEqual(before[self.root.pk], after[self.root.pk])
+        self.assertNotEqual(before[right.pk], after[right.pk])
+        self.assertEqual(before[left.pk], after[left.pk])
+
+        node = left.left_child()
+        node.active = True
+        node.save()
+        self.assertNotEqual(self._etag('api_node_detail', left), after[left.pk])
+        self.assertEqual(self._etag('api_node_detail', right), after[right.pk])
+
+
+class MLMPlacementStrategyTests(TestCase):
+    def setUp(self):
+        # BFS-filled tree: root, 2 children, 4 grandchildren, plus one great-grandchild below the leftmost
+        self.users = [User.objects.create_user(username=f'ps{i}', password='pass') for i in range(8)]
+        self.root = MLMNode.objects.get(user=self.users[0])
+
+    def _place(self, strategy, sponsor=None):
+        sponsor = MLMNode.objects.get(pk=(sponsor or self.root).pk)
+        user = User.objects.bulk_create([User(username=f'ps-{strategy}-{User.objects.count()}')])[0]
+        node = MLMNode.objects.create(user=user)
+        return MLMNode.auto_place(node, start_node=sponsor, strategy=strategy)
+
+    def test_extreme_lines(self):
+        parent, position = self._place('extreme_left')
+        self.assertEqual((parent.user, position), (self.users[7], 'L'))
+        parent, position = self._place('extreme_right')
+        self.assertEqual((parent.user, position), (self.users[6], 'R'))
+
+    def test_weaker_leg_and_balanced_follow_leg_counts(self):
+        parent, position = self._place('weaker_leg')  # right leg has 3 members vs 4 on the left
+        self.assertEqual((parent.user, position), (self.users[6], 'R'))
+        parent, position = self._place('balanced')  # legs now 4/4: left, then the lighter side at each level
+        self.assertEqual((parent.user, position), (self.users[4], 'L'))
+
+    def test_walk_is_one_query_per_level(self):
+        from mlm.placement import get_strategy
+        root = MLMNode.objects.get(pk=self.root.pk)
+        with self.assertNumQueries(root.max_depth + 2):
+            get_strategy('extreme_left')(root)
+
+    def test_sponsor_strategy_applies_to_signups(self):
+        MLMNode.objects.filter(pk=self.root.pk).update(placement_strategy='extreme_right')
+        user = User(username='ps-signup')
+        user._mlm_referral_code = self.users[0].referral_code
+        user.save()
+        node = MLMNode.objects.get(user=user)
+        self.assertEqual((node.parent.user, node.position), (self.users[6], 'R'))
+
+    def test_unknown_strategy(self):
+        with self.assertRaises(ValueError):
+            self._place('zigzag')
+
+    def test_replacing_a_node_never_lands_in_its_own_downline(self):
+        from django.urls import reverse
+        from mlm.placement import get_strategy
+        left = MLMNode.objects.get(user=self.users[1])  # ps3/ps4 (and ps7) below it
+        root = MLMNode.objects.get(pk=self.root.pk)
+        parent, position = get_strategy('extreme_left')(root, exclude_pk=left.pk)
+        self.assertEqual((parent.user, position), (self.users[5], 'L'))
+        admin = User(username='ps-admin', is_staff=True)
+        admin._mlm_skip_signup = True
+        admin.save()
+        self.client.force_login(admin)
+        resp = self.client.post(reverse('mlm:api_force_place'), data={'user_id': self.users[1].pk},
+                                content_type='application/json')
+        self.assertEqual(resp.status_code, 201, resp.content)
+        left.refresh_from_db()
+        self.assertEqual((left.parent.user, left.position), (self.users[5], 'L'))
+        self.assertEqual(left.descendants().count(), 3)
+
+
+class MLMMoveTests(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create_user(username=f'mv{i}', password='pass') for i in range(12)]
+        self.root = MLMNode.objects.get(user=self.users[0])
+        for i, node in enumerate(MLMNode.objects.order_by('pk')):
+            MLMNode.add_sale_volume(node.pk, 10 * (i + 1))
+
+    def assertIndexesConsistent(self):
+        from mlm.services import rebuild_subtree_stats
+        closure = set(MLMClosure.objects.values_list('ancestor_id', 'descendant_id', 'depth', 'leg', 'rank', 'open'))
+        MLMClosure.rebuild()
+        self.assertEqual(closure, set(MLMClosure.objects.values_list(
+            'ancestor_id', 'descendant_id', 'depth', 'leg', 'rank', 'open')))
+        self.assertEqual(rebuild_subtree_stats(), 0)
+        for node in MLMNode.objects.all():
+            parent = node.parent
+            self.assertEqual(node.path, f"{parent.path}{parent.pk}/" if parent else '')
+            for position, leg_volume in (('L', node.left_volume), ('R', node.right_volume)):
+                child = node.children.filter(position=position).first()
+                expected = (child.personal_volume + child.left_volume + child.right_volume) if child else 0
+                self.assertEqual(leg_volume, expected)
+
+    def test_move_subtree_rewrites_indexes(self):
+        subtree = self.root.left_child().left_child()  # has its own children
+        target = MLMNode.objects.filter(team_size=0, path__startswith=f"{self.root.pk}/{self.root.right_child().pk}/").first()
+        subtree.move_to(target, 'R')
+        self.assertEqual((subtree.parent_id, subtree.position, subtree.depth), (target.pk, 'R', target.depth + 1))
+        self.assertIndexesConsistent()
+
+    def test_side_swap_under_same_parent(self):
+        from django.db.models import Count
+        parent = MLMNode.objects.annotate(n=Count('children')).get(n=1)
+        child = parent.children.get()
+        self.assertEqual(child.position, 'L')
+        version = parent.subtree_version
+        child.move_to(parent, 'R')
+        parent.refresh_from_db()
+        self.assertEqual((child.parent_id, child.position), (parent.pk, 'R'))
+        self.assertEqual((parent.left_count, parent.right_count), (0, 1))
+        self.assertEqual(MLMClosure.objects.get(ancestor=parent, descendant=child).leg, 'R')
+        self.assertGreater(parent.subtree_version, version)
+        self.assertIndexesConsistent()
+        # an edit of just the position (as the admin form does) is a relink as well
+        child.position = 'L'
+        child.save()
+        self.assertIndexesConsistent()
+
+    def test_move_validates_slot_and_cycles(self):
+        from django.core.exceptions import ValidationError
+        left = self.root.left_child()
+        with self.assertRaises(ValidationError):
+            left.move_to(self.root.right_child(), 'L')  # occupied
+        with self.assertRaises(ValidationError):
+            left.move_to(left.left_child().left_child())  # own downline
+        self.assertIndexesConsistent()
+
+    def test_admin_move_api(self):
+        from django.urls import reverse
+        admin = User.objects.create_user(username='mv-admin', password='pass', is_staff=True)
+        self.client.force_login(admin)
+        node = MLMNode.objects.filter(team_size=0).order_by('pk').first()
+        target = MLMNode.objects.filter(team_size=0).order_by('-pk').first()
+        resp = self.client.post(reverse('mlm:api_move_node'), {'node': node.pk, 'parent': target.pk, 'position': 'L'},
+                                content_type='application/json')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()['node']['parent'], target.pk)
+        self.assertIndexesConsistent()
+        for payload in ({'node': 'abc', 'parent': target.pk}, {'node': node.pk}):
+            resp = self.client.post(reverse('mlm:api_move_node'), payload, content_type='application/json')
+            self.assertEqual(resp.status_code, 400)
+
+
+class MLMIntegrityTests(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create_user(username=f'iv{i}', password='pass') for i in range(10)]
+        self.root = MLMNode.objects.get(user=self.users[0])
+
+    def _verify(self, numpy):
+        from unittest import mock
+        from mlm import integrity
+        with mock.patch('mlm.integrity.np', integrity.np if numpy else None):
+            return integrity.verify_tree(chunk_size=3)
+
+    def test_clean_tree(self):
+        from mlm.integrity import PROBLEMS
+        for numpy in (True, False):
+            report = self._verify(numpy)
+            self.assertEqual((report['nodes'], report['roots']), (10, 1))
+            self.assertEqual([name for name in PROBLEMS if report[name]['count']], [])
+
+    def test_detects_cycles_and_over_full_parents(self):
+        # bypass save(): a <-> b loop (a keeps its own child below it), plus a third child under the root
+        a = self.root.left_child().right_child()  # has one (left) child
+        b = self.root.right_child().right_child()  # leaf
+        below = a.left_child()
+        MLMNode.objects.filter(pk=a.pk).update(parent=b, position='L')
+        MLMNode.objects.filter(pk=b.pk).update(parent=a, position='R')
+        stray = self.root.right_child().left_child()
+        MLMNode.objects.filter(pk=stray.pk).update(parent=self.root, position=None)
+        for numpy in (True, False):
+            report = self._verify(numpy)
+            self.assertEqual(sorted(report['cycles']['ids']), sorted([a.pk, b.pk]))
+            self.assertEqual(report['below_cycle']['ids'], [below.pk])
+            self.assertEqual(report['over_full']['ids'], [self.root.pk])
+            self.assertEqual(report['missing_position']['ids'], [stray.pk])
+            self.assertEqual(report['orphaned']['count'], 0)
+
+    def test_dangling_parents_and_duplicate_slots(self):
+        from unittest import mock
+        from mlm import integrity
+        # rows the DB constraints would reject: parent 99 doesn't exist, two nodes in 1's left slot
+        rows = [(1, None, None), (2, 1, 'L'), (3, 1, 'L'), (4, 99, 'R'), (5, 4, 'L'), (6, 5, 'R')]
+        for numpy in (integrity.np, None):
+            with mock.patch('mlm.integrity.np', numpy):
+                report = integrity.verify_rows(iter(rows))
+            self.assertEqual(report['dangling_parent']['ids'], [4])
+            self.assertEqual(report['orphaned']['ids'], [5, 6])
+            self.assertEqual(report['duplicate_positions']['ids'], [1])
+            self.assertEqual(report['over_full']['count'], 0)
+
+    def test_command_fails_on_problems(self):
+        from django.core.management import call_command, CommandError
+        from io import StringIO
+        call_command('verify_mlm_tree', stdout=StringIO())
+        MLMNode.objects.filter(pk=self.root.pk).update(parent=self.root.left_child())
+        with self.assertRaises(CommandError):
+            call_command('verify_mlm_tree', stdout=StringIO())
+
+
+class MLMAsyncPlacementTests(TestCase):
+    def setUp(self):
+        self.root_user = User.objects.create_user(username='ap-root', password='pass')
+        self.root = MLMNode.objects.get(user=self.root_user)
+
+    def _signup(self, username, ref=None):
+        from unittest import mock
+        with mock.patch('mlm.signals.ASYNC_PLACEMENT', True), \
+                mock.patch('mlm.signals._kick_placement_worker') as kick:
+            with self.captureOnCommitCallbacks(execute=True):
+                user = User(username=username)
+                if ref:
+                    user._mlm_referral_code = ref
+                user.save()
+        self.assertTrue(kick.called)
+        return user
+
+    def test_signup_only_queues_and_drain_places_in_arrival_order(self):
+        from mlm.models import PlacementJob
+        from mlm.services import drain_placement_queue
+        users = [self._signup(f'ap{i}', ref=self.root_user.referral_code if i % 2 else None) for i in range(6)]
+        self.assertFalse(MLMNode.objects.filter(user__in=users, parent__isnull=False).exists())
+        self.assertEqual(PlacementJob.objects.filter(status=PlacementJob.STATUS_PENDING).count(), 6)
+
+        stats = drain_placement_queue(batch_size=4)
+        self.assertEqual(stats, {'placed': 6, 'failed': 0, 'batches': 2})
+        placed = [MLMNode.objects.get(user=u) for u in users]
+        # same BFS slots as synchronous signups in that order
+        self.assertEqual([(n.parent.user.username, n.position) for n in placed[:3]],
+                         [('ap-root', 'L'), ('ap-root', 'R'), ('ap0', 'L')])
+        self.assertFalse(PlacementJob.objects.exclude(status=PlacementJob.STATUS_PLACED).exists())
+
+    def test_non_bfs_sponsor_strategy_is_honoured(self):
+        from mlm.services import drain_placement_queue
+        MLMNode.objects.filter(pk=self.root.pk).update(placement_strategy='extreme_right')
+        users = [self._signup(f'apr{i}', ref=self.root_user.referral_code) for i in range(3)]
+        drain_placement_queue()
+        self.assertEqual([MLMNode.objects.get(user=u).position for u in users], ['R', 'R', 'R'])
+
+    def test_status_endpoint_polls_by_session(self):
+        from django.urls import reverse
+        from mlm.services import drain_placement_queue
+        from mlm.views import PLACEMENT_SESSION_KEY
+        user = self._signup('ap-poll')
+        session = self.client.session
+        session[PLACEMENT_SESSION_KEY] = str(user._mlm_placement_job.token)
+        session.save()
+        url = reverse('mlm:api_placement_status')
+        self.assertEqual(self.client.get(url).json()['status'], 'pending')
+        drain_placement_queue()
+        data = self.client.get(url).json()
+        self.assertEqual((data['status'], data['position']), ('placed', 'L'))
+
+
+class MLMDownlineSearchTests(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create_user(username=f's{i}', email=f's{i}@example.com', password='pass')
+                      for i in range(15)]
+        self.nodes = {u.username: MLMNode.objects.get(user=u) for u in self.users}
+        self.client.force_login(self.users[1])
+
+    def _search(self, **params):
+        from django.urls import reverse
+        return self.client.get(reverse('mlm:api_downline_search'), params)
+
+    def test_search_is_limited_to_callers_downline(self):
+        resp = self._search(q='s1')
+        self.assertEqual(resp.status_code, 200)
+        # s11..s14 sit under s2, and the caller itself is not part of its downline
+        self.assertEqual([r['user'] for r in resp.data['results']], ['s10'])
+        match = resp.data['results'][0]
+        self.assertEqual(match['depth'], 2)
+        self.assertEqual([step['id'] for step in match['path']], [self.nodes['s4'].pk, self.nodes['s10'].pk])
+
+    def test_search_by_email_and_staff_scope(self):
+        resp = self._search(q='S9@example.com')
+        self.assertEqual([r['user'] for r in resp.data['results']], ['s9'])
+        self.assertFalse(self._search(q='s12@example.com').data['results'])
+        staff = User.objects.create_user(username='ops', password='pass', is_staff=True)
+        self.client.force_login(staff)
+        resp = self._search(q='s12@example.com', node=self.nodes['s0'].pk)
+        self.assertEqual([step['user'] for step in resp.data['results'][0]['path']], ['s2', 's5', 's12'])
+        self.assertEqual(self._search(q='s').status_code, 400)
+        self.assertEqual(self._search(q='s12', node='abc').status_code, 400)
+
+    def test_search_queries_do_not_grow_with_matches(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        self.client.force_login(self.users[0])
+        with CaptureQueriesContext(connection) as one:
+            self.assertEqual(len(self._search(q='s10').data['results']), 1)
+        with CaptureQueriesContext(connection) as many:
+            self.assertEqual(len(self._search(q='s1').data['results']), 6)
+        self.assertEqual(len(one.captured_queries), len(many.captured_queries))
+
+
+class MLMLevelReportTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.users = [User.objects.create_user(username=f'r{i}', password='pass') for i in range(15)]
+        self.root = MLMNode.objects.get(user=self.users[0])
+
+    def _report(self, user, node, **params):
+        from django.urls import reverse
+        self.client.force_login(user)
+        return self.client.get(reverse('mlm:api_level_report', args=[node.pk]), params)
+
+    def test_counts_per_level(self):
+        MLMNode.objects.filter(user=self.users[3]).update(active=True)
+        resp = self._report(self.users[0], self.root)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual([(l['level'], l['total'], l['left'], l['right']) for l in resp.data['levels']],
+                         [(1, 2, 1, 1), (2, 4, 2, 2), (3, 8, 4, 4)])
+        self.assertEqual((resp.data['levels'][1]['active'], resp.data['levels'][1]['inactive']), (1, 3))
+        self.assertEqual(len(self._report(self.users[0], self.root, depth=2).data['levels']), 2)
+        self.assertEqual(self._report(self.users[0], self.root, depth=0).data['levels'], [])
+        self.assertEqual(self._report(self.users[0], self.root, depth=-1).status_code, 400)
+
+    def test_report_is_cached_per_subtree_version(self):
+        from mlm.services import level_report
+        root = MLMNode.objects.get(pk=self.root.pk)
+        with self.assertNumQueries(1):
+            level_report(root)
+        with self.assertNumQueries(0):
+            level_report(root)
+        leaf = MLMNode.objects.get(user=self.users[14])
+        leaf.active = True
+        leaf.save()
+        root.refresh_from_db()
+        with self.assertNumQueries(1):
+            self.assertEqual(level_report(root)[2]['active'], 1)
+
+    def test_members_only_see_their_downline(self):
+        left = MLMNode.objects.get(user=self.users[1])
+        self.assertEqual(self._report(self.users[2], left).status_code, 403)
+        self.assertEqual(self._report(self.users[0], left).status_code, 200)
+        self.assertEqual(self._report(self.users[1], left).status_code, 200)
+
+
+class MLMRankEngineTests(TestCase):
+    RULES = [
+        {'name': 'bronze', 'personal_volume': 100},
+        {'name': 'silver', 'team_volume': 100, 'active_legs': 2},
+        {'name': 'gold', 'leg_rank': 'bronze'},
+    ]
+
+    def setUp(self):
+        self.users = [User.objects.create_user(username=f'k{i}', password='pass') for i in range(7)]
+        self.nodes = [MLMNode.objects.get(user=u) for u in self.users]
+        MLMNode.add_sale_volume(self.nodes[3].pk, 100)
+        MLMNode.add_sale_volume(self.nodes[5].pk, 150)
+        MLMNode.objects.filter(pk__in=[self.nodes[3].pk, self.nodes[4].pk]).update(active=True)
+
+    def _check_ranks(self):
+        from .ranks import run_rank_engine
+        stats = run_rank_engine(rules=self.RULES)
+        self.assertEqual((stats['nodes'], stats['changed']), (7, 4))
+        self.assertEqual(stats['ranks'], {'bronze': 2, 'silver': 1, 'gold': 1})
+        ranks = dict(MLMNode.objects.values_list('pk', 'rank'))
+        # k1 has volume and activity in both legs; k0 has a bronze (or better) member in each leg
+        self.assertEqual([ranks[n.pk] for n in self.nodes], ['gold', 'silver', '', 'bronze', '', 'bronze', ''])
+        self.assertEqual(run_rank_engine(rules=self.RULES)['changed'], 0)
+
+    def test_rank_engine(self):
+        self._check_ranks()
+
+    def test_rank_engine_without_numpy(self):
+        from unittest import mock
+        with mock.patch('mlm.arrays.np', None), mock.patch('mlm.ranks.np', None):
+            self._check_ranks()
+
+    def test_rules_are_validated(self):
+        from .ranks import compile_rules
+        with self.assertRaises(ValueError):
+            compile_rules([{'name': 'gold', 'leg_rank': 'silver'}, {'name': 'silver'}])
+        with self.assertRaises(ValueError):
+            compile_rules([{'name': 'gold', 'sales': 5}])
+
+
+class MLMTreeDumpTests(TestCase):
+    FIELDS = ('id', 'parent_id', 'user_id', 'position', 'active', 'path', 'depth',
+              'team_size', 'active_members', 'left_count', 'right_count', 'max_depth')
+
+    def setUp(self):
+        import os
+        import tempfile
+        self.users = [User.objects.create_user(username=f'd{i}', password='pass') for i in range(9)]
+        for node in MLMNode.objects.filter(user__in=self.users[2:5]):
+            node.active = True
+            node.save()
+        fd, self.dump_path = tempfile.mkstemp(suffix='.mlmtree')
+        os.close(fd)
+        self.addCleanup(os.remove, self.dump_path)
+
+    def _state(self):
+        from .models import MLMClosure
+        return (list(MLMNode.objects.order_by('id').values_list(*self.FIELDS)),
+                sorted(MLMClosure.objects.values_list('ancestor_id', 'descendant_id', 'depth', 'leg', 'rank', 'open')))
+
+    def _round_trip(self):
+        from .dump import dump_tree, load_tree
+        before = self._state()
+        self.assertEqual(dump_tree(self.dump_path), 9)
+        stats = load_tree(self.dump_path, replace=True)
+        self.assertEqual(stats['nodes'], 9)
+        self.assertEqual(self._state(), before)
+
+    def test_round_trip(self):
+        import os
+        self._round_trip()
+        self.assertEqual(os.path.getsize(self.dump_path), 16 + 9 * (8 * 3 + 2))
+
+    def test_round_trip_without_numpy(self):
+        from unittest import mock
+        with mock.patch('mlm.dump.np', None):
+            self._round_trip()
+
+    def test_load_refuses_to_overwrite_or_bad_files(self):
+        from .dump import DumpError, dump_tree, load_tree
+        dump_tree(self.dump_path)
+        with self.assertRaises(DumpError):
+            load_tree(self.dump_path)
+        with open(self.dump_path, 'r+b') as fh:
+            fh.truncate(20)
+        with self.assertRaises(DumpError):
+            load_tree(self.dump_path, replace=True)
+        self.assertEqual(MLMNode.objects.count(), 9)
+
+
+class MLMActivationJobTests(TestCase):
+    def setUp(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from commissions.models import Commission
+        from referrals.models import ReferralConversion
+        self.users = [User.objects.create_user(username=f'v{i}', password='pass') for i in range(7)]
+        self.nodes = [MLMNode.objects.get(user=u) for u in self.users]
+        self.nodes[2].active = True
+        self.nodes[2].save()
+        for user in (self.users[3], self.users[5], self.users[6]):
+            Commission.objects.create(telemarketer=user, amount='5.00', source='direct_sale')
+        Commission.objects.filter(telemarketer=self.users[6]).update(created_at=timezone.now() - timedelta(days=60))
+        ReferralConversion.objects.create(referrer=self.users[1], amount='20.00')
+
+    def test_flips_active_and_keeps_stats(self):
+        from .activation import refresh_activation
+        from .models import MLMTreeVersion
+        from .services import rebuild_subtree_stats
+        before = (MLMTreeVersion.current(), MLMNode.objects.get(pk=self.nodes[0].pk).subtree_version)
+        stats = refresh_activation(days=30)
+        self.assertEqual((stats['qualified'], stats['activated'], stats['deactivated']), (3, 3, 1))
+        active = set(MLMNode.objects.filter(active=True).values_list('user__username', flat=True))
+        self.assertEqual(active, {'v1', 'v3', 'v5'})
+        root = MLMNode.objects.get(pk=self.nodes[0].pk)
+        self.assertEqual(root.active_members, 3)
+        self.assertEqual(rebuild_subtree_stats(), 0)  # nothing drifted
+        self.assertNotEqual((MLMTreeVersion.current(), root.subtree_version), before)
+
+        stats = refresh_activation(days=30)
+        self.assertEqual((stats['activated'], stats['deactivated']), (0, 0))
+
+    def test_flips_are_chunked_by_batch_size(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .activation import refresh_activation
+        from .services import rebuild_subtree_stats
+        with CaptureQueriesContext(connection) as queries:
+            refresh_activation(days=30, batch_size=2)
+        flips = [q for q in queries.captured_queries if q['sql'].startswith('UPDATE "mlm_mlmnode" SET "active"')]
+        self.assertEqual(len(flips), 3)  # 3 activated in chunks of 2, 1 deactivated
+        active = set(MLMNode.objects.filter(active=True).values_list('user__username', flat=True))
+        self.assertEqual(active, {'v1', 'v3', 'v5'})
+        self.assertEqual(rebuild_subtree_stats(), 0)
+
+    def test_min_volume_and_dry_run(self):
+        from .activation import refresh_activation
+        stats = refresh_activation(days=30, min_volume='10', dry_run=True)
+        self.assertEqual((stats['qualified'], stats['activated'], stats['deactivated']), (1, 1, 1))
+        self.assertEqual(list(MLMNode.objects.filter(active=True).values_list('pk', flat=True)), [self.nodes[2].pk])
+
+
+class MLMTreeLayoutTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.users = [User.objects.create_user(username=f'y{i}', password='pass') for i in range(15)]
+        self.nodes = {u.username: MLMNode.objects.get(user=u) for u in self.users}
+        self.root = self.nodes['y0']
+        self.client.force_login(User.objects.create_user(username='staff', password='pass', is_staff=True))
+
+    def _layout(self, **params):
+        from django.urls import reverse
+        resp = self.client.get(reverse('mlm:api_tree_layout', args=[self.root.pk]), params)
+        self.assertEqual(resp.status_code, 200)
+        names = {node.pk: name for name, node in self.nodes.items()}
+        return {names.get(n['id'], 'staff'): n for n in resp.data['nodes']}
+
+    def _check_layout(self):
+        nodes = self._layout(depth=2)
+        self.assertEqual(len(nodes), 7)
+        self.assertEqual([nodes[name]['x'] for name in ('y3', 'y4', 'y5', 'y6')], [0, 1, 2, 3])
+        self.assertEqual((nodes['y1']['x'], nodes['y2']['x'], nodes['y0']['x']), (0.5, 2.5, 1.5))
+        self.assertEqual([nodes[name]['y'] for name in ('y0', 'y1', 'y3')], [0, 1, 2])
+        self.assertTrue(nodes['y3']['collapsed'])
+        self.assertFalse(nodes['y1']['collapsed'])
+
+        nodes = self._layout(depth=2, expand=self.nodes['y3'].pk)
+        self.assertEqual(len(nodes), 10)  # y7, y8 and the staff member placed below y7
+        self.assertFalse(nodes['y3']['collapsed'])
+        self.assertEqual((nodes['y7']['y'], nodes['y7']['parent']), (3, self.nodes['y3'].pk))
+
+    def test_layout_from_snapshot(self):
+        self._check_layout()
+
+    def test_layout_from_queries(self):
+        from unittest import mock
+        with mock.patch('mlm.layout.get_snapshot', return_value=None):
+            self._check_layout()
+
+    def test_layout_cached_per_subtree_version(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        self._layout(depth=3)
+        with CaptureQueriesContext(connection) as cached:
+            self._layout(depth=3)
+        self.assertEqual(len([q for q in cached.captured_queries if 'mlm_' in q['sql']]), 1)
+        leaf = self.nodes['y14']
+        leaf.active = True
+        leaf.save()
+        self.assertTrue(self._layout(depth=3)['y14']['active'])
+
+    def test_layout_is_admin_only(self):
+        from django.urls import reverse
+        self.client.force_login(self.users[0])
+        resp = self.client.get(reverse('mlm:api_tree_layout', args=[self.root.pk]))
+        self.assertEqual(resp.status_code, 403)
+
+
+class MLMLegVolumeTests(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create_user(username=f'v{i}', password='pass') for i in range(7)]
+        self.root = MLMNode.objects.get(user=self.users[0])
+
+    def test_sale_updates_upline_legs_in_two_queries(self):
+        from decimal import Decimal
+        left = self.root.left_child()
+        seller = left.right_child()
+        with self.assertNumQueries(2):
+            MLMNode.add_sale_volume(seller.pk, '25.50')
+        seller.refresh_from_db()
+        left.refresh_from_db()
+        self.root.refresh_from_db()
+        self.assertEqual(seller.personal_volume, Decimal('25.50'))
+        self.assertEqual((left.left_volume, left.right_volume), (Decimal('0.00'), Decimal('25.50')))
+        self.assertEqual((self.root.left_volume, self.root.right_volume), (Decimal('25.50'), Decimal('0.00')))
+        self.assertEqual(self.root.right_child().left_volume, Decimal('0.00'))
+
+    def test_record_sale_feeds_leg_volume(self):
+        from decimal import Decimal
+        from commissions.services import create_commissions_for_sale
+        seller = self.root.right_child()
+        create_commissions_for_sale(Decimal('40.00'), seller.user, sale_reference='VOL-1')
+        self.root.refresh_from_db()
+        self.assertEqual(self.root.right_volume, Decimal('40.00'))
+
+
+class MLMBinaryPairingTests(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create_user(username=f'b{i}', password='pass') for i in range(7)]
+        self.root = MLMNode.objects.get(user=self.users[0])
+        self.left, self.right = self.root.left_child(), self.root.right_child()
+        MLMNode.add_sale_volume(self.left.pk, 100)
+        MLMNode.add_sale_volume(self.left.left_child().pk, 50)
+        MLMNode.add_sale_volume(self.right.right_child().pk, 80)
+
+    def _run(self, **kwargs):
+        from .pairing import run_binary_cycle
+        return run_binary_cycle(rate='0.10', **kwargs)
+
+    def _check_cycle(self):
+        from decimal import Decimal
+        from commissions.models import Commission
+        stats = self._run(label='W1')
+        self.assertEqual(stats['paired_nodes'], 1)
+        comm = Commission.objects.get(sale_reference='binary-cycle:W1')
+        self.assertEqual((comm.telemarketer_id, comm.amount), (self.root.user_id, Decimal('8.00')))
+        self.root.refresh_from_db()
+        self.assertEqual((self.root.carry_left, self.root.carry_right), (Decimal('70.00'), Decimal('0.00')))
+
+        # carry-forward: the next cycle only pays newly matched volume
+        MLMNode.add_sale_volume(self.right.pk, 100)
+        self._run(label='W2')
+        comm = Commission.objects.get(sale_reference='binary-cycle:W2')
+        self.assertEqual(comm.amount, Decimal('7.00'))
+        self.assertTrue(self._run(label='W2')['already_run'])
+
+    def test_pairing_cycle(self):
+        self._check_cycle()
+
+    def test_pairing_cycle_without_numpy(self):
+        from unittest import mock
+        with mock.patch('mlm.arrays.np', None), mock.patch('mlm.pairing.np', None):
+            self._check_cycle()
+
+    def test_cap_flushes_excess(self):
+        from decimal import Decimal
+        from commissions.models import Commission
+        self._run(label='CAP', cap='50')
+        self.assertEqual(Commission.objects.get(sale_reference='binary-cycle:CAP').amount, Decimal('5.00'))
+        self.root.refresh_from_db()
+        self.assertEqual(self.root.paired_volume, Decimal('80.00'))
@@ -6,6 +6,13 @@ app_name = 'mlm'
 urlpatterns = [
     path('network/', views.user_network_view, name='user_network'),
     path('api/node/<int:node_id>/', views.api_node_detail, name='api_node_detail'),
+    path('api/node/<int:node_id>/levels/', views.api_level_report, name='api_level_report'),
+    path('api/nodes/', views.api_node_batch, name='api_node_batch'),
+    path('api/downline/search/', views.api_downline_search, name='api_downline_search'),
     path('api/subtree/<int:node_id>/', views.api_subtree, name='api_subtree'),
+    path('api/placement-status/', views.api_placement_status, name='api_placement_status'),
+    path('api/admin/layout/<int:node_id>/', views.api_tree_layout, name='api_tree_layout'),
     path('api/admin/place/', views.api_force_place, name='api_force_place'),
+    path('api/admin/move/', views.api_move_node, name='api_move_node'),
+    path('api/admin/bulk-place/', views.api_bulk_place, name='api_bulk_place'),
 ]
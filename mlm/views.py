@@ -5,11 +5,25 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
 from rest_framework import status
-from .models import MLMNode
+from .models import MLMNode, MLMClosure, PlacementJob, PATH_SEP
 from .serializers import MLMNodeSerializer
-from django.views.decorators.http import require_POST
+from .layout import tree_layout
+from .services import bulk_place, level_report
+from .snapshot import get_snapshot
+from django.views.decorators.http import condition, require_POST
 from django.db import transaction
+from django.core.exceptions import ValidationError
+from django.http import Http404, StreamingHttpResponse
 from rest_framework.permissions import AllowAny
+import json
+
+# session key under which the signup view stores the PlacementJob token (async placement)
+PLACEMENT_SESSION_KEY = 'mlm_placement_token'
+SUBTREE_MAX_DEPTH = getattr(settings, 'MLM_SUBTREE_MAX_DEPTH', 10)
+SUBTREE_MAX_NODES = getattr(settings, 'MLM_SUBTREE_MAX_NODES', 2000)
+NODE_BATCH_MAX = getattr(settings, 'MLM_NODE_BATCH_MAX', 200)
+SEARCH_LIMIT = getattr(settings, 'MLM_SEARCH_LIMIT', 20)
+LAYOUT_MAX_EXPAND = getattr(settings, 'MLM_LAYOUT_MAX_EXPAND', 50)
 
 @login_required
 def user_network_view(request):
@@ -22,35 +36,249 @@ def user_network_view(request):
         node = None
     return render(request, 'mlm/user_network.html', {'node': node})
 
+def _subtree_stamp(request, node_id):
+    """(subtree_version, subtree_changed_at) of node_id, read once per request; None for unknown nodes."""
+    if not hasattr(request, '_mlm_subtree_stamp'):
+        request._mlm_subtree_stamp = (MLMNode.objects.filter(pk=node_id)
+                                      .values_list('subtree_version', 'subtree_changed_at').first())
+    return request._mlm_subtree_stamp
+
+
+def _node_etag(request, node_id):
+    stamp = _subtree_stamp(request, node_id)
+    return stamp and f"node-{node_id}-{stamp[0]}"
+
+
+def _subtree_etag(request, node_id):
+    stamp = _subtree_stamp(request, node_id)
+    return stamp and f"subtree-{node_id}-{stamp[0]}-{request.GET.get('depth', '')}"
+
+
+def _layout_etag(request, node_id):
+    stamp = _subtree_stamp(request, node_id)
+    return stamp and f"layout-{node_id}-{stamp[0]}-{request.GET.get('depth', '')}-{request.GET.get('expand', '')}"
+
+
+def _subtree_last_modified(request, node_id):
+    stamp = _subtree_stamp(request, node_id)
+    return stamp and stamp[1]
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@condition(etag_func=_node_etag, last_modified_func=_subtree_last_modified)
 def api_node_detail(request, node_id):
-    node = get_object_or_404(MLMNode, pk=node_id)
-    serializer = MLMNodeSerializer(node)
+    snapshot = get_snapshot()
+    if snapshot is None:
+        node = get_object_or_404(MLMNodeSerializer.prefetch(MLMNode.objects.all()), pk=node_id)
+        return Response(MLMNodeSerializer(node).data)
+    node = get_object_or_404(MLMNode.objects.select_related('user'), pk=node_id)
+    children = [snapshot.child(node.pk, position) for position in ('L', 'R')]
+    context = {'snapshot': snapshot, 'users': _usernames(c['user_id'] for c in children if c)}
+    serializer = MLMNodeSerializer(node, context=context)
     return Response(serializer.data)
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def api_node_batch(request):
+    """
+    Node details for many nodes at once: ?ids=1,2,3 (at most MLM_NODE_BATCH_MAX).
+    Nodes, children and their users are loaded in three queries whatever the batch size;
+    ids that don't exist are listed under "missing".
+    """
+    try:
+        ids = list(dict.fromkeys(int(part) for part in request.GET.get('ids', '').split(',') if part.strip()))
+    except ValueError:
+        return Response({'detail': 'ids must be a comma separated list of integers'}, status=status.HTTP_400_BAD_REQUEST)
+    if not ids:
+        return Response({'detail': 'ids is required'}, status=status.HTTP_400_BAD_REQUEST)
+    if len(ids) > NODE_BATCH_MAX:
+        return Response({'detail': f'at most {NODE_BATCH_MAX} ids per request'}, status=status.HTTP_400_BAD_REQUEST)
+    nodes = MLMNodeSerializer.prefetch(MLMNode.objects.filter(pk__in=ids)).in_bulk()
+    return Response({
+        'nodes': MLMNodeSerializer([nodes[pk] for pk in ids if pk in nodes], many=True).data,
+        'missing': [pk for pk in ids if pk not in nodes],
+    })
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 # @permission_classes([AllowAny])
+@condition(etag_func=_subtree_etag, last_modified_func=_subtree_last_modified)
 def api_subtree(request, node_id):
+    """
+    Subtree below node_id up to ?depth= levels (default 4, capped at MLM_SUBTREE_MAX_DEPTH), BFS order.
+    ETag / Last-Modified come from the node's subtree_version, so an unchanged subtree answers 304
+    after a single primary-key lookup.
+    Read from the process-local tree snapshot (one query for the usernames), or with one
+    indexed query on the lineage path when MLM_TREE_SNAPSHOT is off. Capped at
+    MLM_SUBTREE_MAX_NODES nodes ("truncated": true when the cap was hit) and streamed out as JSON.
+    """
+    try:
+        max_depth = int(request.GET.get('depth', 4))
+    except (TypeError, ValueError):
+        max_depth = 4
+    max_depth = max(0, min(max_depth, SUBTREE_MAX_DEPTH))
+    snapshot = get_snapshot()
+    if snapshot is not None:
+        entries = snapshot.subtree(node_id, max_depth, max_nodes=SUBTREE_MAX_NODES + 1)
+        if not entries:
+            raise Http404('No MLMNode matches the given query.')
+        truncated = len(entries) > SUBTREE_MAX_NODES
+        entries = entries[:SUBTREE_MAX_NODES]
+        users = _usernames(entry['user_id'] for entry in entries)
+
+        def stream_snapshot():
+            yield '{"nodes": ['
+            for i, entry in enumerate(entries):
+                entry['user'] = users[entry.pop('user_id')]
+                yield (', ' if i else '') + json.dumps(entry)
+            yield '], "truncated": %s}' % json.dumps(truncated)
+
+        return StreamingHttpResponse(stream_snapshot(), content_type='application/json')
+
+    node = get_object_or_404(MLMNode.objects.select_related('user'), pk=node_id)
+    descendants = (node.descendants(max_depth).select_related('user')
+                   .order_by('depth', 'path', 'position')[:SUBTREE_MAX_NODES])
+
+    def stream():
+        yield '{"nodes": ['
+        yield json.dumps(_subtree_entry(node))
+        sent = 1
+        truncated = False
+        for cur in descendants.iterator(chunk_size=500):
+            if sent >= SUBTREE_MAX_NODES:
+                truncated = True
+                break
+            yield ', ' + json.dumps(_subtree_entry(cur))
+            sent += 1
+        yield '], "truncated": %s}' % json.dumps(truncated)
+
+    return StreamingHttpResponse(stream(), content_type='application/json')
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+@condition(etag_func=_layout_etag, last_modified_func=_subtree_last_modified)
+def api_tree_layout(request, node_id):
+    """
+    Precomputed coordinates for the admin tree (see mlm.layout): ?depth= levels below node_id
+    (default 4, capped at MLM_SUBTREE_MAX_DEPTH), plus ?expand=id,id,... collapsed nodes opened
+    by the viewer. Cached and ETagged on the node's subtree_version.
+    """
+    try:
+        max_depth = int(request.GET.get('depth', 4))
+        expand = [int(part) for part in request.GET.get('expand', '').split(',') if part.strip()]
+    except ValueError:
+        return Response({'detail': 'depth and expand must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+    if len(expand) > LAYOUT_MAX_EXPAND:
+        return Response({'detail': f'at most {LAYOUT_MAX_EXPAND} expanded nodes'}, status=status.HTTP_400_BAD_REQUEST)
+    max_depth = max(0, min(max_depth, SUBTREE_MAX_DEPTH))
+    stamp = _subtree_stamp(request, node_id)
+    layout = stamp and tree_layout(node_id, stamp[0], max_depth, expand, max_nodes=SUBTREE_MAX_NODES)
+    if not layout:
+        raise Http404('No MLMNode matches the given query.')
+    return Response(layout)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def api_downline_search(request):
+    """
+    Find members in the caller's downline (staff: below ?node=) by ?q= username prefix, or exact
+    email when q contains '@'. The user index finds the candidates and the closure table's unique
+    (ancestor, descendant) index confirms they're below the caller, so the cost doesn't depend on
+    the downline size. Each match comes with its path from the caller, resolved in one more query.
+    """
+    q = request.GET.get('q', '').strip()
+    if len(q) < 2:
+        return Response({'detail': 'q must be at least 2 characters'}, status=status.HTTP_400_BAD_REQUEST)
+    if request.user.is_staff and request.GET.get('node'):
+        try:
+            node_id = int(request.GET['node'])
+        except ValueError:
+            return Response({'detail': 'node must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        root = get_object_or_404(MLMNode, pk=node_id)
+    else:
+        root = get_object_or_404(MLMNode, user=request.user)
+    lookup = {'descendant__user__email__iexact': q} if '@' in q else {'descendant__user__username__istartswith': q}
+    links = list(MLMClosure.objects.filter(ancestor=root, depth__gt=0, **lookup)
+                 .select_related('descendant')[:SEARCH_LIMIT + 1])
+    truncated = len(links) > SEARCH_LIMIT
+    links = sorted(links[:SEARCH_LIMIT], key=lambda link: (link.depth, link.descendant_id))
+
+    prefix = root.lineage_prefix()
+    routes = {link.descendant_id: [int(pk) for pk in link.descendant.path[len(prefix):].split(PATH_SEP) if pk]
+              + [link.descendant_id] for link in links}
+    steps = {pk: (username, position) for pk, username, position in MLMNode.objects.filter(
+        pk__in={pk for route in routes.values() for pk in route}).values_list('pk', 'user__username', 'position')}
+    return Response({
+        'results': [{
+            'id': link.descendant_id,
+            'user': steps[link.descendant_id][0],
+            'active': link.descendant.active,
+            'depth': link.depth,
+            'leg': link.leg,
+            'path': [{'id': pk, 'user': steps[pk][0], 'position': steps[pk][1]} for pk in routes[link.descendant_id]],
+        } for link in links],
+        'truncated': truncated,
+    })
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def api_level_report(request, node_id):
+    """
+    Members per level below node_id (active/inactive, left/right leg), up to ?depth= levels
+    (default: the whole downline). Members may only report on their own downline.
+    """
     node = get_object_or_404(MLMNode, pk=node_id)
-    # Small BFS to gather nodes up to depth 4 (safe default)
-    max_depth = int(request.GET.get('depth', 4))
-    result = []
-    queue = [(node, 0)]
-    while queue:
-        cur, depth = queue.pop(0)
-        result.append({
-            'id': cur.id,
-            'user': str(cur.user),
-            'active': cur.active,
-            'position': cur.position,
-            'parent': cur.parent_id
-        })
-        if depth < max_depth:
-            for c in cur.get_children():
-                queue.append((c, depth + 1))
-    return Response({'nodes': result})
+    if not request.user.is_staff and not MLMClosure.objects.filter(
+            ancestor__user=request.user, descendant=node).exists():
+        return Response({'detail': 'node is not in your downline'}, status=status.HTTP_403_FORBIDDEN)
+    try:
+        max_depth = int(request.GET['depth']) if request.GET.get('depth') else None
+    except ValueError:
+        return Response({'detail': 'depth must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+    if max_depth is not None and max_depth < 0:
+        return Response({'detail': 'depth must not be negative'}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({'node': node.pk, 'levels': level_report(node, max_depth)})
+
+
+def _usernames(user_ids):
+    from django.contrib.auth import get_user_model
+    return {pk: str(user) for pk, user in get_user_model().objects.in_bulk(list(set(user_ids))).items()}
+
+
+def _subtree_entry(cur):
+    return {
+        'id': cur.id,
+        'user': str(cur.user),
+        'active': cur.active,
+        'position': cur.position,
+        'parent': cur.parent_id
+    }
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def api_placement_status(request):
+    """
+    Placement status for the signup page to poll: the logged-in user's node, or the job queued
+    by this session's signup (MLM_ASYNC_PLACEMENT). {"status": "pending"|"placed"|"failed"|"unknown", ...}
+    """
+    jobs = PlacementJob.objects.select_related('node')
+    if request.user.is_authenticated:
+        job = jobs.filter(node__user=request.user).first()
+    else:
+        token = request.session.get(PLACEMENT_SESSION_KEY)
+        job = jobs.filter(token=token).first() if token else None
+    if job is None:
+        return Response({'status': 'unknown'})
+    return Response({
+        'status': job.status,
+        'position': job.node.position,
+        'depth': job.node.depth,
+        'processed_at': job.processed_at,
+    })
 
 @api_view(['POST'])
 @permission_classes([IsAdminUser])
@@ -74,3 +302,59 @@ def api_force_place(request):
         parent, pos = MLMNode.auto_place(node_obj, start_node=start_node)
     serializer = MLMNodeSerializer(node_obj)
     return Response({'placed': True, 'parent': getattr(parent, 'id', None), 'position': pos, 'node': serializer.data}, status=status.HTTP_201_CREATED)
+
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def api_move_node(request):
+    """
+    Admin endpoint: move a node with its whole downline under another parent.
+    Payload: { "node": <node_id>, "parent": <node_id>, "position": "L"|"R"|null }
+    """
+    try:
+        node_id, parent_id = int(request.data.get('node')), int(request.data.get('parent'))
+    except (TypeError, ValueError):
+        return Response({'detail': 'node and parent must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+    node = get_object_or_404(MLMNode, pk=node_id)
+    new_parent = get_object_or_404(MLMNode, pk=parent_id)
+    try:
+        node.move_to(new_parent, request.data.get('position'))
+    except ValidationError as e:
+        return Response({'detail': e.messages}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({'moved': True, 'node': MLMNodeSerializer(node).data})
+
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def api_bulk_place(request):
+    """
+    Admin endpoint: mass enrollment. Places all members in one transaction against one tree snapshot
+    (breadth-first only: 400 if a member's sponsor uses another placement strategy).
+    Payload: { "members": [{"user_id": <id>, "sponsor_code": <referral_code|null>}, ...], "batch_size": <int, optional> }
+    """
+    members = request.data.get('members')
+    if not isinstance(members, list) or not members:
+        return Response({'detail': 'members must be a non-empty list'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        pairs = [(int(m['user_id']), m.get('sponsor_code')) for m in members]
+        batch_size = int(request.data.get('batch_size', 1000))
+    except (KeyError, TypeError, ValueError, AttributeError):
+        return Response({'detail': 'each member needs an integer user_id'}, status=status.HTTP_400_BAD_REQUEST)
+    from django.contrib.auth import get_user_model
+    User = get_user_model()
+    known = set(User.objects.filter(pk__in=[user_id for user_id, _ in pairs]).values_list('pk', flat=True))
+    unknown = sorted({user_id for user_id, _ in pairs} - known)
+    if unknown:
+        return Response({'detail': 'unknown user ids', 'user_ids': unknown}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        result = bulk_place(pairs, batch_size=batch_size)
+    except ValidationError as e:
+        return Response({'detail': e.messages}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({
+        'placed': len(result['placed']),
+        'created': result['created'],
+        'skipped': result['skipped'],
+        'placements': [
+            {'user_id': user_id, 'node': node_id, 'parent': parent_id, 'position': pos}
+            for user_id, node_id, parent_id, pos in result['placed']
+        ],
+    }, status=status.HTTP_201_CREATED)
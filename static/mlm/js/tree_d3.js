@@ -2,7 +2,8 @@
 // Resilient D3 v7 tree renderer with nodeSize spacing + dynamic viewBox + zoom + resize
 // Place this file at: static/mlm/js/tree_d3.js
 // Requires:
-//  - window.MLM_TREE_CONFIG.apiSubtreeUrlTemplate (template with {node_id})
+//  - window.MLM_TREE_CONFIG.apiSubtreeUrlTemplate (template with {node_id}), or
+//    window.MLM_TREE_CONFIG.apiLayoutUrlTemplate (admin: server-side layout with lazy expansion)
 //  - window.MLM_INIT_NODE (user view) or window.MLM_INIT_ADMIN_NODE (admin view)
 //  - d3 v7 loaded before this script runs
 
@@ -15,7 +16,9 @@
     return;
   }
 
-  if (!window.MLM_TREE_CONFIG || !window.MLM_TREE_CONFIG.apiSubtreeUrlTemplate) {
+  const USE_LAYOUT = !!(window.MLM_TREE_CONFIG && window.MLM_TREE_CONFIG.apiLayoutUrlTemplate);
+
+  if (!USE_LAYOUT && (!window.MLM_TREE_CONFIG || !window.MLM_TREE_CONFIG.apiSubtreeUrlTemplate)) {
     console.warn('MLM: window.MLM_TREE_CONFIG.apiSubtreeUrlTemplate missing. Using fallback path /mlm/api/subtree/{node_id}/');
     window.MLM_TREE_CONFIG = window.MLM_TREE_CONFIG || {};
     window.MLM_TREE_CONFIG.apiSubtreeUrlTemplate = window.location.origin + '/mlm/api/subtree/{node_id}/';
@@ -24,6 +27,16 @@
   // Keep the last fetched hierarchy so resize can re-render without refetch
   let LAST_ROOT_DATA = null;
   let LAST_START_NODE_ID = null;
+  // layout mode: last server layout, and the collapsed nodes the viewer opened
+  let LAST_LAYOUT = null;
+  const EXPANDED = new Set();
+  const LAYOUT_DEPTH = 4;
+
+  // card size must match your node visuals
+  const cardW = 180;   // card width in px
+  const cardH = 56;    // card height in px
+  const hGap = 56;     // horizontal gap between centers (tweak to taste)
+  const vGap = 96;     // vertical gap between levels
 
   // ---- Utilities ----
   // static/mlm/js/tree_d3.js
@@ -53,6 +66,17 @@ async function fetchSubtree(nodeId, depth = 6) {
   }
 }
 
+  // one request per view: coordinates come precomputed (and cached) from the server
+  async function fetchLayout(nodeId, depth) {
+    const url = new URL(window.MLM_TREE_CONFIG.apiLayoutUrlTemplate.replace('{node_id}', nodeId), window.location.origin);
+    url.searchParams.set('depth', depth);
+    if (EXPANDED.size) url.searchParams.set('expand', Array.from(EXPANDED).join(','));
+    const resp = await fetch(url, { method: 'GET', headers: { 'Accept': 'application/json' }, credentials: 'same-origin' });
+    if (!resp.ok) {
+      throw new Error(`Failed to fetch layout: ${resp.status} ${resp.statusText}`);
+    }
+    return resp.json();
+  }
 
   function buildHierarchy(nodes, rootId) {
     const map = new Map();
@@ -112,12 +136,6 @@ async function fetchSubtree(nodeId, depth = 6) {
       return;
     }
 
-    // constants (card size must match your node visuals)
-    const cardW = 180;   // card width in px
-    const cardH = 56;    // card height in px
-    const hGap = 56;     // horizontal gap between centers (tweak to taste)
-    const vGap = 96;     // vertical gap between levels
-
     // create a d3.hierarchy
     const hierarchyRoot = d3.hierarchy(rootData, d => d.children);
 
@@ -125,9 +143,30 @@ async function fetchSubtree(nodeId, depth = 6) {
     const treeLayout = d3.tree().nodeSize([cardW + hGap, cardH + vGap]);
     treeLayout(hierarchyRoot);
 
+    drawTree(container, hierarchyRoot.descendants(), hierarchyRoot.links(), (event, d) => {
+      console.log('MLM node clicked:', d.data);
+    });
+  } // renderTreeInto
+
+  // Render a server layout (grid coordinates) into the container
+  function renderLayoutInto(container, layout, onClick) {
+    const byId = new Map();
+    const nodes = layout.nodes.map(n => {
+      const d = { x: n.x * (cardW + hGap), y: n.y * (cardH + vGap), data: n };
+      byId.set(n.id, d);
+      return d;
+    });
+    const links = nodes
+      .filter(d => d.data.parent && byId.has(d.data.parent))
+      .map(d => ({ source: byId.get(d.data.parent), target: d }));
+    drawTree(container, nodes, links, onClick);
+  } // renderLayoutInto
+
+  // Draw positioned nodes ({x, y, data}) and links ({source, target}) into the container
+  function drawTree(container, nodes, links, onClick) {
     // compute bounding box of nodes (minX,maxX,minY,maxY)
     let minX = Infinity, maxX = -Infinity, minY = Infinity, maxY = -Infinity;
-    hierarchyRoot.descendants().forEach(d => {
+    nodes.forEach(d => {
       if (d.x < minX) minX = d.x;
       if (d.x > maxX) maxX = d.x;
       if (d.y < minY) minY = d.y;
@@ -163,7 +202,7 @@ async function fetchSubtree(nodeId, depth = 6) {
 
     // links (use d3.linkVertical)
     g.selectAll('path.mlm-link')
-      .data(hierarchyRoot.links())
+      .data(links)
       .join('path')
       .attr('class', 'mlm-link')
       .attr('d', d3.linkVertical().x(d => d.x).y(d => d.y))
@@ -174,7 +213,7 @@ async function fetchSubtree(nodeId, depth = 6) {
 
     // nodes
     const nodeGroups = g.selectAll('g.mlm-node-group')
-      .data(hierarchyRoot.descendants(), d => d.data.id)
+      .data(nodes, d => d.data.id)
       .join('g')
       .attr('class', 'mlm-node-group mlm-node')
       .attr('transform', d => `translate(${d.x},${d.y})`)
@@ -189,7 +228,8 @@ async function fetchSubtree(nodeId, depth = 6) {
       .attr('height', cardH)
       .attr('rx', 10).attr('ry', 10)
       .style('fill', d => d.data.active ? 'url(#mlm-grad)' : '#f3f4f6')
-      .style('stroke', d => d.data.active ? '#0f5ec7' : '#e6eefc');
+      .style('stroke', d => d.data.active ? '#0f5ec7' : '#e6eefc')
+      .style('stroke-dasharray', d => d.data.collapsed ? '6 4' : null);
 
     // username (wrap if too long)
     nodeGroups.append('text')
@@ -216,7 +256,7 @@ async function fetchSubtree(nodeId, depth = 6) {
       .attr('class', 'mlm-node-meta')
       .attr('text-anchor', 'middle')
       .attr('dy', '16')
-      .text(d => d.data.position ? d.data.position : '')
+      .text(d => (d.data.position ? d.data.position : '') + (d.data.collapsed ? '  [+]' : ''))
       .style('fill', d => d.data.active ? 'rgba(255,255,255,0.9)' : '#6b7280');
 
     // zoom & pan
@@ -228,11 +268,9 @@ async function fetchSubtree(nodeId, depth = 6) {
 
     svg.call(zoom);
 
-    // small hover effect done via CSS; click logs node for now
-    nodeGroups.on('click', (event, d) => {
-      console.log('MLM node clicked:', d.data);
-    });
-  } // renderTreeInto
+    // small hover effect done via CSS
+    nodeGroups.on('click', onClick);
+  } // drawTree
 
   // ---- public init: fetch and render once ----
   (async function init() {
@@ -256,6 +294,30 @@ async function fetchSubtree(nodeId, depth = 6) {
       }
 
       LAST_START_NODE_ID = nodeId;
+
+      if (USE_LAYOUT) {
+        // collapsed nodes open (and opened ones close) with one more layout request
+        const toggle = async (event, d) => {
+          if (!d.data.collapsed && !EXPANDED.has(d.data.id)) return;
+          if (EXPANDED.has(d.data.id)) EXPANDED.delete(d.data.id);
+          else EXPANDED.add(d.data.id);
+          try {
+            LAST_LAYOUT = await fetchLayout(nodeId, LAYOUT_DEPTH);
+            renderLayoutInto(container, LAST_LAYOUT, toggle);
+          } catch (err) {
+            console.error('MLM: error expanding node', d.data.id, err);
+          }
+        };
+        LAST_LAYOUT = await fetchLayout(nodeId, LAYOUT_DEPTH);
+        renderLayoutInto(container, LAST_LAYOUT, toggle);
+        let layoutResizeTimeout = null;
+        window.addEventListener('resize', () => {
+          if (layoutResizeTimeout) clearTimeout(layoutResizeTimeout);
+          layoutResizeTimeout = setTimeout(() => renderLayoutInto(container, LAST_LAYOUT, toggle), 220);
+        });
+        return;
+      }
+
       console.log('MLM: fetching subtree for node', nodeId);
       const payload = await fetchSubtree(nodeId, 6);
       if (!payload || !payload.nodes) {
@@ -23,6 +23,10 @@ class User(AbstractUser):
     verification_token = models.CharField(max_length=64, blank=True, null=True, db_index=True)
     verification_sent_at = models.DateTimeField(blank=True, null=True)
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            models.Index(fields=['email']),  # MLM downline search by email
+        ]
 
     def save(self, *args, **kwargs):
         if not self.referral_code:
@@ -7,6 +7,7 @@ from .models import User
 import uuid
 from django.utils import timezone
 from django.urls import reverse
+from mlm.views import PLACEMENT_SESSION_KEY
 
 
 # def register(request):
@@ -61,6 +62,11 @@ def register(request):
             user.verification_sent_at = timezone.now()
             user.save()
 
+            # asynchronous MLM placement: let the next pages poll mlm:api_placement_status
+            placement_job = getattr(user, '_mlm_placement_job', None)
+            if placement_job is not None:
+                request.session[PLACEMENT_SESSION_KEY] = str(placement_job.token)
+
             # build absolute verification URL
             verify_url = request.build_absolute_uri(
                 reverse('users:verify', args=[verification_token])